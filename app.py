@@ -1,13 +1,33 @@
 # app.py
 
+import io
+import uuid
+
 import streamlit as st
 from pantry_logic import (
     update_item_status,
     check_item_status,
     start_donation,
     confirm_donation,
-    ask_policy,
+    ask_substitution,
+    prefetch_substitution,
+    model_status,
+    inventory_snapshot,
+    inventory_changes_since,
+    allocate_items,
+    restock_item,
+    set_item_count,
+    inventory_analytics,
+    import_manifest,
+    export_inventory,
+    set_desk,
+)
+from pantry_catalog import (
+    CATALOG_ITEMS, ITEM_OPTIONS, ITEM_TO_GROUP, ambiguous_items, resolve_item, suggest_items,
 )
+from pantry_inventory import LOW_STOCK_AT, InsufficientStockError
+from pantry_manifest import detect_format
+from pantry_sites import UnknownSiteError, set_site, site_name
 
 # ----------------------------------------------------------------------
 # Page config
@@ -19,158 +39,9 @@ st.set_page_config(
 )
 
 # --------------------------------------------------------------------
-# Pantry item catalog: categories & items as used at your real pantry
+# Pantry item catalog & status labels
 # --------------------------------------------------------------------
 
-ITEM_OPTIONS = [
-    # Canned Vegetables
-    "Green Beans",
-    "Corn",
-    "Green Peas",
-    "Canned Tomatoes",
-    "Carrots (Canned)",
-    "Mixed Vegetables",
-    "Spinach (Canned)",
-    "Potatoes (Canned)",
-    "Beets",
-    "Pumpkin Puree",
-
-    # Canned Fruit
-    "Peaches",
-    "Pears",
-    "Pineapple",
-    "Fruit Cocktail",
-    "Mandarin Oranges",
-    "Applesauce",
-    "Apricots",
-    "Mango",
-
-    # Grain
-    "Rice",
-    "Pasta",
-    "Oats",
-    "Cereal",
-    "Quinoa",
-    "Flour",
-    "Cornmeal",
-    "Barley",
-    "Couscous",
-    "Crackers",
-
-    # Protein
-    "Tuna",
-    "Salmon",
-    "Canned Chicken",
-    "Beans",
-    "Lentils",
-    "Chickpeas",
-    "Eggs",
-    "Ground Meat",
-    "Fish Fillets",
-    "Tofu",
-
-    # Dairy
-    "Milk",
-    "UHT Milk",
-    "Yogurt",
-    "Cheese",
-    "Sliced Cheese",
-    "Butter",
-    "Almond Milk",
-    "Oat Milk",
-
-    # Fresh Produce
-    "Leafy Greens",
-    "Tomatoes",
-    "Onions",
-    "Potatoes",
-    "Carrots",
-    "Apples",
-    "Bananas",
-    "Oranges",
-    "Bell Peppers",
-    "Cucumbers",
-    "Broccoli",
-    "Cauliflower",
-
-    # Manual entry
-    "Other (type manually)",
-]
-
-ITEM_TO_GROUP = {
-    # Canned Vegetables
-    "Green Beans": "Canned Vegetable",
-    "Corn": "Canned Vegetable",
-    "Green Peas": "Canned Vegetable",
-    "Canned Tomatoes": "Canned Vegetable",
-    "Carrots (Canned)": "Canned Vegetable",
-    "Mixed Vegetables": "Canned Vegetable",
-    "Spinach (Canned)": "Canned Vegetable",
-    "Potatoes (Canned)": "Canned Vegetable",
-    "Beets": "Canned Vegetable",
-    "Pumpkin Puree": "Canned Vegetable",
-
-    # Canned Fruit
-    "Peaches": "Canned Fruit",
-    "Pears": "Canned Fruit",
-    "Pineapple": "Canned Fruit",
-    "Fruit Cocktail": "Canned Fruit",
-    "Mandarin Oranges": "Canned Fruit",
-    "Applesauce": "Canned Fruit",
-    "Apricots": "Canned Fruit",
-    "Mango": "Canned Fruit",
-
-    # Grain
-    "Rice": "Grain",
-    "Pasta": "Grain",
-    "Oats": "Grain",
-    "Cereal": "Grain",
-    "Quinoa": "Grain",
-    "Flour": "Grain",
-    "Cornmeal": "Grain",
-    "Barley": "Grain",
-    "Couscous": "Grain",
-    "Crackers": "Grain",
-
-    # Protein
-    "Tuna": "Protein",
-    "Salmon": "Protein",
-    "Canned Chicken": "Protein",
-    "Beans": "Protein",
-    "Lentils": "Protein",
-    "Chickpeas": "Protein",
-    "Eggs": "Protein",
-    "Ground Meat": "Protein",
-    "Fish Fillets": "Protein",
-    "Tofu": "Protein",
-
-    # Dairy
-    "Milk": "Dairy",
-    "UHT Milk": "Dairy",
-    "Yogurt": "Dairy",
-    "Cheese": "Dairy",
-    "Sliced Cheese": "Dairy",
-    "Butter": "Dairy",
-    "Almond Milk": "Dairy",
-    "Oat Milk": "Dairy",
-
-    # Fresh Produce
-    "Leafy Greens": "Fresh Produce",
-    "Tomatoes": "Fresh Produce",
-    "Onions": "Fresh Produce",
-    "Potatoes": "Fresh Produce",
-    "Carrots": "Fresh Produce",
-    "Apples": "Fresh Produce",
-    "Bananas": "Fresh Produce",
-    "Oranges": "Fresh Produce",
-    "Bell Peppers": "Fresh Produce",
-    "Cucumbers": "Fresh Produce",
-    "Broccoli": "Fresh Produce",
-    "Cauliflower": "Fresh Produce",
-
-    "Other (type manually)": None,
-}
-
 STATUS_LABELS = {
     "✅ In Stock": "In Stock",
     "⚠️ Low": "Low",
@@ -179,17 +50,41 @@ STATUS_LABELS = {
 
 STATUS_LABELS_REVERSE = {v: k for k, v in STATUS_LABELS.items()}
 
+SHELF_BOARD_REFRESH_SECONDS = 10
+
 # --------------------------------------------------------------------
 # Streamlit layout
 # --------------------------------------------------------------------
 
+# --------------------------------------------------------------------
+# Pantry site (multi-pantry deployments): ?site=<id> in the URL
+# --------------------------------------------------------------------
+
+try:
+    PANTRY_SITE = set_site(st.query_params.get("site"))
+except UnknownSiteError as e:
+    st.error(f"{e}. Check the ?site= part of the address.")
+    st.stop()
+
+# Every browser session is its own desk, with its own conversation with the
+# coordinator, so two volunteers never write to one session history at once
+if "desk_id" not in st.session_state:
+    st.session_state["desk_id"] = uuid.uuid4().hex
+set_desk(st.session_state["desk_id"])
+
 st.title("🥫 EquiTable")
+st.caption(f"📍 {site_name(PANTRY_SITE)}")
 st.markdown(
     "A real-time inventory brain for volunteers who need to make fast, fair, "
     "and kind decisions. Let the system handle the logistics while you serve "
     "with compassion."
 )
 
+# Degraded mode: the circuit breaker has tripped, so model calls fail fast
+_model_health = model_status()
+if _model_health["degraded"]:
+    st.warning(f"⚠️ {_model_health['message']}")
+
 tab_inventory, tab_table, tab_donations = st.tabs(
     ["📦 Inventory", "🤝 Volunteer Service Desk", "🚚 Surplus Donation Routing"]
 )
@@ -203,6 +98,42 @@ if "donation_reject_reason" not in st.session_state:
     st.session_state["donation_reject_reason"] = ""
 
 
+# Idempotency nonces for inventory writes: a double click or a rerun while
+# a write is in flight reuses the same key, so the write is applied (and
+# billed) only once. The nonce is renewed after every successful write, so
+# a deliberate re-submit of the same item and status is written again.
+def _form_nonce(form: str) -> str:
+    key = f"{form}_nonce"
+    if key not in st.session_state:
+        st.session_state[key] = uuid.uuid4().hex
+    return st.session_state[key]
+
+
+def _reset_form_nonce(form: str) -> None:
+    st.session_state[f"{form}_nonce"] = uuid.uuid4().hex
+
+
+def _describe_custom_item(typed: str) -> None:
+    """Show which catalog item a typed name resolves to (or close matches)."""
+    if not typed.strip():
+        return
+    resolved = resolve_item(typed)
+    if resolved:
+        st.caption(f"Recognized as **{resolved}** ({ITEM_TO_GROUP.get(resolved)}).")
+        return
+    candidates = ambiguous_items(typed)
+    if candidates:
+        st.caption(
+            "Could be " + ", ".join(candidates) + ". Type the full name; it will not be saved as typed."
+        )
+        return
+    suggestions = suggest_items(typed)
+    if suggestions:
+        st.caption("Not in the catalog. Did you mean: " + ", ".join(suggestions) + "?")
+    else:
+        st.caption("Not in the catalog; it will be tracked as a new item.")
+
+
 # ====================================================================
 # TAB 1: INVENTORY
 # ====================================================================
@@ -223,6 +154,8 @@ with tab_inventory:
                 "Item to update",
                 ITEM_OPTIONS,
                 key="item_single_choice",
+                on_change=_reset_form_nonce,
+                args=("single",),
             )
 
             custom_item_single = ""
@@ -231,12 +164,15 @@ with tab_inventory:
                     "Custom item name",
                     key="item_single_custom",
                 )
+                _describe_custom_item(custom_item_single)
 
         with col2:
             status_label_single = st.selectbox(
                 "Status",
                 list(STATUS_LABELS.keys()),
                 key="status_single",
+                on_change=_reset_form_nonce,
+                args=("single",),
             )
 
         if st.button("Update this item"):
@@ -251,7 +187,12 @@ with tab_inventory:
             else:
                 status_plain = STATUS_LABELS[status_label_single]
                 try:
-                    _ = update_item_status(item_name_single, status_plain)
+                    _ = update_item_status(
+                        item_name_single,
+                        status_plain,
+                        idempotency_key=f"single:{item_name_single}:{_form_nonce('single')}",
+                    )
+                    _reset_form_nonce("single")
                     # Only one succinct success line (no duplicate)
                     st.success(
                         f"{item_name_single} is now **{status_plain}**."
@@ -272,12 +213,16 @@ with tab_inventory:
             "Items to update",
             ITEM_OPTIONS,
             key="items_multi_select",
+            on_change=_reset_form_nonce,
+            args=("multi",),
         )
 
         status_label_multi = st.selectbox(
             "Status for all selected items",
             list(STATUS_LABELS.keys()),
             key="status_multi",
+            on_change=_reset_form_nonce,
+            args=("multi",),
         )
 
         if st.button("Update selected items"):
@@ -292,11 +237,18 @@ with tab_inventory:
                     if item == "Other (type manually)":
                         continue
                     try:
-                        update_item_status(item, status_plain)
+                        update_item_status(
+                            item,
+                            status_plain,
+                            idempotency_key=f"multi:{item}:{_form_nonce('multi')}",
+                        )
                         updated.append(item)
                     except Exception as e:
                         errors.append(f"{item}: {e}")
 
+                if not errors:
+                    # on a partial failure keep the nonce: a retry skips the items already written
+                    _reset_form_nonce("multi")
                 if updated:
                     st.success(
                         f"Updated {len(updated)} item(s) to **{status_plain}**: "
@@ -308,6 +260,168 @@ with tab_inventory:
                         + "\n".join(f"- {e}" for e in errors)
                     )
 
+    st.markdown("---")
+
+    # ---------- STOCK COUNTS ----------
+    with st.expander("🔢 Counts: hand out, restock or recount", expanded=False):
+        st.caption(
+            "For items you count, the status follows the count automatically: "
+            f"**Out of Stock** at 0, **Low** at or below the item's threshold "
+            f"(default {LOW_STOCK_AT})."
+        )
+        count_item = st.selectbox("Item", CATALOG_ITEMS, key="count_item")
+        count_units = st.number_input("Units", min_value=0, value=1, step=1, key="count_units")
+        count_household = st.text_input(
+            "Household card # (optional, logs the hand-out on their visit)",
+            key="count_household",
+        )
+
+        col_out, col_in, col_set = st.columns(3)
+        hand_out = col_out.button("Hand out")
+        restock = col_in.button("Restock")
+        recount = col_set.button("Set count to units")
+        try:
+            if (hand_out or restock) and not count_units:
+                st.warning("Enter how many units to hand out or restock.")
+            elif hand_out:
+                result = allocate_items(
+                    {count_item: int(count_units)}, count_household.strip() or None
+                )[0]
+                if result["quantity"] is None:
+                    st.info(f"{count_item} isn't counted yet. Restock or recount it first.")
+                else:
+                    st.success(f"{result['quantity']} {count_item} left (**{result['status']}**).")
+            elif restock:
+                result = restock_item(count_item, int(count_units))
+                st.success(f"{result['quantity']} {count_item} on the shelf (**{result['status']}**).")
+            elif recount:
+                result = set_item_count(count_item, int(count_units))
+                st.success(f"{count_item} recounted: {result['quantity']} (**{result['status']}**).")
+        except InsufficientStockError as e:
+            st.error(f"Not enough on the shelf: {e}.")
+        except Exception as e:
+            st.error(f"Error updating counts: {e}")
+
+    st.markdown("---")
+
+    # ---------- SHELF BOARD ----------
+    @st.fragment(run_every=SHELF_BOARD_REFRESH_SECONDS)
+    def shelf_board():
+        # fragment reruns don't re-run the top of the script
+        set_site(PANTRY_SITE)
+        # First render loads the full snapshot; after that each refresh only
+        # asks for changes since the version we already show.
+        board_key = f"shelf_board:{PANTRY_SITE}"
+        board = st.session_state.get(board_key)
+        try:
+            if board is None:
+                board = inventory_snapshot()
+            else:
+                feed = inventory_changes_since(board["version"])
+                for change in feed["changes"]:
+                    group_items = board["groups"].get(change["food_group"], board["other"])
+                    group_items[change["item"]] = change["status"]
+                board["version"] = feed["version"]
+        except Exception as e:
+            st.error(f"Could not load the shelf board: {e}")
+            return
+        st.session_state[board_key] = board
+
+        sections = list(board["groups"].items())
+        if board["other"]:
+            sections.append(("Other", board["other"]))
+
+        columns = st.columns(3)
+        for i, (group, items) in enumerate(sections):
+            with columns[i % 3]:
+                st.markdown(f"**{group}**")
+                st.markdown(
+                    "\n".join(
+                        f"- {STATUS_LABELS_REVERSE.get(status, status)} · {item}"
+                        for item, status in items.items()
+                    )
+                )
+        st.caption(f"Inventory version {board['version']} · refreshes every {SHELF_BOARD_REFRESH_SECONDS}s")
+
+    with st.expander("🗂️ Live shelf board", expanded=False):
+        shelf_board()
+
+    # ---------- DELIVERY MANIFEST (bulk import / export) ----------
+    with st.expander("🚛 Delivery manifest: bulk import / export", expanded=False):
+        st.caption(
+            "Upload the truck's manifest as CSV or JSONL with columns **item**, "
+            "**status** and/or whole-number **quantity**. Every row is checked "
+            "against the catalog first; if any row is bad, nothing is applied."
+        )
+        manifest_file = st.file_uploader(
+            "Manifest file",
+            type=["csv", "jsonl", "ndjson"],
+            key="manifest_upload",
+        )
+        if st.button("Apply manifest", disabled=manifest_file is None):
+            with st.spinner("Applying manifest..."):
+                try:
+                    report = import_manifest(
+                        manifest_file, detect_format(manifest_file.name)
+                    )
+                except Exception as e:
+                    st.error(f"Error importing manifest: {e}")
+                else:
+                    if report["error_count"]:
+                        st.error(
+                            f"Nothing was applied: {report['error_count']} of "
+                            f"{report['rows']} row(s) need fixing:\n\n"
+                            + "\n".join(f"- {e}" for e in report["errors"])
+                        )
+                    else:
+                        st.success(
+                            f"Applied {report['applied']} row(s) "
+                            f"in {report['chunks']} chunk(s)."
+                        )
+
+        export_format = st.radio(
+            "Export format", ["csv", "jsonl"], horizontal=True, key="export_format"
+        )
+        if st.button("Prepare inventory export"):
+            buffer = io.StringIO()
+            try:
+                export_inventory(buffer, export_format)
+            except Exception as e:
+                st.error(f"Error exporting inventory: {e}")
+            else:
+                st.download_button(
+                    "Download inventory",
+                    data=buffer.getvalue(),
+                    file_name=f"inventory.{export_format}",
+                    mime="text/csv" if export_format == "csv" else "application/x-ndjson",
+                )
+
+    # ---------- STOCKOUT ANALYTICS ----------
+    with st.expander("📈 Stockout analytics (for ordering)", expanded=False):
+        st.caption(
+            "Built from the inventory change log: which items and food groups "
+            "spend the most time Out of Stock, and when shelves run empty."
+        )
+        if st.button("Load analytics"):
+            try:
+                stats = inventory_analytics()
+            except Exception as e:
+                st.error(f"Could not load analytics: {e}")
+            else:
+                if stats["currently_out"]:
+                    st.warning("Out right now: " + ", ".join(stats["currently_out"]))
+                col_a1, col_a2 = st.columns(2)
+                with col_a1:
+                    st.markdown("**Hours Out of Stock, by item**")
+                    st.dataframe(stats["time_out_by_item"], use_container_width=True)
+                    st.markdown("**Most volatile items**")
+                    st.dataframe(stats["most_volatile"], use_container_width=True)
+                with col_a2:
+                    st.markdown("**Hours Out of Stock, by food group**")
+                    st.dataframe(stats["time_out_by_group"], use_container_width=True)
+                    st.markdown("**Stockouts per shift**")
+                    st.dataframe(stats["stockouts_by_shift"], use_container_width=True)
+
 
 # ====================================================================
 # TAB 2: VOLUNTEER SERVICE DESK
@@ -330,6 +444,7 @@ with tab_table:
             "Custom item name",
             key="item_check_custom",
         )
+        _describe_custom_item(custom_item_check)
 
     if st.button("Check status"):
         if item_choice_check == "Other (type manually)":
@@ -354,13 +469,23 @@ with tab_table:
         "and fairness rules** to evaluate tricky trades."
     )
 
-    family_size = st.number_input(
-        "Family size",
-        min_value=1,
-        step=1,
-        value=4,
-        key="sub_family_size",
-    )
+    col_fam1, col_fam2 = st.columns(2)
+
+    with col_fam1:
+        family_size = st.number_input(
+            "Family size",
+            min_value=1,
+            step=1,
+            value=4,
+            key="sub_family_size",
+        )
+
+    with col_fam2:
+        household_id = st.text_input(
+            "Household card # (optional)",
+            key="sub_household_id",
+            help="When given, the family's one category trade per visit is enforced.",
+        )
 
     col_sub1, col_sub2 = st.columns(2)
 
@@ -385,6 +510,32 @@ with tab_table:
         height=80,
     )
 
+    # Speculative prefetch: every widget change reruns the script, so as soon
+    # as an item is picked we read its shelf status, the point allowances and
+    # the card's trades left. The click then finds them cached and only waits
+    # for the coordinator.
+    if from_item != "Other (type manually)" or to_item != "Other (type manually)":
+        try:
+            preview = prefetch_substitution(
+                int(family_size), from_item, to_item, household_id=household_id.strip() or None
+            )
+        except Exception:
+            preview = None  # a failed prefetch must never block the form
+        if preview:
+            shelf = [
+                f"{item}: {STATUS_LABELS_REVERSE.get(s['status'], s['status'])}"
+                + (f" ({s['quantity']} left)" if s["quantity"] is not None else "")
+                for item, s in preview["items"].items()
+            ]
+            points = [
+                f"{group} {a['base']} pts (cap {a['cap']})"
+                for group, a in preview["allowances"].items()
+            ]
+            line = " · ".join(shelf + points)
+            if preview["trades_left"] == 0:
+                line += " · ⚠️ this card already used its trade today"
+            st.caption(f"Shelf check: {line}")
+
     if st.button("Balance the basket"):
         if (
             from_item == "Other (type manually)"
@@ -395,45 +546,15 @@ with tab_table:
                 "Please choose at least one specific item or add notes before asking."
             )
         else:
-            context_lines = [f"Family size: {int(family_size)}."]
-
-            from_group = ITEM_TO_GROUP.get(from_item)
-            to_group = ITEM_TO_GROUP.get(to_item)
-
-            if from_item != "Other (type manually)":
-                if from_group:
-                    context_lines.append(
-                        f"The family is giving up '{from_item}', which is in the '{from_group}' food group."
-                    )
-                else:
-                    context_lines.append(
-                        f"The family is giving up '{from_item}'."
-                    )
-
-            if to_item != "Other (type manually)":
-                if to_group:
-                    context_lines.append(
-                        f"They are asking for more of '{to_item}', which is in the '{to_group}' food group."
-                    )
-                else:
-                    context_lines.append(
-                        f"They are asking for more of '{to_item}'."
-                    )
-
-            if extra_notes.strip():
-                context_lines.append(f"Notes: {extra_notes.strip()}")
-
-            context_lines.append(
-                "Volunteer wants to know if this substitution is fair and allowed. "
-                "Give a clear yes/no recommendation and a brief allocation summary "
-                "based on their card, inventory tools, and your trade rules."
-            )
-
-            full_query = "\n".join(context_lines)
-
             with st.spinner("Checking policy and inventory..."):
                 try:
-                    answer = ask_policy(full_query)
+                    answer = ask_substitution(
+                        int(family_size),
+                        from_item,
+                        to_item,
+                        extra_notes,
+                        household_id=household_id.strip() or None,
+                    )
                 except Exception as e:
                     st.error(f"Error: {e}")
                 else:
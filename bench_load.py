@@ -0,0 +1,278 @@
+# bench_load.py
+# ---------------- BEGIN FILE -----------------
+"""
+Concurrent-desk load test for the whole pantry stack, against a stub model.
+
+N simulated desks issue a weighted mix of inventory updates, status checks,
+substitution decisions and donation routes as fast as they can. Gemini is
+replaced by pantry_model's local stub (fixed latency +/- jitter), so the
+agents, tools, quota bucket, session service and SQLite writes all run for
+real and no API key is needed.
+
+    python bench_load.py --desks 16 --ops 20 --latency-ms 300
+    python bench_load.py --mode sync        # desks as threads via run_sync, like Streamlit
+    python bench_load.py --sites 4          # desks spread over 4 pantry sites
+
+Reports throughput, latency percentiles per operation, errors by kind
+(database locks, stale sessions, deadlines, ...) and database growth.
+Every desk runs in its own desk session, like separate browser tabs or
+kiosks. Any failed operation fails the run (exit code 1 and a FAIL line on
+stderr); `--max-error-rate` allows a fraction of failures instead.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import sqlite3
+import tempfile
+import threading
+from collections import Counter, defaultdict
+
+from pantry_catalog import CATALOG_ITEMS
+from pantry_manifest import VALID_STATUSES
+
+DEFAULT_MIX = "update=4,check=4,policy=2,donation=1"
+SURPLUS = ["bread", "canned beans", "apples", "milk", "rice", "yogurt", "pasta"]
+
+
+def _pct(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def parse_mix(spec: str) -> dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    unknown = set(mix) - {"update", "check", "policy", "donation"}
+    if unknown:
+        raise SystemExit(f"unknown operation(s) in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def classify_error(exc: BaseException) -> str:
+    text = f"{type(exc).__name__}: {exc}".lower()
+    if "database is locked" in text or "database is busy" in text:
+        return "db_locked"
+    if "stale" in text:
+        return "stale_session"
+    if "already running" in text:
+        return "event_loop_busy"
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if type(exc).__name__ == "ModelUnavailableError":
+        return "model_unavailable"
+    return type(exc).__name__
+
+
+def db_footprint(db_path: str) -> dict:
+    """File sizes (db + WAL) and row counts of the tables that grow."""
+    out = {"db_kb": 0.0, "wal_kb": 0.0}
+    if os.path.exists(db_path):
+        out["db_kb"] = round(os.path.getsize(db_path) / 1024, 1)
+    if os.path.exists(db_path + "-wal"):
+        out["wal_kb"] = round(os.path.getsize(db_path + "-wal") / 1024, 1)
+    if out["db_kb"]:
+        conn = sqlite3.connect(db_path)
+        try:
+            for table in ("events", "sessions", "inventory_log", "inventory_items"):
+                try:
+                    out[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                except sqlite3.OperationalError:
+                    out[table] = 0
+        finally:
+            conn.close()
+    return out
+
+
+# ---------- OPERATIONS ----------
+
+def _operation(logic, name: str, rng: random.Random, sync: bool):
+    """Return a callable (sync) or coroutine factory (async) for one operation."""
+    item = rng.choice(CATALOG_ITEMS)
+    if name == "update":
+        status = rng.choice(VALID_STATUSES)
+        if sync:
+            return lambda: logic.update_item_status(item, status)
+        return lambda: logic.update_item_status_async(item, status)
+    if name == "check":
+        if sync:
+            return lambda: logic.check_item_status(item)
+        return lambda: logic.check_item_status_async(item)
+    if name == "policy":
+        args = (rng.randint(1, 8), item, rng.choice(CATALOG_ITEMS), "")
+        if sync:
+            return lambda: logic.ask_substitution(*args)
+        return lambda: logic.ask_substitution_async(*args)
+
+    surplus = rng.choice(SURPLUS)
+    approve = rng.random() < 0.8
+    if sync:
+        def donate():
+            _, pending, token = logic.start_donation(surplus)
+            if pending:
+                logic.confirm_donation(token, approve)
+        return donate
+
+    async def donate_async():
+        _, pending, token = await logic.start_donation_async(surplus)
+        if pending:
+            await logic.confirm_donation_async(token, approve)
+    return donate_async
+
+
+class _Results:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.samples: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, op: str, seconds: float, exc: BaseException | None):
+        with self._lock:
+            self.latencies[op].append(seconds)
+            if exc is not None:
+                kind = classify_error(exc)
+                self.errors[kind] += 1
+                self.samples.setdefault(kind, f"{type(exc).__name__}: {exc}"[:120])
+
+
+def _desk_site(d: int, sites: int) -> str | None:
+    return f"site{d % sites}" if sites > 1 else None
+
+
+async def _run_async(logic, desks, ops, mix, seed, results, sites=1):
+    from pantry_sites import set_site
+
+    names, weights = list(mix), list(mix.values())
+
+    async def desk(d):
+        set_site(_desk_site(d, sites))  # each gathered desk is its own task/context
+        logic.set_desk(f"bench-{d}")
+        rng = random.Random(seed + d)
+        for _ in range(ops):
+            op = rng.choices(names, weights)[0]
+            call = _operation(logic, op, rng, sync=False)
+            start = time.perf_counter()
+            exc = None
+            try:
+                await call()
+            except Exception as e:
+                exc = e
+            results.record(op, time.perf_counter() - start, exc)
+
+    await asyncio.gather(*[desk(d) for d in range(desks)])
+
+
+def _run_threads(logic, desks, ops, mix, seed, results, sites=1):
+    from pantry_sites import set_site
+
+    names, weights = list(mix), list(mix.values())
+
+    def desk(d):
+        set_site(_desk_site(d, sites))
+        logic.set_desk(f"bench-{d}")
+        rng = random.Random(seed + d)
+        for _ in range(ops):
+            op = rng.choices(names, weights)[0]
+            call = _operation(logic, op, rng, sync=True)
+            start = time.perf_counter()
+            exc = None
+            try:
+                call()
+            except Exception as e:
+                exc = e
+            results.record(op, time.perf_counter() - start, exc)
+
+    threads = [threading.Thread(target=desk, args=(d,)) for d in range(desks)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--desks", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=20, help="operations per desk")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weights, default {DEFAULT_MIX}")
+    parser.add_argument("--latency-ms", type=float, default=300, help="stub model latency per call")
+    parser.add_argument("--jitter", type=float, default=0.25, help="+/- fraction of the latency")
+    parser.add_argument("--rpm", type=float, default=100000, help="model quota (PANTRY_MODEL_RPM)")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async",
+                        help="async: desks share one loop (HTTP API); sync: threads via run_sync (Streamlit)")
+    parser.add_argument("--db", help="SQLite file to use (default: a fresh temp file)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--sites", type=int, default=1, help="spread desks over this many pantry sites")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="fraction of operations allowed to fail before the run fails (default 0)")
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    tmp = None
+    db_path = args.db
+    if not db_path:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp.name, "pantry.db")
+
+    # must be set before pantry_logic builds the model, quota and session service
+    os.environ["PANTRY_MODEL_STUB_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["PANTRY_MODEL_STUB_JITTER"] = str(args.jitter)
+    os.environ["PANTRY_MODEL_RPM"] = str(args.rpm)
+    os.environ["PANTRY_MODEL_BURST"] = str(max(10, int(args.rpm / 60)))
+    os.environ["PANTRY_DB_URL"] = f"sqlite+aiosqlite:///{os.path.abspath(db_path)}"
+    import pantry_logic
+
+    before = db_footprint(db_path)
+    results = _Results()
+    start = time.perf_counter()
+    if args.mode == "async":
+        pantry_logic.run_sync(
+            _run_async(pantry_logic, args.desks, args.ops, mix, args.seed, results, args.sites)
+        )
+    else:
+        _run_threads(pantry_logic, args.desks, args.ops, mix, args.seed, results, args.sites)
+    elapsed = time.perf_counter() - start
+    pantry_logic.run_sync(pantry_logic.session_service.close())
+    after = db_footprint(db_path)
+
+    total = sum(len(v) for v in results.latencies.values())
+    errors = sum(results.errors.values())
+    print(f"{args.desks} desks x {args.ops} ops ({args.mode}, {args.sites} site(s)), "
+          f"stub model {args.latency_ms:.0f} ms")
+    print(f"{total} ops in {elapsed:.1f}s = {total / elapsed:.1f} ops/s, {errors} errors")
+    print(f"{'operation':<12}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for op, samples in sorted(results.latencies.items()):
+        print(
+            f"{op:<12}{len(samples):>7}{_pct(samples, 0.5) * 1000:>9.0f}"
+            f"{_pct(samples, 0.95) * 1000:>9.0f}{_pct(samples, 0.99) * 1000:>9.0f}"
+        )
+    for kind, count in results.errors.most_common():
+        print(f"error {kind}: {count}  e.g. {results.samples[kind]}")
+    print("db growth: " + ", ".join(
+        f"{k} {before.get(k, 0)} -> {after.get(k, 0)}" for k in after
+    ))
+    print(f"coalescing: {dict(pantry_logic.COALESCE_STATS)}")
+    print(f"write queue: {pantry_logic.session_service.write_queue.stats}")
+    print(f"read cache: {pantry_logic.read_cache_metrics()}")
+    print(f"model cache: {pantry_logic.model_cache_metrics()}")
+
+    if tmp:
+        tmp.cleanup()
+    error_rate = errors / total if total else 0.0
+    if error_rate > args.max_error_rate:
+        print(f"FAIL: {errors}/{total} operations failed ({error_rate:.1%}, "
+              f"allowed {args.max_error_rate:.1%})", file=sys.stderr)
+        return 1
+    print(f"PASS: {errors}/{total} operations failed")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
+# ----------------- END FILE -----------------
@@ -0,0 +1,156 @@
+# bench_storage.py
+# ---------------- BEGIN FILE -----------------
+"""
+Concurrent-write benchmark: stock DatabaseSessionService vs PantrySessionService.
+
+Each simulated desk owns a session and appends inventory-flip events as fast
+as it can, all desks at once, against a fresh SQLite file. A second phase
+measures small writes to a side table, one transaction each vs. the batched
+WriteQueue.
+
+    python bench_storage.py --desks 16 --events 40
+"""
+import os
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+
+from sqlalchemy import text
+from google.adk.events import Event, EventActions
+from google.adk.sessions import DatabaseSessionService
+
+from pantry_storage import PantrySessionService, ensure_sqlite_file
+
+APP = "bench_app"
+
+
+def _pct(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def _desk(service, desk: int, n_events: int, latencies: list, errors: list):
+    session = await service.create_session(
+        app_name=APP, user_id="bench", session_id=f"desk-{desk}"
+    )
+    for i in range(n_events):
+        ev = Event(
+            author="user",
+            invocation_id=uuid.uuid4().hex,
+            actions=EventActions(state_delta={f"inventory:item-{i % 60}": "Low"}),
+        )
+        start = time.perf_counter()
+        try:
+            await service.append_event(session, ev)
+        except Exception as e:
+            errors.append(type(e).__name__ + ": " + str(e)[:80])
+        latencies.append(time.perf_counter() - start)
+
+
+async def bench_sessions(label: str, service, desks: int, n_events: int) -> dict:
+    latencies: list[float] = []
+    errors: list[str] = []
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[_desk(service, d, n_events, latencies, errors) for d in range(desks)],
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    errors += [repr(r)[:80] for r in results if isinstance(r, Exception)]
+    await service.close()
+    return {
+        "label": label,
+        "writes/s": len(latencies) / elapsed,
+        "p50_ms": _pct(latencies, 0.5) * 1000,
+        "p95_ms": _pct(latencies, 0.95) * 1000,
+        "errors": len(errors),
+        "sample_error": errors[0] if errors else "",
+    }
+
+
+async def bench_side_table(label: str, service, writers: int, n_writes: int, batched: bool) -> dict:
+    engine = service.db_engine
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE IF NOT EXISTS bench_log (k TEXT, v TEXT)"))
+
+    async def one(conn, k):
+        await conn.execute(text("INSERT INTO bench_log VALUES (:k, 'x')"), {"k": k})
+
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    async def writer(w):
+        for i in range(n_writes):
+            start = time.perf_counter()
+            try:
+                if batched:
+                    await service.write_queue.submit(lambda conn: one(conn, f"{w}:{i}"))
+                else:
+                    async with engine.begin() as conn:
+                        await one(conn, f"{w}:{i}")
+            except Exception as e:
+                errors.append(type(e).__name__ + ": " + str(e)[:80])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[writer(w) for w in range(writers)])
+    elapsed = time.perf_counter() - start
+    await service.close()
+    return {
+        "label": label,
+        "writes/s": len(latencies) / elapsed,
+        "p50_ms": _pct(latencies, 0.5) * 1000,
+        "p95_ms": _pct(latencies, 0.95) * 1000,
+        "errors": len(errors),
+        "sample_error": errors[0] if errors else "",
+    }
+
+
+def _fresh_url(tmpdir: str, name: str) -> str:
+    path = os.path.join(tmpdir, f"{name}.db")
+    url = f"sqlite+aiosqlite:///{path}"
+    ensure_sqlite_file(url)
+    return url
+
+
+async def main(desks: int, n_events: int):
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        rows.append(await bench_sessions(
+            "sessions: stock", DatabaseSessionService(db_url=_fresh_url(tmp, "a")), desks, n_events))
+        rows.append(await bench_sessions(
+            "sessions: tuned", PantrySessionService(_fresh_url(tmp, "b")), desks, n_events))
+        rows.append(await bench_side_table(
+            "side table: txn per write", DatabaseSessionService(db_url=_fresh_url(tmp, "c")),
+            desks, n_events, batched=False))
+        tuned = PantrySessionService(_fresh_url(tmp, "d"))
+        rows.append(await bench_side_table(
+            "side table: write queue", tuned, desks, n_events, batched=True))
+        queue_stats = tuned.write_queue.stats
+
+    print(f"{desks} desks x {n_events} writes each")
+    print(f"{'scenario':<28}{'writes/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    for r in rows:
+        print(
+            f"{r['label']:<28}{r['writes/s']:>10.1f}{r['p50_ms']:>9.1f}"
+            f"{r['p95_ms']:>9.1f}{r['errors']:>8}"
+        )
+        if r["sample_error"]:
+            print(f"    e.g. {r['sample_error']}")
+    print(
+        f"write queue: {queue_stats['jobs']} jobs in {queue_stats['batches']} commits "
+        f"(largest batch {queue_stats['max_batch_seen']})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--desks", type=int, default=16)
+    parser.add_argument("--events", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(main(args.desks, args.events))
+# ----------------- END FILE -----------------
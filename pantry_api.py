@@ -0,0 +1,263 @@
+# pantry_api.py
+# ---------------- BEGIN FILE -----------------
+"""
+Headless HTTP API for kiosks, scanners and other front ends.
+
+A thin FastAPI layer over pantry_logic's *_async functions. Handlers await
+them directly on the server's event loop, so every client shares the one
+runner, session service, write queue and model quota that the process owns,
+with no run_sync / Streamlit rerun in the path.
+
+Every request is scoped to one pantry site by the X-Pantry-Site header
+(default: the default site), so one process serves many pantries. A client
+that sends X-Pantry-Desk gets its own coordinator session; requests without
+it share the main session and take turns in it.
+
+Several worker processes may share one pantry.db: pending donations live in
+the database and cached reads notice other workers' writes within
+PANTRY_CACHE_POLL_S. The circuit breaker and the quota bucket are still per
+process, so split PANTRY_MODEL_RPM across workers:
+
+    python pantry_api.py --host 0.0.0.0 --port 8080
+    # or: uvicorn pantry_api:app --port 8080 --workers 2
+"""
+import argparse
+from contextlib import asynccontextmanager
+from typing import Annotated
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+import pantry_logic
+from pantry_catalog import AmbiguousItemError
+from pantry_inventory import InsufficientStockError
+from pantry_manifest import VALID_STATUSES
+from pantry_model import ModelUnavailableError
+from pantry_sites import UnknownSiteError, normalize_site_id, site_scope
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    yield
+    await pantry_logic.session_service.close()
+
+
+async def _pantry_site(x_pantry_site: str | None = Header(default=None)):
+    """Run the whole request against the site named in X-Pantry-Site."""
+    try:
+        site = normalize_site_id(x_pantry_site)
+    except UnknownSiteError as e:
+        raise HTTPException(404, str(e))
+    with site_scope(site):
+        yield
+
+
+async def _pantry_desk(x_pantry_desk: str | None = Header(default=None)):
+    """Run the request's model calls in the session of the desk named in X-Pantry-Desk."""
+    try:
+        pantry_logic.desk_session_id(x_pantry_desk)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    with pantry_logic.desk_scope(x_pantry_desk):
+        yield
+
+
+app = FastAPI(
+    title="EquiTable Pantry API",
+    lifespan=_lifespan,
+    dependencies=[Depends(_pantry_site), Depends(_pantry_desk)],
+)
+
+
+@app.exception_handler(ModelUnavailableError)
+async def _model_unavailable(request: Request, exc: ModelUnavailableError):
+    retry_in = pantry_logic.model_status()["retry_in_s"]
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "model": pantry_logic.model_status()},
+        headers={"Retry-After": str(int(retry_in) + 1)},
+    )
+
+
+@app.exception_handler(AmbiguousItemError)
+async def _ambiguous_item(request: Request, exc: AmbiguousItemError):
+    return JSONResponse(
+        status_code=422,
+        content={"detail": str(exc), "item": exc.name, "candidates": exc.candidates},
+    )
+
+
+@app.exception_handler(InsufficientStockError)
+async def _insufficient_stock(request: Request, exc: InsufficientStockError):
+    return JSONResponse(
+        status_code=409,
+        content={"detail": str(exc), "item": exc.item,
+                 "available": exc.available, "requested": exc.requested},
+    )
+
+
+# ---------- REQUEST BODIES ----------
+
+class StatusUpdate(BaseModel):
+    status: str
+    idempotency_key: str | None = None
+
+
+class Allocation(BaseModel):
+    # item -> units taken; a zero or negative count is a 422, not silently skipped
+    items: dict[str, Annotated[int, Field(ge=1)]]
+    household_id: str | None = None
+
+
+class Restock(BaseModel):
+    count: int = Field(ge=1)
+
+
+class Recount(BaseModel):
+    quantity: int = Field(ge=0)
+    low_at: int | None = Field(default=None, ge=0)
+
+
+class PolicyQuestion(BaseModel):
+    query: str
+    items: list[str] = Field(default_factory=list)
+    groups: dict[str, list[str]] = Field(default_factory=dict)
+
+
+class SubstitutionRequest(BaseModel):
+    family_size: int = Field(ge=1)
+    from_item: str = ""
+    to_item: str = ""
+    notes: str = ""
+    household_id: str | None = None
+
+
+class DonationStart(BaseModel):
+    item_type: str
+
+
+class DonationDecision(BaseModel):
+    approve: bool
+
+
+# ---------- HEALTH ----------
+
+@app.get("/health")
+async def health() -> dict:
+    return {
+        "model": pantry_logic.model_status(),
+        "quota": pantry_logic.model_quota_metrics(),
+        "coalescing": dict(pantry_logic.COALESCE_STATS),
+        "write_queue": dict(pantry_logic.session_service.write_queue.stats),
+        "read_cache": pantry_logic.read_cache_metrics(),
+        "model_cache": pantry_logic.model_cache_metrics(),
+        "site": pantry_logic.current_site(),
+        "session": pantry_logic.current_session(),
+    }
+
+
+# ---------- INVENTORY ----------
+
+@app.get("/inventory")
+async def read_inventory(item: list[str] = Query(default_factory=list)) -> dict:
+    """Statuses (and counts) straight from the inventory table (no model call)."""
+    if not item:
+        return await pantry_logic.inventory_snapshot_async()
+    return {"stock": await pantry_logic.read_stock_async(item)}
+
+
+@app.get("/inventory/changes")
+async def inventory_changes(since: int = 0) -> dict:
+    return await pantry_logic.inventory_changes_since_async(since)
+
+
+@app.put("/inventory/{item_name}")
+async def update_inventory(
+    item_name: str,
+    body: StatusUpdate,
+    idempotency_key: str | None = Header(default=None),
+) -> dict:
+    if body.status not in VALID_STATUSES:
+        raise HTTPException(422, f"status must be one of {', '.join(VALID_STATUSES)}")
+    reply = await pantry_logic.update_item_status_async(
+        item_name, body.status, idempotency_key=body.idempotency_key or idempotency_key
+    )
+    return {"reply": reply}
+
+
+@app.post("/inventory/allocate")
+async def allocate(body: Allocation) -> dict:
+    """Take a basket off the shelves, all or nothing (409 if anything is short)."""
+    return {"items": await pantry_logic.allocate_items_async(body.items, body.household_id)}
+
+
+@app.post("/inventory/{item_name}/restock")
+async def restock(item_name: str, body: Restock) -> dict:
+    return await pantry_logic.restock_item_async(item_name, body.count)
+
+
+@app.put("/inventory/{item_name}/count")
+async def recount(item_name: str, body: Recount) -> dict:
+    return await pantry_logic.set_item_count_async(item_name, body.quantity, body.low_at)
+
+
+@app.get("/inventory/{item_name}/check")
+async def check_inventory(item_name: str) -> dict:
+    """Ask the Service Desk whether the item can be given out."""
+    return {"reply": await pantry_logic.check_item_status_async(item_name)}
+
+
+@app.get("/inventory/{item_name}/history")
+async def item_history(item_name: str, limit: int = Query(50, ge=1, le=500)) -> dict:
+    return {"history": await pantry_logic.item_history_async(item_name, limit)}
+
+
+# ---------- POLICY ----------
+
+@app.post("/policy")
+async def ask_policy(body: PolicyQuestion) -> dict:
+    reply = await pantry_logic.ask_policy_async(body.query, items=body.items, groups=body.groups)
+    return {"reply": reply}
+
+
+@app.post("/policy/substitution")
+async def ask_substitution(body: SubstitutionRequest) -> dict:
+    reply = await pantry_logic.ask_substitution_async(
+        body.family_size, body.from_item, body.to_item, body.notes, body.household_id
+    )
+    return {"reply": reply}
+
+
+# ---------- HOUSEHOLDS ----------
+
+@app.get("/households/{household_id}")
+async def household_visit(household_id: str, visit_date: str | None = None) -> dict:
+    """Trades and allocations for one visit (default today)."""
+    return await pantry_logic.household_visit_async(household_id, visit_date)
+
+
+# ---------- DONATIONS ----------
+
+@app.post("/donations")
+async def start_donation(body: DonationStart) -> dict:
+    message, pending, token = await pantry_logic.start_donation_async(body.item_type)
+    return {"message": message, "pending": pending, "token": token}
+
+
+@app.post("/donations/{token}/confirm")
+async def confirm_donation(token: str, body: DonationDecision) -> dict:
+    if not await pantry_logic.has_pending_donation_async(token):
+        raise HTTPException(404, "No pending donation request was found. Please start a new one.")
+    return {"message": await pantry_logic.confirm_donation_async(token, body.approve)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the EquiTable pantry HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+# ----------------- END FILE -----------------
@@ -0,0 +1,228 @@
+# pantry_batch.py
+# ---------------- BEGIN FILE -----------------
+"""
+Batch policy evaluation for pre-registered substitution requests.
+
+Reads a CSV/JSONL file of structured requests, asks the Pantry Coordinator
+about each one with bounded concurrency, and streams one JSON result per line
+as decisions come back. Every request runs in its own throwaway session, so
+answers never leak into each other or into the service-desk session, and all
+model calls run at the lowest quota priority (live desks always go first).
+
+Request columns (CSV header or JSON keys):
+    id           caller's reference (optional, defaults to the line number)
+    family_size  household size in whole people, required
+    from_item    item the family gives up (optional)
+    to_item      item the family asks for more of (optional)
+    notes        dietary needs etc. (optional)
+    household_id family card number (optional); enforces one trade per visit
+    visit_date   YYYY-MM-DD the family comes in (optional). The trade is
+                 recorded in the ledger only for an explicit date up to
+                 today; without one the request is checked against today's
+                 visit but not recorded, and a future visit is only checked
+                 until the family is served at a desk
+
+Each result's "decision" is the reply's leading APPROVED / DECLINED word, or
+UNKNOWN if the reply does not start with one.
+
+CLI:
+    python pantry_batch.py requests.csv decisions.jsonl --concurrency 4 [--site bronx]
+"""
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from datetime import date
+
+from pantry_ledger import classify_decision
+from pantry_manifest import detect_format, iter_manifest_rows, parse_quantity
+from pantry_model import PRIORITY_BATCH
+
+DEFAULT_CONCURRENCY = 4
+
+
+class BatchRowError(ValueError):
+    """A request row that cannot be evaluated; carries its line number."""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def validate_request(line: int, row: dict) -> dict:
+    """Map a raw row to {"id", "line", "family_size", "from_item", "to_item", "notes",
+    "household_id", "visit_date"}."""
+    raw_size = row.get("family_size")
+    try:
+        family_size = parse_quantity(raw_size)
+    except ValueError:
+        raise BatchRowError(line, f"family_size '{raw_size}' is not a whole number")
+    if family_size < 1:
+        raise BatchRowError(line, "family_size must be at least 1")
+
+    from_item = str(row.get("from_item") or "").strip()
+    to_item = str(row.get("to_item") or "").strip()
+    notes = str(row.get("notes") or "").strip()
+    if not (from_item or to_item or notes):
+        raise BatchRowError(line, "needs from_item, to_item or notes")
+
+    visit_date = str(row.get("visit_date") or "").strip() or None
+    if visit_date:
+        try:
+            visit_date = date.fromisoformat(visit_date).isoformat()
+        except ValueError:
+            raise BatchRowError(line, f"visit_date '{visit_date}' is not YYYY-MM-DD")
+
+    return {
+        "id": str(row.get("id") or line),
+        "line": line,
+        "family_size": family_size,
+        "from_item": from_item,
+        "to_item": to_item,
+        "notes": notes,
+        "household_id": str(row.get("household_id") or "").strip() or None,
+        "visit_date": visit_date,
+    }
+
+
+def _pct(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def _evaluate(request: dict, session_id: str, keep_sessions: bool) -> dict:
+    # imported here so `--help` works without model credentials
+    import pantry_logic
+
+    start = time.perf_counter()
+    result = {"id": request["id"], "line": request["line"]}
+    try:
+        answer = await pantry_logic.ask_substitution_async(
+            request["family_size"],
+            request["from_item"],
+            request["to_item"],
+            request["notes"],
+            household_id=request["household_id"],
+            session_id=session_id,
+            priority=PRIORITY_BATCH,
+            visit_date=request["visit_date"],
+            record=request["visit_date"] is not None,
+        )
+        result.update(decision=classify_decision(answer), answer=answer, error=None)
+    except Exception as e:
+        result.update(decision=None, answer=None, error=f"{type(e).__name__}: {e}"[:300])
+    finally:
+        if not keep_sessions:
+            try:
+                await pantry_logic.discard_session_async(session_id)
+            except Exception:
+                pass  # never created (e.g. the breaker was open)
+    result["latency_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def evaluate_requests_async(
+    stream,
+    out,
+    fmt: str = "jsonl",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    keep_sessions: bool = False,
+) -> dict:
+    """
+    Evaluate every request in `stream` and write one JSON line per result to
+    `out` (a text file) as soon as it is ready, in completion order.
+
+    At most `concurrency` requests are in flight; the input is read lazily by
+    the workers, so the file can be any length. Returns run statistics.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    rows = iter_manifest_rows(stream, fmt)
+    latencies: list[float] = []
+    stats = {"total": 0, "ok": 0, "errors": 0, "invalid": 0,
+             "decisions": {"APPROVED": 0, "DECLINED": 0, "UNKNOWN": 0}}
+
+    def _emit(result: dict):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    async def worker():
+        # workers share one iterator; next() never yields control, so no lock
+        for line, row in rows:
+            stats["total"] += 1
+            try:
+                if isinstance(row, Exception):
+                    raise BatchRowError(line, str(row).split(": ", 1)[-1])
+                request = validate_request(line, row)
+            except BatchRowError as e:
+                stats["invalid"] += 1
+                _emit({"id": str(row.get("id") or line) if isinstance(row, dict) else str(line),
+                       "line": line, "decision": None, "answer": None,
+                       "error": str(e), "latency_s": 0.0})
+                continue
+
+            result = await _evaluate(request, f"batch-{run_id}-{line}", keep_sessions)
+            latencies.append(result["latency_s"])
+            if result["error"]:
+                stats["errors"] += 1
+            else:
+                stats["ok"] += 1
+                stats["decisions"][result["decision"]] += 1
+            _emit(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    elapsed = time.perf_counter() - start
+
+    return {
+        **stats,
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_min": round(len(latencies) / elapsed * 60, 1) if elapsed else 0.0,
+        "p50_latency_s": round(_pct(latencies, 0.5), 3),
+        "p95_latency_s": round(_pct(latencies, 0.95), 3),
+    }
+
+
+def evaluate_requests(stream, out, fmt: str = "jsonl", concurrency: int = DEFAULT_CONCURRENCY,
+                      keep_sessions: bool = False) -> dict:
+    """Sync wrapper (shares pantry_logic's background event loop)."""
+    import pantry_logic
+
+    return pantry_logic.run_sync(
+        evaluate_requests_async(stream, out, fmt, concurrency, keep_sessions)
+    )
+
+
+# ---------- CLI ----------
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute policy decisions for a file of substitution requests.")
+    parser.add_argument("requests", help="CSV or JSONL file of requests")
+    parser.add_argument("output", help="JSONL file for decisions ('-' for stdout)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--keep-sessions", action="store_true",
+                        help="keep each request's session in pantry.db for auditing")
+    parser.add_argument("--site", help="pantry site id (default: the default site)")
+    args = parser.parse_args(argv)
+
+    from pantry_sites import set_site
+
+    set_site(args.site)
+
+    fmt = detect_format(args.requests)
+    with open(args.requests, "rb") as f:
+        if args.output == "-":
+            stats = evaluate_requests(f, sys.stdout, fmt, args.concurrency, args.keep_sessions)
+        else:
+            with open(args.output, "w", encoding="utf-8") as out:
+                stats = evaluate_requests(f, out, fmt, args.concurrency, args.keep_sessions)
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+    return 0 if stats["errors"] == 0 and stats["invalid"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# ----------------- END FILE -----------------
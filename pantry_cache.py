@@ -0,0 +1,145 @@
+# pantry_cache.py
+# ---------------- BEGIN FILE -----------------
+"""
+In-process read caches that stay coherent across worker processes.
+
+Several Streamlit / API workers can share one pantry.db, and each keeps hot
+reads (stock levels, the shelf snapshot, household visits) in memory. Every
+write that could change such a read bumps a generation row for its
+(scope, site) in the SAME transaction as the data:
+
+    cache_generations(scope, site_id, generation)
+
+A worker re-reads that small table at most once per PANTRY_CACHE_POLL_S
+(default 1 s), and only when a cached read is asked for. Entries cached
+under an older generation are then treated as misses. So a write from
+another process becomes visible within one poll interval, and a write from
+this process is visible right away, because note_write() forces the next
+read to poll. No network service is involved, only the shared database.
+
+Always take the generation BEFORE reading the data it guards. A write that
+commits in between then tags fresh data with an old generation (one extra
+miss later), never stale data with a new one.
+"""
+import os
+import time
+import copy
+import asyncio
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+CACHE_POLL_S = float(os.getenv("PANTRY_CACHE_POLL_S", "1.0"))
+CACHE_MAX_ENTRIES = int(os.getenv("PANTRY_CACHE_MAX_ENTRIES", "512"))
+
+_TABLE = """
+    CREATE TABLE IF NOT EXISTS cache_generations (
+        scope TEXT NOT NULL,
+        site_id TEXT NOT NULL,
+        generation INTEGER NOT NULL,
+        PRIMARY KEY (scope, site_id)
+    )
+    """
+
+
+async def ensure_generation_table(conn) -> None:
+    """Create the generation table (call inside a table module's schema setup)."""
+    await conn.execute(text(_TABLE))
+
+
+async def bump_generation(conn, scope: str, site_id: str) -> None:
+    """Mark every cached `scope` read for `site_id` as outdated (inside the write's transaction)."""
+    await conn.execute(
+        text(
+            "INSERT INTO cache_generations (scope, site_id, generation) VALUES (:scope, :site, 1) "
+            "ON CONFLICT(scope, site_id) DO UPDATE SET generation = generation + 1"
+        ),
+        {"scope": scope, "site": site_id},
+    )
+
+
+async def read_generations(conn) -> dict[tuple[str, str], int]:
+    rows = (await conn.execute(text("SELECT scope, site_id, generation FROM cache_generations"))).all()
+    return {(r.scope, r.site_id): r.generation for r in rows}
+
+
+class GenerationWatcher:
+    """Latest known generation per (scope, site), refreshed at most every `poll_s`."""
+
+    def __init__(self, engine, poll_s: float = CACHE_POLL_S):
+        self.engine = engine
+        self.poll_s = poll_s
+        self._generations: dict[tuple[str, str], int] = {}
+        self._next_poll = 0.0
+        self._writes = 0         # local writes noted so far
+        self._polled_writes = 0  # local writes the last poll is known to include
+        self._poll = None
+        self.stats = {"polls": 0}
+
+    def note_write(self) -> None:
+        """This process just committed a write: the next read polls first."""
+        self._writes += 1
+
+    async def _refresh(self):
+        writes = self._writes
+        try:
+            async with self.engine.connect() as conn:
+                self._generations = await read_generations(conn)
+            self._polled_writes = writes
+            self._next_poll = time.monotonic() + self.poll_s
+            self.stats["polls"] += 1
+        finally:
+            self._poll = None
+
+    async def generation(self, scope: str, site_id: str) -> int:
+        target = self._writes
+        while self._polled_writes < target or time.monotonic() >= self._next_poll:
+            # concurrent readers share one poll; shielded so a caller giving up can't cancel it
+            if self._poll is None:
+                self._poll = asyncio.ensure_future(self._refresh())
+            await asyncio.shield(self._poll)
+        return self._generations.get((scope, site_id), 0)
+
+
+_MISSING = object()
+
+
+class GenerationCache:
+    """
+    LRU of read results, each tagged with the generation it was read under.
+
+    Values are deep-copied in and out, so callers may mutate what they get.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple[int, object]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0}
+
+    def get(self, key: tuple, generation: int, default=None):
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.stats["misses"] += 1
+            return default
+        if entry[0] != generation:
+            self._entries.pop(key, None)
+            self.stats["stale"] += 1
+            return default
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: tuple, generation: int, value) -> None:
+        self._entries[key] = (generation, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["stale"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
+# ----------------- END FILE -----------------
@@ -0,0 +1,431 @@
+# pantry_catalog.py
+# ---------------- BEGIN FILE -----------------
+"""
+Pantry item catalog: categories & items as used at your real pantry.
+
+Shared by the Streamlit UI (app.py) and the inventory logic (pantry_logic.py),
+together with a precomputed lookup index that resolves typed names
+("canned chicken ", "Chicken (canned)", "Brocoli") to one canonical item, so
+inventory keys never fragment and no LLM has to guess.
+
+Only exact spellings and small typos of one-word items resolve on their own,
+and a typo only when no other item could be meant ("peas" could be Pears or
+Green Peas). Anything else ("soy milk", "peanut butter") is a different food
+as far as we know: callers get close catalog names back as suggestions for a
+human to pick, and writes, food groups and allowances never use them.
+Inventory writes refuse an ambiguous name (AmbiguousItemError).
+"""
+import re
+from functools import lru_cache
+
+ITEM_OPTIONS = [
+    # Canned Vegetables
+    "Green Beans",
+    "Corn",
+    "Green Peas",
+    "Canned Tomatoes",
+    "Carrots (Canned)",
+    "Mixed Vegetables",
+    "Spinach (Canned)",
+    "Potatoes (Canned)",
+    "Beets",
+    "Pumpkin Puree",
+
+    # Canned Fruit
+    "Peaches",
+    "Pears",
+    "Pineapple",
+    "Fruit Cocktail",
+    "Mandarin Oranges",
+    "Applesauce",
+    "Apricots",
+    "Mango",
+
+    # Grain
+    "Rice",
+    "Pasta",
+    "Oats",
+    "Cereal",
+    "Quinoa",
+    "Flour",
+    "Cornmeal",
+    "Barley",
+    "Couscous",
+    "Crackers",
+
+    # Protein
+    "Tuna",
+    "Salmon",
+    "Canned Chicken",
+    "Beans",
+    "Lentils",
+    "Chickpeas",
+    "Eggs",
+    "Ground Meat",
+    "Fish Fillets",
+    "Tofu",
+
+    # Dairy
+    "Milk",
+    "UHT Milk",
+    "Yogurt",
+    "Cheese",
+    "Sliced Cheese",
+    "Butter",
+    "Almond Milk",
+    "Oat Milk",
+
+    # Fresh Produce
+    "Leafy Greens",
+    "Tomatoes",
+    "Onions",
+    "Potatoes",
+    "Carrots",
+    "Apples",
+    "Bananas",
+    "Oranges",
+    "Bell Peppers",
+    "Cucumbers",
+    "Broccoli",
+    "Cauliflower",
+
+    # Manual entry
+    "Other (type manually)",
+]
+
+ITEM_TO_GROUP = {
+    # Canned Vegetables
+    "Green Beans": "Canned Vegetable",
+    "Corn": "Canned Vegetable",
+    "Green Peas": "Canned Vegetable",
+    "Canned Tomatoes": "Canned Vegetable",
+    "Carrots (Canned)": "Canned Vegetable",
+    "Mixed Vegetables": "Canned Vegetable",
+    "Spinach (Canned)": "Canned Vegetable",
+    "Potatoes (Canned)": "Canned Vegetable",
+    "Beets": "Canned Vegetable",
+    "Pumpkin Puree": "Canned Vegetable",
+
+    # Canned Fruit
+    "Peaches": "Canned Fruit",
+    "Pears": "Canned Fruit",
+    "Pineapple": "Canned Fruit",
+    "Fruit Cocktail": "Canned Fruit",
+    "Mandarin Oranges": "Canned Fruit",
+    "Applesauce": "Canned Fruit",
+    "Apricots": "Canned Fruit",
+    "Mango": "Canned Fruit",
+
+    # Grain
+    "Rice": "Grain",
+    "Pasta": "Grain",
+    "Oats": "Grain",
+    "Cereal": "Grain",
+    "Quinoa": "Grain",
+    "Flour": "Grain",
+    "Cornmeal": "Grain",
+    "Barley": "Grain",
+    "Couscous": "Grain",
+    "Crackers": "Grain",
+
+    # Protein
+    "Tuna": "Protein",
+    "Salmon": "Protein",
+    "Canned Chicken": "Protein",
+    "Beans": "Protein",
+    "Lentils": "Protein",
+    "Chickpeas": "Protein",
+    "Eggs": "Protein",
+    "Ground Meat": "Protein",
+    "Fish Fillets": "Protein",
+    "Tofu": "Protein",
+
+    # Dairy
+    "Milk": "Dairy",
+    "UHT Milk": "Dairy",
+    "Yogurt": "Dairy",
+    "Cheese": "Dairy",
+    "Sliced Cheese": "Dairy",
+    "Butter": "Dairy",
+    "Almond Milk": "Dairy",
+    "Oat Milk": "Dairy",
+
+    # Fresh Produce
+    "Leafy Greens": "Fresh Produce",
+    "Tomatoes": "Fresh Produce",
+    "Onions": "Fresh Produce",
+    "Potatoes": "Fresh Produce",
+    "Carrots": "Fresh Produce",
+    "Apples": "Fresh Produce",
+    "Bananas": "Fresh Produce",
+    "Oranges": "Fresh Produce",
+    "Bell Peppers": "Fresh Produce",
+    "Cucumbers": "Fresh Produce",
+    "Broccoli": "Fresh Produce",
+    "Cauliflower": "Fresh Produce",
+
+    "Other (type manually)": None,
+}
+
+GROUP_TO_ITEMS: dict[str, list[str]] = {}
+for _item, _group in ITEM_TO_GROUP.items():
+    if _group:
+        GROUP_TO_ITEMS.setdefault(_group, []).append(_item)
+
+
+# Sentinel option that lets volunteers type an item that is not in the catalog
+OTHER_ITEM = "Other (type manually)"
+
+FOOD_GROUPS = list(GROUP_TO_ITEMS)
+
+CATALOG_ITEMS = [item for item in ITEM_OPTIONS if item != OTHER_ITEM]
+
+
+# ---------- NORMALIZED NAMES ----------
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Case-, punctuation-, spacing- and word-order-insensitive form of a name.
+
+    "Chicken (canned)", "canned  chicken " and "Canned Chicken" all map to
+    "canned chicken".
+    """
+    return " ".join(sorted(_NON_WORD.sub(" ", name.lower()).split()))
+
+
+# normalized name -> catalog spelling (exact lookups are one dict hit)
+NORMALIZED_TO_ITEM = {normalize_name(item): item for item in CATALOG_ITEMS}
+
+
+# ---------- TYPO TOLERANCE ----------
+
+# Edits allowed between a typed word and a one-word catalog item, by the
+# item's length: short names must match exactly ("Milk" vs "silk").
+def _max_typo_edits(length: int) -> int:
+    if length >= 8:
+        return 2
+    if length >= 5:
+        return 1
+    return 0
+
+
+# normalized one-word catalog names -> catalog spelling
+_SINGLE_WORD_ITEMS = {
+    normalized: item for normalized, item in NORMALIZED_TO_ITEM.items() if " " not in normalized
+}
+
+# (word, item) for every word of every catalog item
+_ITEM_WORDS = [
+    (word, item) for normalized, item in NORMALIZED_TO_ITEM.items() for word in normalized.split()
+]
+
+
+def _edit_distance(a: str, b: str, limit: int, substitution: int = 1) -> int:
+    """
+    Levenshtein distance, or limit + 1 as soon as it is known to exceed `limit`.
+
+    With substitution=2 a changed letter costs as much as a missing plus an
+    extra one, so only dropped and doubled letters are cheap.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (0 if ca == cb else substitution),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _typo_candidates(normalized: str) -> list[str]:
+    """
+    Catalog items a one-word name might be a typo of, closest first.
+
+    The first entry is a typo match: a one-word item reached by dropping or
+    doubling a few letters. A changed letter does not count, since it often
+    makes another word ("better", "batter" are not Butter). Any other item
+    with a word that contains the name, is contained in it, or is one or two
+    letters away (any edit) follows, because the name could mean that item
+    too ("peas": Pears or Green Peas).
+    """
+    if " " in normalized:
+        return []
+    matches = []
+    for candidate, item in _SINGLE_WORD_ITEMS.items():
+        limit = _max_typo_edits(len(candidate))
+        distance = _edit_distance(normalized, candidate, limit, substitution=2)
+        if distance <= limit:
+            matches.append((distance, item))
+    if not matches:
+        return []
+    matches.sort()
+    candidates = list(dict.fromkeys(item for _, item in matches))
+    for word, item in _ITEM_WORDS:
+        if item in candidates:
+            continue
+        limit = max(1, _max_typo_edits(len(word)))
+        if normalized in word or word in normalized or _edit_distance(normalized, word, limit) <= limit:
+            candidates.append(item)
+    return candidates
+
+
+def _typo_match(normalized: str) -> str | None:
+    """The item a one-word name is a typo of, if no other item could be meant."""
+    candidates = _typo_candidates(normalized)
+    return candidates[0] if len(candidates) == 1 else None
+
+
+# ---------- TRIGRAM (SUGGESTION) INDEX ----------
+
+# Minimum Dice similarity for a catalog item to be offered as a suggestion
+SUGGEST_THRESHOLD = 0.3
+
+
+def _trigrams(normalized: str) -> frozenset:
+    padded = f"  {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+_ITEM_TRIGRAMS = [_trigrams(normalize_name(item)) for item in CATALOG_ITEMS]
+
+# trigram -> indexes into CATALOG_ITEMS that contain it
+_TRIGRAM_INDEX: dict[str, list[int]] = {}
+for _i, _grams in enumerate(_ITEM_TRIGRAMS):
+    for _gram in _grams:
+        _TRIGRAM_INDEX.setdefault(_gram, []).append(_i)
+
+
+def match_items(name: str, limit: int = 5) -> list[tuple[str, float]]:
+    """
+    Catalog items ranked by similarity to `name`, best first, as (item, score).
+
+    Only items sharing at least one trigram with the query are scored.
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return []
+    exact = NORMALIZED_TO_ITEM.get(normalized)
+    if exact:
+        return [(exact, 1.0)]
+    query = _trigrams(normalized)
+    overlap: dict[int, int] = {}
+    for gram in query:
+        for i in _TRIGRAM_INDEX.get(gram, ()):
+            overlap[i] = overlap.get(i, 0) + 1
+    scored = [
+        (CATALOG_ITEMS[i], 2 * shared / (len(query) + len(_ITEM_TRIGRAMS[i])))
+        for i, shared in overlap.items()
+    ]
+    scored.sort(key=lambda pair: -pair[1])
+    return scored[:limit]
+
+
+@lru_cache(maxsize=4096)
+def resolve_item(name: str) -> str | None:
+    """
+    Canonical catalog item for a typed name, or None if it is not certainly one.
+
+    Exact (normalized) matches always resolve. Otherwise only a one-word name
+    a few dropped or doubled letters from one one-word item does, and only if
+    no other item could be meant (see ambiguous_items).
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return None
+    return NORMALIZED_TO_ITEM.get(normalized) or _typo_match(normalized)
+
+
+def ambiguous_items(name: str) -> list[str]:
+    """
+    Catalog items a typo could mean when resolve_item() refuses to choose
+    between them; [] if the name resolves or looks like no item at all.
+    """
+    normalized = normalize_name(name)
+    if not normalized or NORMALIZED_TO_ITEM.get(normalized):
+        return []
+    candidates = _typo_candidates(normalized)
+    return candidates if len(candidates) > 1 else []
+
+
+class AmbiguousItemError(ValueError):
+    """A typed name could be several catalog items; nothing is written for it."""
+
+    def __init__(self, name: str, candidates: list[str]):
+        super().__init__(
+            f"'{name}' could be {', '.join(candidates[:-1])} or {candidates[-1]}; "
+            "please name the item exactly"
+        )
+        self.name = name
+        self.candidates = candidates
+
+
+def check_unambiguous(name: str) -> None:
+    """Raise AmbiguousItemError if `name` is a typo of more than one item."""
+    candidates = ambiguous_items(name)
+    if candidates:
+        raise AmbiguousItemError(name, candidates)
+
+
+def suggest_items(name: str, limit: int = 3) -> list[str]:
+    """Close catalog names for a human to choose from; never applied on their own."""
+    close = [item for item, score in match_items(name, limit=limit) if score >= SUGGEST_THRESHOLD]
+    return list(dict.fromkeys(ambiguous_items(name) + close))[:limit]
+
+
+def canonical_name(name: str) -> str:
+    """Catalog spelling if the name resolves, else the name with tidied spacing."""
+    return resolve_item(name) or " ".join(name.split())
+
+
+def item_key(name: str) -> str:
+    """Inventory key: every spelling of one item maps to the same key."""
+    resolved = resolve_item(name)
+    if resolved:
+        return resolved.lower()
+    return normalize_name(name)
+
+
+def group_of(name: str) -> str | None:
+    """Food group of a typed name, if it resolves to a catalog item."""
+    resolved = resolve_item(name)
+    return ITEM_TO_GROUP.get(resolved) if resolved else None
+
+
+# ---------- POINT ALLOWANCES ----------
+
+# Card rules: Group A categories get 2 points per person, Group B get 1
+POINTS_PER_PERSON = {
+    "Canned Vegetable": 2,
+    "Canned Fruit": 2,
+    "Grain": 2,
+    "Protein": 2,
+    "Dairy": 1,
+    "Fresh Produce": 1,
+}
+
+# A trade may grow the destination group to about this multiple of its base
+DESTINATION_CAP_MULTIPLIER = 2
+
+
+def point_allowances(family_size: int, groups) -> dict[str, dict]:
+    """{group: {"per_person", "base", "cap"}} for a family of `family_size`."""
+    out = {}
+    for group in groups:
+        per_person = POINTS_PER_PERSON.get(group)
+        if per_person is None:
+            continue
+        base = per_person * int(family_size)
+        out[group] = {"per_person": per_person, "base": base,
+                      "cap": base * DESTINATION_CAP_MULTIPLIER}
+    return out
+# ----------------- END FILE -----------------
@@ -0,0 +1,112 @@
+# pantry_donations.py
+# ---------------- BEGIN FILE -----------------
+"""
+Donation routes waiting for a volunteer's approve / reject.
+
+They used to live in a dict inside one process, so a confirmation that
+reached a different worker (or came after a restart) found nothing. They are
+now rows in the shared database:
+
+- pending_donations  one row per token, keyed by (site_id, token)
+
+take_pending_donation() deletes and returns the row in one statement, so
+when two workers race on the same confirmation exactly one of them gets it.
+Routes left undecided for PANTRY_DONATION_TTL_H hours are dropped.
+
+All functions take an open SQLAlchemy async connection and the site id;
+writes are meant to run as WriteQueue jobs.
+"""
+import os
+import json
+import time
+import weakref
+
+from sqlalchemy import text
+
+DONATION_TTL_S = float(os.getenv("PANTRY_DONATION_TTL_H", "24")) * 3600
+
+_TABLE = """
+    CREATE TABLE IF NOT EXISTS pending_donations (
+        site_id TEXT NOT NULL,
+        token TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        partner_name TEXT NOT NULL,
+        partner_status TEXT,
+        partner_accepts TEXT,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (site_id, token)
+    )
+    """
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_pending_donations_created ON pending_donations (created_at)",
+]
+
+_COLUMNS = "item_type, partner_name, partner_status, partner_accepts, created_at"
+
+_schema_ready: "weakref.WeakSet" = weakref.WeakSet()
+
+
+async def ensure_donation_tables(engine) -> None:
+    """Create the pending-donation table once per engine (idempotent)."""
+    if engine in _schema_ready:
+        return
+    async with engine.begin() as conn:
+        await conn.execute(text(_TABLE))
+        for ddl in _INDEXES:
+            await conn.execute(text(ddl))
+    _schema_ready.add(engine)
+
+
+def _as_dict(row) -> dict | None:
+    if row is None:
+        return None
+    info = dict(row._mapping)
+    info["partner_accepts"] = json.loads(info["partner_accepts"] or "[]")
+    return info
+
+
+async def save_pending_donation(conn, site_id: str, token: str, info: dict) -> None:
+    """Store one route awaiting a decision (and drop routes nobody decided in time)."""
+    now = time.time()
+    await conn.execute(
+        text("DELETE FROM pending_donations WHERE created_at < :cutoff"),
+        {"cutoff": now - DONATION_TTL_S},
+    )
+    await conn.execute(
+        text(
+            f"INSERT INTO pending_donations (site_id, token, {_COLUMNS}) "
+            "VALUES (:site, :token, :item, :name, :status, :accepts, :now)"
+        ),
+        {"site": site_id, "token": token, "item": info["item_type"],
+         "name": info["partner_name"], "status": info.get("partner_status"),
+         "accepts": json.dumps(info.get("partner_accepts") or []), "now": now},
+    )
+
+
+async def read_pending_donation(conn, site_id: str, token: str) -> dict | None:
+    row = (
+        await conn.execute(
+            text(
+                f"SELECT {_COLUMNS} FROM pending_donations "
+                "WHERE site_id = :site AND token = :token AND created_at >= :cutoff"
+            ),
+            {"site": site_id, "token": token, "cutoff": time.time() - DONATION_TTL_S},
+        )
+    ).first()
+    return _as_dict(row)
+
+
+async def take_pending_donation(conn, site_id: str, token: str) -> dict | None:
+    """Claim a route for a decision: delete it and return it, or None if already taken."""
+    row = (
+        await conn.execute(
+            text(
+                "DELETE FROM pending_donations WHERE site_id = :site AND token = :token "
+                f"AND created_at >= :cutoff RETURNING {_COLUMNS}"
+            ),
+            {"site": site_id, "token": token, "cutoff": time.time() - DONATION_TTL_S},
+        )
+    ).first()
+    return _as_dict(row)
+# ----------------- END FILE -----------------
@@ -0,0 +1,291 @@
+# pantry_history.py
+# ---------------- BEGIN FILE -----------------
+"""
+Append-only inventory history with incrementally maintained stockout analytics.
+
+Every inventory write appends one row to `inventory_log` and updates a handful
+of small aggregate rows in the same transaction (O(1) per change):
+
+- inventory_item_stats   per item: stockouts, status changes, time spent Out
+- inventory_group_stats  per food group: stockouts, time spent Out
+- inventory_shift_stats  per shift ("YYYY-MM-DD morning"): stockouts, changes
+
+Analytics read only these aggregates, never the ADK events table. Every table
+is partitioned by site_id (leading column of each key and index), so one
+pantry's history never slows another's reads.
+"""
+import time
+import weakref
+from datetime import datetime
+
+from sqlalchemy import text
+
+from pantry_storage import add_missing_columns
+
+OUT_OF_STOCK = "Out of Stock"
+DEFAULT_STATUS = "In Stock"
+
+_TABLES = {
+    "inventory_log": """
+    CREATE TABLE IF NOT EXISTS inventory_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        site_id TEXT NOT NULL,
+        item_key TEXT NOT NULL,
+        item TEXT NOT NULL,
+        food_group TEXT,
+        old_status TEXT NOT NULL,
+        new_status TEXT NOT NULL,
+        changed_at REAL NOT NULL,
+        shift TEXT NOT NULL,
+        quantity INTEGER
+    )
+    """,
+    "inventory_item_stats": """
+    CREATE TABLE IF NOT EXISTS inventory_item_stats (
+        site_id TEXT NOT NULL,
+        item_key TEXT NOT NULL,
+        item TEXT NOT NULL,
+        food_group TEXT,
+        last_status TEXT NOT NULL,
+        last_changed_at REAL NOT NULL,
+        changes INTEGER NOT NULL DEFAULT 0,
+        stockouts INTEGER NOT NULL DEFAULT 0,
+        out_since REAL,
+        out_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (site_id, item_key)
+    )
+    """,
+    "inventory_group_stats": """
+    CREATE TABLE IF NOT EXISTS inventory_group_stats (
+        site_id TEXT NOT NULL,
+        food_group TEXT NOT NULL,
+        stockouts INTEGER NOT NULL DEFAULT 0,
+        out_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (site_id, food_group)
+    )
+    """,
+    "inventory_shift_stats": """
+    CREATE TABLE IF NOT EXISTS inventory_shift_stats (
+        site_id TEXT NOT NULL,
+        shift TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        stockouts INTEGER NOT NULL DEFAULT 0,
+        changes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (site_id, shift)
+    )
+    """,
+}
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_inventory_log_item ON inventory_log (site_id, item_key, seq)",
+    "CREATE INDEX IF NOT EXISTS ix_inventory_shift_stats_started "
+    "ON inventory_shift_stats (site_id, started_at)",
+]
+
+# engines whose tables exist; weak, so a new engine never reuses a dead one's id
+_schema_ready: "weakref.WeakSet" = weakref.WeakSet()
+
+
+async def ensure_history_tables(engine) -> None:
+    """Create the history tables once per engine (idempotent)."""
+    if engine in _schema_ready:
+        return
+    async with engine.begin() as conn:
+        for ddl in _TABLES.values():
+            await conn.execute(text(ddl))
+        # added with per-item counts; NULL for status-only writes
+        await add_missing_columns(conn, "inventory_log", {"quantity": "INTEGER"})
+        for ddl in _INDEXES:
+            await conn.execute(text(ddl))
+    _schema_ready.add(engine)
+
+
+def shift_of(ts: float) -> str:
+    """Shift bucket for a timestamp, in local time: morning / afternoon / evening."""
+    dt = datetime.fromtimestamp(ts)
+    if dt.hour < 12:
+        part = "morning"
+    elif dt.hour < 17:
+        part = "afternoon"
+    else:
+        part = "evening"
+    return f"{dt:%Y-%m-%d} {part}"
+
+
+async def record_change(
+    conn,
+    site_id: str,
+    item_key: str,
+    item: str,
+    food_group: str | None,
+    new_status: str,
+    changed_at: float | None = None,
+    quantity: int | None = None,
+) -> dict:
+    """
+    Append one inventory write and fold it into the aggregates.
+
+    Meant to run inside a WriteQueue job (so `conn` is already in a
+    transaction). Returns the logged change; its "seq" is the log position.
+    """
+    at = changed_at if changed_at is not None else time.time()
+    shift = shift_of(at)
+
+    row = (
+        await conn.execute(
+            text(
+                "SELECT last_status, changes, stockouts, out_since, out_seconds "
+                "FROM inventory_item_stats WHERE site_id = :site AND item_key = :k"
+            ),
+            {"site": site_id, "k": item_key},
+        )
+    ).first()
+    old_status = row.last_status if row else DEFAULT_STATUS
+    changes = row.changes if row else 0
+    stockouts = row.stockouts if row else 0
+    out_since = row.out_since if row else None
+    out_seconds = row.out_seconds if row else 0.0
+
+    transition = new_status != old_status
+    went_out = transition and new_status == OUT_OF_STOCK
+    came_back = transition and old_status == OUT_OF_STOCK
+    closed_out_seconds = 0.0
+
+    if transition:
+        changes += 1
+    if went_out:
+        stockouts += 1
+        out_since = at
+    if came_back and out_since is not None:
+        closed_out_seconds = max(0.0, at - out_since)
+        out_seconds += closed_out_seconds
+        out_since = None
+
+    result = await conn.execute(
+        text(
+            "INSERT INTO inventory_log "
+            "(site_id, item_key, item, food_group, old_status, new_status, changed_at, shift, quantity) "
+            "VALUES (:site, :k, :item, :g, :old, :new, :at, :shift, :qty)"
+        ),
+        {"site": site_id, "k": item_key, "item": item, "g": food_group, "old": old_status,
+         "new": new_status, "at": at, "shift": shift, "qty": quantity},
+    )
+    await conn.execute(
+        text(
+            "INSERT OR REPLACE INTO inventory_item_stats "
+            "(site_id, item_key, item, food_group, last_status, last_changed_at, "
+            " changes, stockouts, out_since, out_seconds) "
+            "VALUES (:site, :k, :item, :g, :status, :at, :changes, :stockouts, :out_since, :out_seconds)"
+        ),
+        {"site": site_id, "k": item_key, "item": item, "g": food_group, "status": new_status, "at": at,
+         "changes": changes, "stockouts": stockouts, "out_since": out_since,
+         "out_seconds": out_seconds},
+    )
+    if food_group and (went_out or closed_out_seconds):
+        await conn.execute(
+            text(
+                "INSERT INTO inventory_group_stats (site_id, food_group, stockouts, out_seconds) "
+                "VALUES (:site, :g, :so, :secs) "
+                "ON CONFLICT(site_id, food_group) DO UPDATE SET "
+                "stockouts = stockouts + :so, out_seconds = out_seconds + :secs"
+            ),
+            {"site": site_id, "g": food_group, "so": int(went_out), "secs": closed_out_seconds},
+        )
+    if transition:
+        await conn.execute(
+            text(
+                "INSERT INTO inventory_shift_stats (site_id, shift, started_at, stockouts, changes) "
+                "VALUES (:site, :shift, :at, :so, 1) "
+                "ON CONFLICT(site_id, shift) DO UPDATE SET "
+                "stockouts = stockouts + :so, changes = changes + 1"
+            ),
+            {"site": site_id, "shift": shift, "at": at, "so": int(went_out)},
+        )
+
+    return {"seq": result.lastrowid, "item": item, "old_status": old_status,
+            "new_status": new_status, "changed_at": at, "shift": shift, "quantity": quantity}
+
+
+async def read_analytics(conn, site_id: str, top: int = 10, shifts: int = 14, now: float | None = None) -> dict:
+    """
+    Stockout analytics from the aggregate tables.
+
+    Time-in-Out includes the still-open interval of items that are Out right now.
+    """
+    now = now if now is not None else time.time()
+    items = []
+    open_by_group: dict[str, float] = {}
+    rows = (
+        await conn.execute(
+            text(
+                "SELECT item, food_group, last_status, changes, stockouts, out_since, out_seconds "
+                "FROM inventory_item_stats WHERE site_id = :site"
+            ),
+            {"site": site_id},
+        )
+    ).all()
+    for r in rows:
+        open_seconds = max(0.0, now - r.out_since) if r.out_since is not None else 0.0
+        if open_seconds and r.food_group:
+            open_by_group[r.food_group] = open_by_group.get(r.food_group, 0.0) + open_seconds
+        items.append({
+            "item": r.item,
+            "food_group": r.food_group,
+            "status": r.last_status,
+            "stockouts": r.stockouts,
+            "changes": r.changes,
+            "out_hours": round((r.out_seconds + open_seconds) / 3600, 2),
+        })
+
+    group_rows = (
+        await conn.execute(
+            text("SELECT food_group, stockouts, out_seconds FROM inventory_group_stats "
+                 "WHERE site_id = :site"),
+            {"site": site_id},
+        )
+    ).all()
+    groups = {g.food_group: [g.stockouts, g.out_seconds] for g in group_rows}
+    # open intervals are only added to the group totals once they close
+    for group, seconds in open_by_group.items():
+        groups.setdefault(group, [0, 0.0])[1] += seconds
+
+    shift_rows = (
+        await conn.execute(
+            text("SELECT shift, stockouts, changes FROM inventory_shift_stats "
+                 "WHERE site_id = :site ORDER BY started_at DESC LIMIT :n"),
+            {"site": site_id, "n": shifts},
+        )
+    ).all()
+
+    return {
+        "currently_out": [it["item"] for it in items if it["status"] == OUT_OF_STOCK],
+        "time_out_by_item": [
+            it for it in sorted(items, key=lambda it: -it["out_hours"])[:top] if it["out_hours"] > 0
+        ],
+        "time_out_by_group": sorted(
+            (
+                {"food_group": g, "stockouts": so, "out_hours": round(secs / 3600, 2)}
+                for g, (so, secs) in groups.items()
+            ),
+            key=lambda r: -r["out_hours"],
+        ),
+        "stockouts_by_shift": [dict(r._mapping) for r in shift_rows],
+        "most_volatile": [
+            it for it in sorted(items, key=lambda it: -it["changes"])[:top] if it["changes"] > 0
+        ],
+    }
+
+
+async def read_item_history(conn, site_id: str, item_key: str, limit: int = 50) -> list[dict]:
+    """Most recent log entries for one item (uses the (site_id, item_key, seq) index)."""
+    rows = (
+        await conn.execute(
+            text(
+                "SELECT item, old_status, new_status, quantity, changed_at, shift FROM inventory_log "
+                "WHERE site_id = :site AND item_key = :k ORDER BY seq DESC LIMIT :n"
+            ),
+            {"site": site_id, "k": item_key, "n": limit},
+        )
+    ).all()
+    return [dict(r._mapping) for r in rows]
+# ----------------- END FILE -----------------
@@ -0,0 +1,308 @@
+# pantry_inventory.py
+# ---------------- BEGIN FILE -----------------
+"""
+Current inventory, one row per item, in the pantry database.
+
+Every write goes through apply_changes(), which appends to the history log
+(pantry_history) and stamps the item with the log's sequence number. That
+sequence doubles as the inventory version: "what changed since N?" is an
+indexed range scan on inventory_items.version.
+
+Items may also carry a count. Counted items get their status from it
+(Out at 0, Low at or below a threshold) and change only through guarded
+UPDATEs, so concurrent allocations can never take stock below zero. A
+manual status write on a counted item stops counting it (the count is
+cleared), so a row never shows a status its count contradicts.
+
+Rows are keyed by (site_id, item_key), one partition per pantry site.
+Every write also bumps the site's "inventory" cache generation (see
+pantry_cache), so other worker processes drop their cached reads.
+All functions take an open SQLAlchemy async connection and the site id;
+writes are meant to run as WriteQueue jobs so a chunk of changes commits as
+one transaction.
+"""
+import os
+import weakref
+
+from sqlalchemy import bindparam, text
+
+from pantry_cache import bump_generation, ensure_generation_table
+from pantry_history import DEFAULT_STATUS, OUT_OF_STOCK, ensure_history_tables, record_change
+from pantry_storage import add_missing_columns
+
+CACHE_SCOPE = "inventory"
+
+# Counted items at or below this many units show as Low (per-item low_at overrides)
+LOW_STOCK_AT = int(os.getenv("PANTRY_LOW_STOCK_AT", "5"))
+
+_TABLE = """
+    CREATE TABLE IF NOT EXISTS inventory_items (
+        site_id TEXT NOT NULL,
+        item_key TEXT NOT NULL,
+        item TEXT NOT NULL,
+        food_group TEXT,
+        status TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        quantity INTEGER,
+        low_at INTEGER,
+        PRIMARY KEY (site_id, item_key)
+    )
+    """
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_inventory_items_version ON inventory_items (site_id, version)",
+]
+
+_schema_ready: "weakref.WeakSet" = weakref.WeakSet()
+
+
+async def ensure_inventory_tables(engine) -> None:
+    """Create inventory + history tables once per engine (idempotent)."""
+    if engine in _schema_ready:
+        return
+    await ensure_history_tables(engine)
+    async with engine.begin() as conn:
+        await conn.execute(text(_TABLE))
+        # NULL quantity = status-only item (not counted)
+        await add_missing_columns(
+            conn, "inventory_items", {"quantity": "INTEGER", "low_at": "INTEGER"}
+        )
+        for ddl in _INDEXES:
+            await conn.execute(text(ddl))
+        await ensure_generation_table(conn)
+    _schema_ready.add(engine)
+
+
+class InsufficientStockError(ValueError):
+    """An allocation asked for more units than are on the shelf."""
+
+    def __init__(self, item: str, available: int, requested: int):
+        super().__init__(f"only {available} {item} left, {requested} requested")
+        self.item = item
+        self.available = available
+        self.requested = requested
+
+
+def status_for_quantity(quantity: int, low_at: int | None = None) -> str:
+    if quantity <= 0:
+        return OUT_OF_STOCK
+    if quantity <= (LOW_STOCK_AT if low_at is None else low_at):
+        return "Low"
+    return DEFAULT_STATUS
+
+
+async def _write_item(conn, site_id: str, change: dict, status: str, quantity: int | None,
+                      low_at: int | None = None, clear_quantity: bool = False) -> dict:
+    """
+    Log one write and upsert the item row; quantity / low_at None keep the
+    stored value, unless clear_quantity (the item stops being counted).
+    """
+    entry = await record_change(
+        conn,
+        site_id,
+        change["item_key"],
+        change["item"],
+        change["food_group"],
+        status,
+        quantity=quantity,
+    )
+    await conn.execute(
+        text(
+            "INSERT INTO inventory_items "
+            "(site_id, item_key, item, food_group, status, version, updated_at, quantity, low_at) "
+            "VALUES (:site, :k, :item, :g, :status, :v, :at, :qty, :low_at) "
+            "ON CONFLICT(site_id, item_key) DO UPDATE SET "
+            "item = excluded.item, food_group = excluded.food_group, "
+            "status = excluded.status, version = excluded.version, "
+            "updated_at = excluded.updated_at, "
+            "quantity = CASE WHEN :clear THEN NULL ELSE COALESCE(excluded.quantity, quantity) END, "
+            "low_at = COALESCE(excluded.low_at, low_at)"
+        ),
+        {"site": site_id, "k": change["item_key"], "item": change["item"],
+         "g": change["food_group"], "status": status, "v": entry["seq"], "at": entry["changed_at"],
+         "qty": quantity, "low_at": low_at, "clear": clear_quantity},
+    )
+    return {**entry, "version": entry["seq"]}
+
+
+async def _stock_row(conn, site_id: str, item_key: str):
+    return (
+        await conn.execute(
+            text("SELECT quantity, low_at FROM inventory_items "
+                 "WHERE site_id = :site AND item_key = :k"),
+            {"site": site_id, "k": item_key},
+        )
+    ).first()
+
+
+async def apply_changes(conn, site_id: str, changes: list[dict]) -> list[dict]:
+    """
+    Apply writes in order, inside the caller's transaction.
+
+    Each change is {"item_key", "item", "food_group", "status"} plus optional
+    "quantity" / "low_at". A status of None means "derive it from the count";
+    a status without a quantity clears the count (a manual status wins).
+    Returns the logged changes (with their "version").
+    """
+    logged = []
+    for change in changes:
+        quantity = change.get("quantity")
+        low_at = change.get("low_at")
+        status = change["status"]
+        if status is None:
+            row = await _stock_row(conn, site_id, change["item_key"])
+            count = quantity if quantity is not None else (row.quantity if row else None)
+            if count is None:
+                raise ValueError(f"{change['item']} has no count to derive a status from")
+            threshold = low_at if low_at is not None else (row.low_at if row else None)
+            status = status_for_quantity(count, threshold)
+        clear = change["status"] is not None and quantity is None
+        logged.append(
+            await _write_item(conn, site_id, change, status, quantity, low_at, clear_quantity=clear)
+        )
+    if logged:
+        await bump_generation(conn, CACHE_SCOPE, site_id)
+    return logged
+
+
+async def adjust_quantities(conn, site_id: str, changes: list[dict]) -> list[dict]:
+    """
+    Add each change's "delta" to its item's count, all or nothing.
+
+    The guarded UPDATE makes each step atomic even outside the write queue;
+    an allocation larger than the shelf raises InsufficientStockError, which
+    rolls back the caller's whole transaction. Restocking an uncounted item
+    starts its count; allocating from one changes nothing (there is no count).
+    Returns one {"item", "quantity", "status", "version"} per change.
+    """
+    results = []
+    for change in changes:
+        delta = int(change["delta"])
+        row = (
+            await conn.execute(
+                text(
+                    "UPDATE inventory_items SET quantity = quantity + :d "
+                    "WHERE site_id = :site AND item_key = :k "
+                    "AND quantity IS NOT NULL AND quantity + :d >= 0 "
+                    "RETURNING quantity, low_at"
+                ),
+                {"site": site_id, "k": change["item_key"], "d": delta},
+            )
+        ).first()
+        if row is None:
+            current = await _stock_row(conn, site_id, change["item_key"])
+            if current is not None and current.quantity is not None:
+                raise InsufficientStockError(change["item"], current.quantity, -delta)
+            if delta <= 0:
+                results.append({"item": change["item"], "quantity": None,
+                                "status": None, "version": None})
+                continue
+            quantity, low_at = delta, current.low_at if current else None
+        else:
+            quantity, low_at = row.quantity, row.low_at
+        status = status_for_quantity(quantity, low_at)
+        entry = await _write_item(conn, site_id, change, status, quantity)
+        results.append({"item": change["item"], "quantity": quantity,
+                        "status": status, "version": entry["version"]})
+    if any(r["version"] is not None for r in results):
+        await bump_generation(conn, CACHE_SCOPE, site_id)
+    return results
+
+
+async def read_statuses(conn, site_id: str, item_keys: list[str]) -> dict[str, str]:
+    """Status per key in one query; unknown items default to "In Stock"."""
+    if not item_keys:
+        return {}
+    stmt = text(
+        "SELECT item_key, status FROM inventory_items WHERE site_id = :site AND item_key IN :keys"
+    ).bindparams(bindparam("keys", expanding=True))
+    rows = (await conn.execute(stmt, {"site": site_id, "keys": list(item_keys)})).all()
+    found = {r.item_key: r.status for r in rows}
+    return {k: found.get(k, DEFAULT_STATUS) for k in item_keys}
+
+
+async def read_stock_levels(conn, site_id: str, item_keys: list[str]) -> dict[str, dict]:
+    """{"status", "quantity"} per key in one query; quantity None = not counted."""
+    if not item_keys:
+        return {}
+    stmt = text(
+        "SELECT item_key, status, quantity FROM inventory_items "
+        "WHERE site_id = :site AND item_key IN :keys"
+    ).bindparams(bindparam("keys", expanding=True))
+    rows = (await conn.execute(stmt, {"site": site_id, "keys": list(item_keys)})).all()
+    found = {r.item_key: {"status": r.status, "quantity": r.quantity} for r in rows}
+    return {k: found.get(k, {"status": DEFAULT_STATUS, "quantity": None}) for k in item_keys}
+
+
+async def read_all(conn, site_id: str) -> list[dict]:
+    rows = (
+        await conn.execute(
+            text(
+                "SELECT item_key, item, food_group, status, quantity, low_at, version "
+                "FROM inventory_items WHERE site_id = :site"
+            ),
+            {"site": site_id},
+        )
+    ).all()
+    return [dict(r._mapping) for r in rows]
+
+
+_ROW_COLUMNS = "item_key, item, food_group, status, quantity, low_at, version"
+
+
+async def read_items(conn, site_id: str, item_keys: list[str]) -> dict[str, dict]:
+    """Full rows of the given keys in one query; keys never written are absent."""
+    if not item_keys:
+        return {}
+    stmt = text(
+        f"SELECT {_ROW_COLUMNS} FROM inventory_items WHERE site_id = :site AND item_key IN :keys"
+    ).bindparams(bindparam("keys", expanding=True))
+    rows = (await conn.execute(stmt, {"site": site_id, "keys": list(item_keys)})).all()
+    return {r.item_key: dict(r._mapping) for r in rows}
+
+
+async def read_page(conn, site_id: str, after_key: str = "", limit: int = 500) -> list[dict]:
+    """Up to `limit` rows with item_key > after_key, in key order (a primary-key range scan)."""
+    rows = (
+        await conn.execute(
+            text(
+                f"SELECT {_ROW_COLUMNS} FROM inventory_items "
+                "WHERE site_id = :site AND item_key > :after ORDER BY item_key LIMIT :n"
+            ),
+            {"site": site_id, "after": after_key, "n": limit},
+        )
+    ).all()
+    return [dict(r._mapping) for r in rows]
+
+
+async def current_version(conn, site_id: str) -> int:
+    return (
+        await conn.execute(
+            text("SELECT COALESCE(MAX(version), 0) FROM inventory_items WHERE site_id = :site"),
+            {"site": site_id},
+        )
+    ).scalar_one()
+
+
+async def read_changes_since(conn, site_id: str, version: int) -> list[dict]:
+    """Items whose latest write is newer than `version`, oldest first."""
+    rows = (
+        await conn.execute(
+            text(
+                "SELECT item, food_group, status, quantity, version FROM inventory_items "
+                "WHERE site_id = :site AND version > :v ORDER BY version"
+            ),
+            {"site": site_id, "v": version},
+        )
+    ).all()
+    return [dict(r._mapping) for r in rows]
+
+
+async def is_empty(conn, site_id: str) -> bool:
+    return (
+        await conn.execute(
+            text("SELECT 1 FROM inventory_items WHERE site_id = :site LIMIT 1"), {"site": site_id}
+        )
+    ).first() is None
+# ----------------- END FILE -----------------
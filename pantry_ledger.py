@@ -0,0 +1,288 @@
+# pantry_ledger.py
+# ---------------- BEGIN FILE -----------------
+"""
+Household visit ledger: who came on which day, which category trades they
+were granted and what they took home.
+
+- household_visits       one row per (site, household, visit date); the
+                         primary key is the lookup index, so "has this family
+                         already traded today?" is one B-tree probe at any
+                         ledger size
+- household_trades       every adjudicated trade (approved or not)
+- household_allocations  units handed out per visit
+
+The trade limit is checked BEFORE the model is asked, and re-checked inside
+the write that grants the trade, so two desks cannot both grant one family's
+only trade.
+
+Every write bumps the site's "ledger" cache generation (see pantry_cache).
+
+Each pantry site keeps its own ledger (site_id leads every key). All
+functions take an open SQLAlchemy async connection and the site id; writes
+are meant to run as WriteQueue jobs.
+"""
+import os
+import re
+import time
+import weakref
+from datetime import date
+
+from sqlalchemy import text
+
+from pantry_cache import bump_generation, ensure_generation_table
+
+# "Only one category trade per family" (per visit day)
+TRADES_PER_VISIT = int(os.getenv("PANTRY_TRADES_PER_VISIT", "1"))
+
+CACHE_SCOPE = "ledger"
+
+APPROVED = "APPROVED"
+DECLINED = "DECLINED"
+UNKNOWN = "UNKNOWN"
+
+# The adjudicator must open with "APPROVED – ..." or "DECLINED – ..."; allow
+# markdown emphasis / emoji and a "Decision:" label in front of the word
+_DECISION_LINE = re.compile(
+    r"^[\W_]*(?:decision\W*)?(APPROVED|DECLINED)\b", re.IGNORECASE
+)
+
+_TABLES = {
+    "household_visits": """
+    CREATE TABLE IF NOT EXISTS household_visits (
+        site_id TEXT NOT NULL,
+        household_id TEXT NOT NULL,
+        visit_date TEXT NOT NULL,
+        family_size INTEGER,
+        trades_granted INTEGER NOT NULL DEFAULT 0,
+        first_at REAL NOT NULL,
+        last_at REAL NOT NULL,
+        PRIMARY KEY (site_id, household_id, visit_date)
+    )
+    """,
+    "household_trades": """
+    CREATE TABLE IF NOT EXISTS household_trades (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        site_id TEXT NOT NULL,
+        household_id TEXT NOT NULL,
+        visit_date TEXT NOT NULL,
+        from_item TEXT,
+        from_group TEXT,
+        to_item TEXT,
+        to_group TEXT,
+        decision TEXT NOT NULL,
+        decided_at REAL NOT NULL
+    )
+    """,
+    "household_allocations": """
+    CREATE TABLE IF NOT EXISTS household_allocations (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        site_id TEXT NOT NULL,
+        household_id TEXT NOT NULL,
+        visit_date TEXT NOT NULL,
+        item TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        allocated_at REAL NOT NULL
+    )
+    """,
+}
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_household_trades_visit "
+    "ON household_trades (site_id, household_id, visit_date)",
+    "CREATE INDEX IF NOT EXISTS ix_household_allocations_visit "
+    "ON household_allocations (site_id, household_id, visit_date)",
+]
+
+_schema_ready: "weakref.WeakSet" = weakref.WeakSet()
+
+
+class TradeLimitError(ValueError):
+    """The household already used its category trade(s) for this visit."""
+
+    def __init__(self, household_id: str, visit_date: str, granted: int):
+        super().__init__(
+            f"household {household_id} already has {granted} trade(s) on {visit_date}"
+        )
+        self.household_id = household_id
+        self.visit_date = visit_date
+        self.granted = granted
+
+
+async def ensure_ledger_tables(engine) -> None:
+    """Create the ledger tables once per engine (idempotent)."""
+    if engine in _schema_ready:
+        return
+    async with engine.begin() as conn:
+        for ddl in _TABLES.values():
+            await conn.execute(text(ddl))
+        for ddl in _INDEXES:
+            await conn.execute(text(ddl))
+        await ensure_generation_table(conn)
+    _schema_ready.add(engine)
+
+
+def normalize_household_id(household_id: str) -> str:
+    """Card numbers are typed by hand: ignore case and surrounding spaces."""
+    return str(household_id).strip().upper()
+
+
+def today() -> str:
+    return date.today().isoformat()
+
+
+def classify_decision(answer: str | None) -> str:
+    """
+    APPROVED / DECLINED from the reply's leading decision word, else UNKNOWN.
+
+    The rest of the reply is never searched: "APPROVED – you cannot exceed
+    one trade" is a grant. An UNKNOWN reply is logged but grants nothing.
+    """
+    match = _DECISION_LINE.match(answer or "")
+    return match.group(1).upper() if match else UNKNOWN
+
+
+# ---------- READS ----------
+
+async def trades_granted(conn, site_id: str, household_id: str, visit_date: str) -> int:
+    """Trades already granted on this visit (primary-key lookup)."""
+    row = (
+        await conn.execute(
+            text(
+                "SELECT trades_granted FROM household_visits "
+                "WHERE site_id = :site AND household_id = :h AND visit_date = :d"
+            ),
+            {"site": site_id, "h": household_id, "d": visit_date},
+        )
+    ).first()
+    return row.trades_granted if row else 0
+
+
+async def read_visit(conn, site_id: str, household_id: str, visit_date: str) -> dict:
+    """One visit: trades and allocations so far (all index range scans)."""
+    visit = (
+        await conn.execute(
+            text(
+                "SELECT family_size, trades_granted, first_at, last_at FROM household_visits "
+                "WHERE site_id = :site AND household_id = :h AND visit_date = :d"
+            ),
+            {"site": site_id, "h": household_id, "d": visit_date},
+        )
+    ).first()
+    trades = (
+        await conn.execute(
+            text(
+                "SELECT from_item, from_group, to_item, to_group, decision, decided_at "
+                "FROM household_trades "
+                "WHERE site_id = :site AND household_id = :h AND visit_date = :d ORDER BY seq"
+            ),
+            {"site": site_id, "h": household_id, "d": visit_date},
+        )
+    ).all()
+    allocations = (
+        await conn.execute(
+            text(
+                "SELECT item, SUM(quantity) AS quantity FROM household_allocations "
+                "WHERE site_id = :site AND household_id = :h AND visit_date = :d "
+                "GROUP BY item ORDER BY item"
+            ),
+            {"site": site_id, "h": household_id, "d": visit_date},
+        )
+    ).all()
+    return {
+        "household_id": household_id,
+        "visit_date": visit_date,
+        "family_size": visit.family_size if visit else None,
+        "trades_granted": visit.trades_granted if visit else 0,
+        "trades_left": max(0, TRADES_PER_VISIT - (visit.trades_granted if visit else 0)),
+        "trades": [dict(r._mapping) for r in trades],
+        "allocations": {r.item: r.quantity for r in allocations},
+    }
+
+
+async def count_visits(conn, site_id: str, household_id: str) -> int:
+    """Visits on record for a household (range scan on the primary key prefix)."""
+    return (
+        await conn.execute(
+            text("SELECT COUNT(*) FROM household_visits WHERE site_id = :site AND household_id = :h"),
+            {"site": site_id, "h": household_id},
+        )
+    ).scalar_one()
+
+
+# ---------- WRITES ----------
+
+async def record_visit(
+    conn, site_id: str, household_id: str, visit_date: str, family_size: int | None = None
+) -> None:
+    now = time.time()
+    await conn.execute(
+        text(
+            "INSERT INTO household_visits "
+            "(site_id, household_id, visit_date, family_size, trades_granted, first_at, last_at) "
+            "VALUES (:site, :h, :d, :size, 0, :now, :now) "
+            "ON CONFLICT(site_id, household_id, visit_date) DO UPDATE SET "
+            "family_size = COALESCE(excluded.family_size, family_size), last_at = excluded.last_at"
+        ),
+        {"site": site_id, "h": household_id, "d": visit_date, "size": family_size, "now": now},
+    )
+    await bump_generation(conn, CACHE_SCOPE, site_id)
+
+
+async def record_trade(
+    conn,
+    site_id: str,
+    household_id: str,
+    visit_date: str,
+    trade: dict,
+    decision: str,
+    family_size: int | None = None,
+) -> int:
+    """
+    Log one adjudicated trade; an APPROVED one also uses up the visit's allowance.
+
+    `trade` holds from_item / from_group / to_item / to_group. Raises
+    TradeLimitError (and writes nothing) if the allowance is already used.
+    Returns the trades granted on this visit afterwards.
+    """
+    await record_visit(conn, site_id, household_id, visit_date, family_size)
+    granted = await trades_granted(conn, site_id, household_id, visit_date)
+    if decision == APPROVED:
+        if granted >= TRADES_PER_VISIT:
+            raise TradeLimitError(household_id, visit_date, granted)
+        await conn.execute(
+            text(
+                "UPDATE household_visits SET trades_granted = trades_granted + 1 "
+                "WHERE site_id = :site AND household_id = :h AND visit_date = :d"
+            ),
+            {"site": site_id, "h": household_id, "d": visit_date},
+        )
+        granted += 1
+    await conn.execute(
+        text(
+            "INSERT INTO household_trades "
+            "(site_id, household_id, visit_date, from_item, from_group, to_item, to_group, "
+            " decision, decided_at) "
+            "VALUES (:site, :h, :d, :fi, :fg, :ti, :tg, :decision, :at)"
+        ),
+        {"site": site_id, "h": household_id, "d": visit_date, "fi": trade.get("from_item"),
+         "fg": trade.get("from_group"), "ti": trade.get("to_item"), "tg": trade.get("to_group"),
+         "decision": decision, "at": time.time()},
+    )
+    return granted
+
+
+async def record_allocations(
+    conn, site_id: str, household_id: str, visit_date: str, counts: dict[str, int]
+) -> None:
+    await record_visit(conn, site_id, household_id, visit_date)
+    now = time.time()
+    for item, quantity in counts.items():
+        await conn.execute(
+            text(
+                "INSERT INTO household_allocations "
+                "(site_id, household_id, visit_date, item, quantity, allocated_at) "
+                "VALUES (:site, :h, :d, :item, :qty, :at)"
+            ),
+            {"site": site_id, "h": household_id, "d": visit_date, "item": item, "qty": quantity, "at": now},
+        )
+# ----------------- END FILE -----------------
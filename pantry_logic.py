@@ -1,18 +1,95 @@
 # pantry_logic.py
 # ---------------- BEGIN FILE -----------------
+import io
 import os
+import re
+import time
 import uuid
 import asyncio
+import weakref
+import threading
+import tempfile
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from google.genai import types
 from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.runners import Runner
-from google.adk.sessions import DatabaseSessionService
+from google.adk.sessions.base_session_service import GetSessionConfig
 from google.adk.tools import AgentTool, ToolContext, FunctionTool
 from google.adk.code_executors import BuiltInCodeExecutor
+from google.adk.errors.already_exists_error import AlreadyExistsError
 from google.adk.apps.app import App, ResumabilityConfig
 
+from pantry_model import (
+    ModelUnavailableError,
+    PantryGemini,
+    PRIORITY_SERVICE_DESK,
+    PRIORITY_DONATION,
+    PRIORITY_INVENTORY,
+    breaker_status,
+    limiter_metrics,
+    model_priority,
+    response_cache_metrics,
+    run_with_deadline,
+)
+from pantry_catalog import (
+    GROUP_TO_ITEMS,
+    ITEM_TO_GROUP,
+    OTHER_ITEM,
+    AmbiguousItemError,
+    ambiguous_items,
+    canonical_name,
+    check_unambiguous,
+    group_of,
+    item_key,
+    point_allowances,
+)
+from pantry_cache import GenerationCache, GenerationWatcher
+from pantry_donations import (
+    ensure_donation_tables,
+    read_pending_donation,
+    save_pending_donation,
+    take_pending_donation,
+)
+from pantry_history import read_analytics, read_item_history
+from pantry_inventory import (
+    CACHE_SCOPE as INVENTORY_SCOPE,
+    adjust_quantities,
+    apply_changes,
+    ensure_inventory_tables,
+    is_empty,
+    read_all,
+    read_changes_since,
+    read_items,
+    read_page,
+    read_statuses,
+    read_stock_levels,
+)
+from pantry_ledger import (
+    CACHE_SCOPE as LEDGER_SCOPE,
+    TRADES_PER_VISIT,
+    TradeLimitError,
+    classify_decision,
+    count_visits,
+    ensure_ledger_tables,
+    normalize_household_id,
+    read_visit,
+    record_allocations,
+    record_trade,
+    today,
+    trades_granted,
+)
+from pantry_manifest import (
+    MAX_REPORTED_ERRORS,
+    ManifestRowError,
+    aiter_export_lines,
+    iter_valid_rows,
+)
+from pantry_sites import DEFAULT_SITE, current_site, site_settings
+from pantry_storage import PantrySessionService, ensure_sqlite_file
+
 # If running inside Streamlit, please prefer st.secrets as a fallback for env var
 try:
     import streamlit as _st
@@ -25,32 +102,40 @@ except Exception:
 
 # ---------- ASYNC LOOP HELPER (for Streamlit & sync code) ----------
 
+# One loop per process, running in its own thread: Streamlit runs every
+# browser session's script in a separate thread, and they all share the
+# runner, session service and write queue bound to this loop.
 _event_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
 
 
 def _get_event_loop():
-    """Get or create a global event loop that we reuse for all async calls."""
-    global _event_loop
-
-    if _event_loop is not None and not _event_loop.is_closed():
+    """Get (or start) the global event loop that runs all sync calls."""
+    global _event_loop, _loop_thread
+
+    with _loop_lock:
+        if _event_loop is None or _event_loop.is_closed():
+            _event_loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_event_loop.run_forever, name="pantry-event-loop", daemon=True
+            )
+            _loop_thread.start()
         return _event_loop
 
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_closed():
-            raise RuntimeError
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-    _event_loop = loop
-    return loop
-
 
 def run_sync(coro):
-    """Run an async coroutine from sync code using a persistent loop."""
+    """
+    Run an async coroutine from sync code on the shared loop; safe from any thread.
+
+    The coroutine runs in a copy of the caller's context, so the site and
+    desk selected by the caller apply to it.
+    """
     loop = _get_event_loop()
-    return loop.run_until_complete(coro)
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync() called from the event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
 
 
 # ---------- API KEY SETUP ----------
@@ -69,21 +154,97 @@ else:
 
 # ---------- MODEL CONFIG ----------
 
+# Applied by PantryGemini, not the SDK, so every retry waits for its own
+# token from the rate limiter and passes the circuit breaker
 retry_config = types.HttpRetryOptions(
     attempts=5,
     exp_base=7,
     initial_delay=1,
+    # cap each backoff; the breaker + REQUEST_DEADLINE_S bound the total
+    max_delay=8,
     http_status_codes=[429, 500, 503, 504],
 )
 
-model_config = Gemini(
+# Limit for one volunteer request (all agent hops + retries), counted from
+# when its model calls get quota tokens: time queued behind other desks and
+# for the session (see _run_once) does not count
+REQUEST_DEADLINE_S = float(os.getenv("PANTRY_REQUEST_DEADLINE_S", "45"))
+
+# Every agent uses a PantryGemini, so the priority rate limiter in
+# pantry_model sees all outbound model calls.
+model_config = PantryGemini(
+    model="gemini-2.5-flash-lite",
+    upstream_retry=retry_config,
+)
+
+# Donation routing runs inside whatever flow reached it (usually a desk
+# request), so its calls carry their own rate-limit class
+donation_model_config = PantryGemini(
     model="gemini-2.5-flash-lite",
-    retry_options=retry_config,
+    upstream_retry=retry_config,
+    priority=PRIORITY_DONATION,
 )
 
-# Use ONE shared session id so inventory + policy see the same state
+# Session for requests that name no desk (and the pre-desk session history)
 SESSION_ID_MAIN = "pantry_main_session"
 
+# runner.run_debug() files every session under this user id by default
+USER_ID_MAIN = "debug_user_id"
+
+
+# ---------- DESK SESSIONS ----------
+
+# Each desk (a Streamlit browser session, an API client sending X-Pantry-Desk,
+# a bench desk) talks to the coordinator in its own ADK session, so desks
+# never race on one session's history. Like the site, the desk travels in a
+# context variable; runs within one session are serialized (see _run_once).
+
+_DESK_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+_current_session: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "pantry_session", default=SESSION_ID_MAIN
+)
+
+
+def desk_session_id(desk_id: str | None) -> str:
+    """ADK session id of a desk; no desk means the shared main session."""
+    if desk_id is None or not str(desk_id).strip():
+        return SESSION_ID_MAIN
+    desk = str(desk_id).strip()
+    if not _DESK_ID_RE.match(desk):
+        raise ValueError(f"'{desk_id}' is not a valid desk id")
+    return f"desk:{desk}"
+
+
+def current_session() -> str:
+    return _current_session.get()
+
+
+@contextmanager
+def desk_scope(desk_id: str | None):
+    """Run the model requests inside this block in `desk_id`'s own session."""
+    token = _current_session.set(desk_session_id(desk_id))
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def set_desk(desk_id: str | None) -> str:
+    """Select the desk for the rest of the current context (e.g. one Streamlit run)."""
+    session_id = desk_session_id(desk_id)
+    _current_session.set(session_id)
+    return session_id
+
+
+def _site_user_id(site_id: str) -> str:
+    """
+    Sessions are partitioned by site through the ADK user id (part of the
+    sessions/events keys). The default site keeps the original id, so
+    single-pantry installs see their existing sessions.
+    """
+    return USER_ID_MAIN if site_id == DEFAULT_SITE else f"site:{site_id}"
+
 
 # ---------- GLOBAL DATA (PARTNER SHELTERS) ----------
 
@@ -140,18 +301,36 @@ PARTNER_SHELTERS = [
 
 # ---------- LOW-LEVEL TOOLS (functions) ----------
 
-def update_inventory(tool_context: ToolContext, item_name: str, status: str) -> str:
-    """Updates inventory status in Session State."""
-    key = f"inventory:{item_name.lower()}"
-    tool_context.state[key] = status
-    return f"✅ SYSTEM UPDATE: Inventory for '{item_name}' set to '{status}'."
+def _inventory_key(item_name: str) -> str:
+    """Key of an item's row in the inventory table (same for every spelling)."""
+    return item_key(item_name)
+
+
+async def update_inventory(item_name: str, status: str) -> str:
+    """Updates inventory status in the inventory table."""
+    try:
+        await _write_inventory([(item_name, status)])
+    except AmbiguousItemError as e:
+        return f"⚠️ NOT UPDATED: {e}. Ask the volunteer which item they mean."
+    return f"✅ SYSTEM UPDATE: Inventory for '{canonical_name(item_name)}' set to '{status}'."
+
+
+async def check_inventory(item_name: str) -> str:
+    """Checks inventory status (and count, if the item is counted) from the inventory table."""
+    candidates = ambiguous_items(item_name)
+    if candidates:
+        return (
+            f"STATUS CHECK: '{item_name}' could be {', '.join(candidates)}. "
+            "Ask the volunteer which item they mean."
+        )
+    stock = (await read_stock_async([item_name]))[item_name]
+    count = f" ({stock['quantity']} left)" if stock["quantity"] is not None else ""
+    return f"STATUS CHECK: {canonical_name(item_name)} is currently '{stock['status']}'{count}."
 
 
-def check_inventory(tool_context: ToolContext, item_name: str) -> str:
-    """Checks inventory status from Session State."""
-    key = f"inventory:{item_name.lower()}"
-    status = tool_context.state.get(key, "In Stock")
-    return f"STATUS CHECK: {item_name} is currently '{status}'."
+def _site_partners() -> list[dict]:
+    """Partner shelters of the current site (sites file), else the built-in list."""
+    return site_settings(current_site()).get("partners") or PARTNER_SHELTERS
 
 
 def find_donation_partner_safe(item_type: str, tool_context: ToolContext):
@@ -160,7 +339,7 @@ def find_donation_partner_safe(item_type: str, tool_context: ToolContext):
     Demonstrates long-running operations with pause/resume.
     """
     match = None
-    for p in PARTNER_SHELTERS:
+    for p in _site_partners():
         if any(keyword in item_type.lower() for keyword in p["accepts"]):
             match = p
             break
@@ -267,7 +446,7 @@ You decide if a requested substitution is fair and allowed, based on:
 - Family size
 - Food groups (Dairy, Protein, Grain, Canned Veg, Canned Fruit, Fresh Produce)
 - Allergies or dietary notes
-- Inventory (via tools)
+- Inventory (via tools, or the INVENTORY SNAPSHOT if one is provided)
 - Our fairness rules
 
 You have access to THREE tools:
@@ -275,16 +454,24 @@ You have access to THREE tools:
 - update_inventory(item_name, status)
 - check_inventory(item_name)
 
+If the request contains an "INVENTORY SNAPSHOT" block, it was read from the
+database just before the request was sent. Treat it as current and do NOT call
+check_inventory for any item listed there; only use the tool for items the
+snapshot does not cover.
+
 When you need numbers:
 - Group A categories (Canned Veg, Canned Fruit, Grain, Protein) get 2 points per person.
 - Group B categories (Dairy, Fresh Produce) get 1 point per person.
 - Use Point_Calculator for any multiplication or limit math.
+- If the request contains a "POINT ALLOWANCES" block, those numbers were already
+  computed from these rules: use them and do NOT call Point_Calculator for them.
 
 FAIRNESS RULES (short version):
 - Only one category trade per family.
 - Never move ALL items out of a category.
 - Keep destination category under ~2x its base allowance.
 - Respect inventory: if item or group is Low/Out, lean NO.
+- If a count is shown ("3 left"), never approve more units than are left.
 - Protein is most valuable: trades out of Protein should usually be 2:1.
 - Dairy → Protein is allowed at ~2 dairy : 1 protein, especially for lactose-intolerant families.
 - Never trade INTO Dairy for lactose-intolerant families.
@@ -308,7 +495,7 @@ When you respond:
 
 donation_logistics_agent = LlmAgent(
     name="Donation_Logistics",
-    model=model_config,
+    model=donation_model_config,
     instruction="""
 You are the Donation Logistics agent.
 
@@ -353,6 +540,8 @@ Routing rules:
   you MUST call Donation_Logistics and NOT answer directly.
 - If the message mentions "family size", "substitute", "allergy",
   or "trade X for Y", you MUST call Policy_Adjudicator.
+- If the message contains an "INVENTORY SNAPSHOT" block, pass it to
+  Policy_Adjudicator VERBATIM together with the request.
 - If the message is clearly about just marking an item In Stock / Low / Out,
   you MAY either:
      - call Inventory_Clerk, OR
@@ -361,6 +550,9 @@ Routing rules:
 Tone:
 - Calm, kind, practical.
 - Lead with the decision, then a short explanation.
+- When relaying Policy_Adjudicator's verdict, keep its first line
+  ("APPROVED – ..." / "DECLINED – ...") as the first line of your reply:
+  the visit ledger reads the decision from that word.
 """,
     tools=[
         # Specialist agents
@@ -394,42 +586,76 @@ else:
     DB_URL = f"sqlite+aiosqlite:////{DEFAULT_DB_PATH.lstrip('/')}"
 
 # Ensure the file & parent dir exist with writable permissions (best-effort)
-if DB_URL.startswith("sqlite"):
-    try:
-        # Extract absolute path (after sqlite+aiosqlite:////)
-        path = DB_URL.split(":", 2)[-1].lstrip("/")
-        path = "/" + path  # absolute path
-        parent = os.path.dirname(path)
-        if parent and not os.path.exists(parent):
-            os.makedirs(parent, exist_ok=True)
-        # Create file if missing
-        if not os.path.exists(path):
-            open(path, "a").close()
-            try:
-                os.chmod(path, 0o666)  # readable/writable by all users (best-effort)
-            except Exception:
-                # some hosts don't allow chmod; ignore
-                pass
-    except Exception:
-        # fall back silently; host may restrict filesystem ops
-        pass
+ensure_sqlite_file(DB_URL)
+
+# WAL + busy timeout + bounded pool; writes funnel through one writer queue
+session_service = PantrySessionService(DB_URL)
 
 runner = Runner(
     app=pantry_app,
-    session_service=DatabaseSessionService(
-        db_url=DB_URL,
-    ),
+    session_service=session_service,
 )
 
+# Hot inventory / ledger reads, kept coherent with other worker processes
+# through the cache_generations table (see pantry_cache)
+cache_watcher = GenerationWatcher(session_service.db_engine)
+READ_CACHE = GenerationCache()
+
 
 # ---------- HELPER: SINGLE TURN RUN ----------
 
-async def _run_once(message: str, session_id: str = SESSION_ID_MAIN) -> str:
+# (user id, session id) -> lock held while a run appends to that session
+_SESSION_LOCKS: "weakref.WeakValueDictionary[tuple[str, str], asyncio.Lock]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _session_lock(user_id: str, session_id: str) -> asyncio.Lock:
+    key = (user_id, session_id)
+    lock = _SESSION_LOCKS.get(key)
+    if lock is None:
+        lock = _SESSION_LOCKS[key] = asyncio.Lock()
+    return lock
+
+
+async def _run_in_session(message: str, user_id: str, session_id: str) -> list:
+    try:
+        return await runner.run_debug(message, user_id=user_id, session_id=session_id)
+    except AlreadyExistsError:
+        # another worker process created the session first; it exists now
+        return await runner.run_debug(message, user_id=user_id, session_id=session_id)
+
+
+async def _run_once(
+    message: str,
+    session_id: str | None = None,
+    priority: int = PRIORITY_INVENTORY,
+) -> str:
     """
     Sends a single message to the pantry app and returns the final text reply.
     Used by the UI-friendly wrapper functions.
+
+    Runs in `session_id` (default: the current desk's session). Runs in the
+    same session take turns, so two of them never append to one history at
+    once; runs in different sessions proceed in parallel.
+
+    `priority` decides how soon this run's model calls get rate-limit tokens.
+    Raises ModelUnavailableError if the circuit breaker is open or the run
+    exceeds REQUEST_DEADLINE_S (queue time excluded, see run_with_deadline).
     """
-    response_list = await runner.run_debug(message, session_id=session_id)
+    session_id = session_id or current_session()
+    user_id = _site_user_id(current_site())
+    async with _session_lock(user_id, session_id):
+        with model_priority(priority):
+            try:
+                response_list = await run_with_deadline(
+                    _run_in_session(message, user_id, session_id), REQUEST_DEADLINE_S
+                )
+            except asyncio.TimeoutError as e:
+                raise ModelUnavailableError(
+                    f"The AI assistant did not answer within {int(REQUEST_DEADLINE_S)} seconds. "
+                    "Please try again shortly."
+                ) from e
 
     final_answer = "NO RESPONSE"
     for event in reversed(response_list):
@@ -444,29 +670,126 @@ async def _run_once(message: str, session_id: str = SESSION_ID_MAIN) -> str:
     return final_answer
 
 
+# ---------- REQUEST COALESCING (single-flight + idempotency) ----------
+
+# (site, session, flow, normalized args) -> the task currently answering that request
+_INFLIGHT: dict[tuple, asyncio.Future] = {}
+
+# (site, idempotency key) -> (finished_at, result) for completed writes
+IDEMPOTENCY_TTL_SECONDS = 15 * 60
+IDEMPOTENCY_MAX_KEYS = 1024
+_IDEMPOTENT_RESULTS: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+
+COALESCE_STATS = {"launched": 0, "coalesced": 0, "idempotent_hits": 0}
+
+
+def _normalize_arg(value):
+    """Case/whitespace-insensitive form of an argument, so "milk " == "Milk"."""
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize_arg(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((_normalize_arg(k), _normalize_arg(v)) for k, v in value.items()))
+    return value
+
+
+async def _single_flight(flow: str, args: tuple, factory, session_id: str | None = None):
+    """
+    Run factory() once per (site, session, flow, normalized args).
+
+    Concurrent duplicates await the same task instead of launching their
+    own model call. The task is shielded so one caller giving up does not
+    cancel the answer for everyone else. The run lands in one session's
+    history (default: the current desk's), so only callers in that session
+    share it; two desks asking the same thing each get their own turn.
+    """
+    key = (current_site(), session_id or current_session(), flow, _normalize_arg(args))
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda t: _INFLIGHT.pop(key, None))
+        COALESCE_STATS["launched"] += 1
+    else:
+        COALESCE_STATS["coalesced"] += 1
+    return await asyncio.shield(task)
+
+
+def _idempotent_result(idempotency_key: str) -> str | None:
+    """Return the stored result for a completed write, if still fresh."""
+    key = (current_site(), idempotency_key)
+    entry = _IDEMPOTENT_RESULTS.get(key)
+    if entry is None:
+        return None
+    finished_at, result = entry
+    if time.monotonic() - finished_at > IDEMPOTENCY_TTL_SECONDS:
+        _IDEMPOTENT_RESULTS.pop(key, None)
+        return None
+    _IDEMPOTENT_RESULTS.move_to_end(key)
+    return result
+
+
+def _remember_result(idempotency_key: str, result: str) -> None:
+    key = (current_site(), idempotency_key)
+    _IDEMPOTENT_RESULTS[key] = (time.monotonic(), result)
+    _IDEMPOTENT_RESULTS.move_to_end(key)
+    while len(_IDEMPOTENT_RESULTS) > IDEMPOTENCY_MAX_KEYS:
+        _IDEMPOTENT_RESULTS.popitem(last=False)
+
+
 # ---------- INVENTORY HELPERS ----------
 
-async def update_item_status_async(item_name: str, status: str) -> str:
+async def update_item_status_async(
+    item_name: str, status: str, idempotency_key: str | None = None
+) -> str:
     """
-    Update inventory status for a particular item.
-    Uses a shared main session so state persists across checks & policy.
+    Update inventory status for a particular item, in the current desk's session.
+
+    Concurrent identical updates share one model call. If `idempotency_key`
+    is given, a repeat of an already-applied write returns the stored
+    result instead of running again.
     """
+    if idempotency_key:
+        cached = _idempotent_result(idempotency_key)
+        if cached is not None:
+            COALESCE_STATS["idempotent_hits"] += 1
+            return cached
+
     msg = f"Update status: {item_name} is {status}."
-    return await _run_once(msg, session_id=SESSION_ID_MAIN)
+    args = (idempotency_key,) if idempotency_key else (item_name, status)
+    result = await _single_flight(
+        "update_item_status",
+        args,
+        lambda: _run_once(msg, priority=PRIORITY_INVENTORY),
+    )
+
+    if idempotency_key:
+        _remember_result(idempotency_key, result)
+    return result
 
 
 async def check_item_status_async(item_name: str) -> str:
     """
-    Check inventory status for a particular item.
-    Uses the same main session as updates & policy.
+    Check inventory status for a particular item, in the current desk's session.
     """
     msg = f"Can I give {item_name}?"
-    return await _run_once(msg, session_id=SESSION_ID_MAIN)
+    return await _single_flight(
+        "check_item_status",
+        (item_name,),
+        lambda: _run_once(msg, priority=PRIORITY_SERVICE_DESK),
+    )
 
 
 # ---------- DONATION (HITL) HELPERS ----------
 
-DONATION_SESSIONS: dict[str, dict] = {}
+# Pending routes live in the pending_donations table (not in this process),
+# so any worker can confirm a route another worker started.
+
+async def _donation_engine():
+    engine = session_service.db_engine
+    await ensure_donation_tables(engine)
+    return engine
 
 
 async def start_donation_async(item_type: str) -> tuple[str, bool, str | None]:
@@ -479,7 +802,7 @@ async def start_donation_async(item_type: str) -> tuple[str, bool, str | None]:
     - If pending == True, token identifies the pending route so the
       UI can later approve/reject it via confirm_donation_async.
 
-    This uses the same PARTNER_SHELTERS and matching logic as
+    This uses the same partner list (the site's) and matching logic as
     find_donation_partner_safe, but does NOT depend on ADK's
     pause/resume machinery so the UI is stable.
     """
@@ -487,7 +810,7 @@ async def start_donation_async(item_type: str) -> tuple[str, bool, str | None]:
 
     # 1) Find a matching partner (same logic as the tool)
     match = None
-    for p in PARTNER_SHELTERS:
+    for p in _site_partners():
         if any(keyword in item_lower for keyword in p["accepts"]):
             match = p
             break
@@ -510,12 +833,15 @@ async def start_donation_async(item_type: str) -> tuple[str, bool, str | None]:
 
     # 3) Record a pending session for human approval
     token = uuid.uuid4().hex
-    DONATION_SESSIONS[token] = {
+    info = {
         "item_type": item_type,
         "partner_name": match["name"],
         "partner_status": match["status"],
         "partner_accepts": match["accepts"],
     }
+    await _donation_engine()
+    site = current_site()
+    await _submit_write(lambda conn: save_pending_donation(conn, site, token, info))
 
     return message, True, token
 
@@ -528,16 +854,17 @@ async def confirm_donation_async(token: str, approve: bool) -> str:
     The long-running pattern is still demonstrated inside the
     find_donation_partner_safe tool via tool_context.request_confirmation.
     """
-    info = DONATION_SESSIONS.get(token)
+    # Claim the route (delete + return in one statement): if two desks or
+    # workers confirm the same token, only one of them gets it
+    await _donation_engine()
+    site = current_site()
+    info = await _submit_write(lambda conn: take_pending_donation(conn, site, token))
     if not info:
         return "No pending donation request was found. Please start a new one."
 
     item = info["item_type"]
     name = info["partner_name"]
 
-    # Clean up the pending session now that a decision has been made
-    DONATION_SESSIONS.pop(token, None)
-
     if approve:
         return (
             f"I've recorded your approval. We'll send the information needed for "
@@ -550,20 +877,715 @@ async def confirm_donation_async(token: str, approve: bool) -> str:
         )
 
 
+async def has_pending_donation_async(token: str) -> bool:
+    """Whether `token` is a route of the current site still awaiting a decision."""
+    engine = await _donation_engine()
+    async with engine.connect() as conn:
+        return await read_pending_donation(conn, current_site(), token) is not None
+
+
+# ---------- INVENTORY STORE (inventory_items table + history log) ----------
+
+# Before the inventory table existed, statuses lived in the main session's
+# state under these keys; they are copied over once.
+LEGACY_STATE_PREFIX = "inventory:"
+_legacy_state_imported = False
+
+
+def _inventory_change(
+    item_name: str, status: str | None, quantity: int | None = None, strict: bool = True
+) -> dict:
+    """
+    Row change for one item. Raises AmbiguousItemError (strict) when the name
+    is a typo of several catalog items, so it is not filed under either one.
+    """
+    if strict:
+        check_unambiguous(item_name)
+    return {
+        "item_key": _inventory_key(item_name),
+        "item": canonical_name(item_name),
+        "food_group": group_of(item_name),
+        "status": status,
+        "quantity": quantity,
+    }
+
+
+async def _inventory_engine():
+    """The shared engine, with inventory tables created and legacy state imported."""
+    global _legacy_state_imported
+    engine = session_service.db_engine
+    await ensure_inventory_tables(engine)
+    if not _legacy_state_imported:
+        _legacy_state_imported = True
+        # pre-table inventory belonged to the single (default) site
+        async with engine.connect() as conn:
+            empty = await is_empty(conn, DEFAULT_SITE)
+        if empty:
+            state = await _read_state_async()
+            legacy = [
+                # stored as typed back then; keep them, even if ambiguous now
+                _inventory_change(key[len(LEGACY_STATE_PREFIX):], status, strict=False)
+                for key, status in state.items()
+                if key.startswith(LEGACY_STATE_PREFIX) and isinstance(status, str)
+            ]
+            if legacy:
+                await _submit_write(lambda conn: apply_changes(conn, DEFAULT_SITE, legacy))
+    return engine
+
+
+async def _ledger_engine():
+    """The shared engine, with the household ledger tables created."""
+    engine = session_service.db_engine
+    await ensure_ledger_tables(engine)
+    return engine
+
+
+async def _submit_write(job):
+    """Run a write job on the shared queue; this process's read cache sees it at once."""
+    try:
+        return await session_service.write_queue.submit(job)
+    finally:
+        cache_watcher.note_write()
+
+
+async def _cached_read(scope: str, key: tuple, read):
+    """
+    read() through READ_CACHE, for the current site.
+
+    Writes by other processes show up within PANTRY_CACHE_POLL_S; the
+    generation is taken before reading, so a racing write is never hidden.
+    """
+    site = current_site()
+    generation = await cache_watcher.generation(scope, site)
+    cache_key = (scope, site) + key
+    value = READ_CACHE.get(cache_key, generation)
+    if value is None:
+        value = await read()
+        READ_CACHE.put(cache_key, generation, value)
+    return value
+
+
+async def _write_inventory(changes: list[tuple[str, str]]) -> list[dict]:
+    """Apply (item, status) pairs as ONE transaction on the shared write queue."""
+    await _inventory_engine()
+    site = current_site()
+    rows = [_inventory_change(item, status) for item, status in changes]
+    return await _submit_write(lambda conn: apply_changes(conn, site, rows))
+
+
+async def _read_state_async(session_id: str = SESSION_ID_MAIN) -> dict:
+    """Session state only: one row read, the event history is skipped."""
+    session = await runner.session_service.get_session(
+        app_name=runner.app_name,
+        user_id=USER_ID_MAIN,
+        session_id=session_id,
+        config=GetSessionConfig(num_recent_events=0),
+    )
+    return dict(session.state) if session else {}
+
+
+# ---------- INVENTORY SNAPSHOT (batch read, no model call) ----------
+
+async def read_inventory_async(item_names: list[str]) -> dict[str, str]:
+    """
+    Read the status of several items in ONE query.
+
+    Items that were never updated default to "In Stock", same as check_inventory.
+    """
+    engine = await _inventory_engine()
+    keys = tuple(dict.fromkeys(_inventory_key(n) for n in item_names))
+
+    async def read():
+        async with engine.connect() as conn:
+            return await read_statuses(conn, current_site(), list(keys))
+
+    by_key = await _cached_read(INVENTORY_SCOPE, ("statuses", keys), read)
+    return {name: by_key[_inventory_key(name)] for name in item_names}
+
+
+async def read_stock_async(item_names: list[str]) -> dict[str, dict]:
+    """Like read_inventory_async, but {"status", "quantity"} per item (quantity None = not counted)."""
+    engine = await _inventory_engine()
+    keys = tuple(dict.fromkeys(_inventory_key(n) for n in item_names))
+
+    async def read():
+        async with engine.connect() as conn:
+            return await read_stock_levels(conn, current_site(), list(keys))
+
+    by_key = await _cached_read(INVENTORY_SCOPE, ("stock", keys), read)
+    return {name: by_key[_inventory_key(name)] for name in item_names}
+
+
+# ---------- STOCK COUNTS (atomic allocate / restock, derived status) ----------
+
+async def allocate_items_async(counts: dict[str, int], household_id: str | None = None) -> list[dict]:
+    """
+    Take units off the shelf for one basket, all or nothing.
+
+    Raises InsufficientStockError (nothing is taken) if any counted item is
+    short. Statuses follow the counts, so no manual flip is needed. With a
+    `household_id`, the basket is logged on today's visit in the same commit.
+    """
+    await _inventory_engine()
+    site = current_site()
+    rows = [
+        {**_inventory_change(item, None), "delta": -int(n)}
+        for item, n in counts.items() if int(n) > 0
+    ]
+
+    async def job(conn):
+        results = await adjust_quantities(conn, site, rows)
+        if household_id:
+            await record_allocations(
+                conn,
+                site,
+                normalize_household_id(household_id),
+                today(),
+                {row["item"]: -row["delta"] for row in rows},
+            )
+        return results
+
+    if household_id:
+        await _ledger_engine()
+    return await _submit_write(job)
+
+
+async def restock_item_async(item_name: str, count: int) -> dict:
+    """Add units to an item (starts counting it if it was status-only)."""
+    await _inventory_engine()
+    site = current_site()
+    rows = [{**_inventory_change(item_name, None), "delta": int(count)}]
+    return (await _submit_write(lambda conn: adjust_quantities(conn, site, rows)))[0]
+
+
+async def set_item_count_async(item_name: str, quantity: int, low_at: int | None = None) -> dict:
+    """Set an item's count (e.g. after a shelf recount) and optionally its Low threshold."""
+    await _inventory_engine()
+    site = current_site()
+    rows = [{**_inventory_change(item_name, None, int(quantity)), "low_at": low_at}]
+    logged = await _submit_write(lambda conn: apply_changes(conn, site, rows))
+    return {"item": rows[0]["item"], "quantity": int(quantity),
+            "status": logged[0]["new_status"], "version": logged[0]["version"]}
+
+
+# ---------- HOUSEHOLD LEDGER ----------
+
+async def household_visit_async(household_id: str, visit_date: str | None = None) -> dict:
+    """A household's trades and allocations on one visit (default today), plus its visit count."""
+    household_id = normalize_household_id(household_id)
+    visit_date = visit_date or today()
+    engine = await _ledger_engine()
+
+    async def read():
+        async with engine.connect() as conn:
+            visit = await read_visit(conn, current_site(), household_id, visit_date)
+            visit["visits"] = await count_visits(conn, current_site(), household_id)
+        return visit
+
+    return await _cached_read(LEDGER_SCOPE, ("visit", household_id, visit_date), read)
+
+
+# ---------- INVENTORY HISTORY (append-only log + stockout analytics) ----------
+
+async def inventory_analytics_async(top: int = 10) -> dict:
+    """
+    Stockout analytics for ordering decisions: time-in-Out per item & group,
+    stockouts per shift, most volatile items. Reads only small aggregate tables.
+    """
+    engine = await _inventory_engine()
+    async with engine.connect() as conn:
+        return await read_analytics(conn, current_site(), top=top)
+
+
+async def item_history_async(item_name: str, limit: int = 50) -> list[dict]:
+    """Most recent status changes for one item, newest first."""
+    engine = await _inventory_engine()
+    async with engine.connect() as conn:
+        return await read_item_history(
+            conn, current_site(), _inventory_key(item_name), limit=limit
+        )
+
+
+# ---------- SHELF BOARD (whole-pantry snapshot + change feed) ----------
+
+async def inventory_snapshot_async() -> dict:
+    """
+    Whole-pantry inventory in ONE read, no model call.
+
+    Returns {"version": N, "groups": {group: {item: status}}, "other": {item: status}}.
+    Every catalog item is listed (default "In Stock"); free-text items that
+    were updated but are not in the catalog land in "other".
+    """
+    engine = await _inventory_engine()
+
+    async def read():
+        async with engine.connect() as conn:
+            return await read_all(conn, current_site())
+
+    rows = await _cached_read(INVENTORY_SCOPE, ("all",), read)
+    stored = {r["item_key"]: r for r in rows}
+    groups = {
+        group: {
+            item: stored[_inventory_key(item)]["status"]
+            if _inventory_key(item) in stored
+            else "In Stock"
+            for item in items
+        }
+        for group, items in GROUP_TO_ITEMS.items()
+    }
+    other = {r["item"]: r["status"] for r in rows if r["item"] not in ITEM_TO_GROUP}
+    return {
+        "version": max((r["version"] for r in rows), default=0),
+        "groups": groups,
+        "other": other,
+    }
+
+
+async def inventory_changes_since_async(version: int) -> dict:
+    """
+    Change feed for pollers: items written after `version`, oldest first.
+
+    Returns {"version": N, "changes": [{"item", "food_group", "status", "version"}]}.
+    One indexed query; when nothing changed, "changes" is empty.
+    """
+    engine = await _inventory_engine()
+    async with engine.connect() as conn:
+        changes = await read_changes_since(conn, current_site(), version)
+    current = changes[-1]["version"] if changes else version
+    return {"version": current, "changes": changes}
+
+
+# ---------- BULK IMPORT / EXPORT (delivery manifests) ----------
+
+MANIFEST_CHUNK_SIZE = 200
+
+
+# Manifests from unseekable streams (pipes) are spooled to disk past this size
+MANIFEST_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def _rewindable(stream):
+    """`stream` if it can be read twice, else a spooled copy of it."""
+    if stream.seekable():
+        return stream
+    spool = tempfile.SpooledTemporaryFile(
+        max_size=MANIFEST_SPOOL_BYTES,
+        mode="w+" if isinstance(stream, io.TextIOBase) else "w+b",
+    )
+    for block in iter(lambda: stream.read(64 * 1024), stream.read(0)):
+        spool.write(block)
+    spool.seek(0)
+    return spool
+
+
+async def import_manifest_async(stream, fmt: str, chunk_size: int = MANIFEST_CHUNK_SIZE) -> dict:
+    """
+    Apply a CSV/JSONL delivery manifest, streaming.
+
+    The file is read twice. The first pass validates every row (see
+    pantry_manifest); if any row is bad, the errors are reported and nothing
+    is applied. The second pass applies the rows in chunks of `chunk_size`,
+    each chunk one transaction. Only the current chunk is held in memory.
+    """
+    await _inventory_engine()
+    site = current_site()
+    report = {"rows": 0, "applied": 0, "chunks": 0, "error_count": 0, "errors": []}
+    stream = _rewindable(stream)
+    start = stream.tell()
+
+    for row in iter_valid_rows(stream, fmt):
+        report["rows"] += 1
+        if isinstance(row, ManifestRowError):
+            report["error_count"] += 1
+            if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                report["errors"].append(str(row))
+    if report["error_count"]:
+        return report
+
+    stream.seek(start)
+    chunk: list[dict] = []
+
+    async def flush():
+        if not chunk:
+            return
+        rows = list(chunk)
+        chunk.clear()
+        await _submit_write(lambda conn: apply_changes(conn, site, rows))
+        report["applied"] += len(rows)
+        report["chunks"] += 1
+
+    for row in iter_valid_rows(stream, fmt):
+        if isinstance(row, ManifestRowError):
+            # the file changed under us between the passes
+            raise row
+        chunk.append(_inventory_change(row["item"], row["status"], row["quantity"]))
+        if len(chunk) >= chunk_size:
+            await flush()
+    await flush()
+    return report
+
+
+# Non-catalog rows read per query while exporting
+EXPORT_PAGE_SIZE = 500
+
+
+async def iter_inventory_export_async(fmt: str, page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Yield the current inventory as CSV / JSONL lines, catalog order first.
+
+    Rows are read one food group, then one page of other items, at a time,
+    so memory stays flat however many items the table holds.
+    """
+    engine = await _inventory_engine()
+    site = current_site()
+
+    async def rows():
+        for group, items in GROUP_TO_ITEMS.items():
+            async with engine.connect() as conn:
+                stored = await read_items(conn, site, [_inventory_key(i) for i in items])
+            for item in items:
+                r = stored.get(_inventory_key(item))
+                yield {"item": item, "food_group": group,
+                       "status": r["status"] if r else "In Stock",
+                       "quantity": r["quantity"] if r else None,
+                       "version": r["version"] if r else 0}
+        after = ""
+        while True:
+            async with engine.connect() as conn:
+                page = await read_page(conn, site, after, page_size)
+            if not page:
+                return
+            after = page[-1]["item_key"]
+            for r in page:
+                if r["item"] not in ITEM_TO_GROUP:
+                    yield {"item": r["item"], "food_group": None, "status": r["status"],
+                           "quantity": r["quantity"], "version": r["version"]}
+
+    async for line in aiter_export_lines(rows(), fmt):
+        yield line
+
+
+async def export_inventory_async(out, fmt: str) -> int:
+    """Write the export to a text file-like object; returns lines written."""
+    count = 0
+    async for line in iter_inventory_export_async(fmt):
+        out.write(line)
+        count += 1
+    return count
+
+
+def _snapshot_names(items: list[str], groups: dict[str, list[str]]) -> list[str]:
+    """Items then group members, deduplicated: the one read an INVENTORY SNAPSHOT needs."""
+    return list(dict.fromkeys(items + [m for ms in groups.values() for m in ms]))
+
+
+def format_inventory_snapshot(
+    stock: dict[str, dict],
+    items: list[str],
+    groups: dict[str, list[str]],
+) -> str:
+    """Render prefetched stock ({"status", "quantity"} per item) as the INVENTORY SNAPSHOT block."""
+
+    def describe(item: str) -> str:
+        quantity = stock[item]["quantity"]
+        return stock[item]["status"] + (f" ({quantity} left)" if quantity is not None else "")
+
+    lines = ["INVENTORY SNAPSHOT (read from the database just now):"]
+    for item in items:
+        lines.append(f"- {item}: {describe(item)}")
+    for group, members in groups.items():
+        low = sum(1 for m in members if stock[m]["status"] == "Low")
+        out = sum(1 for m in members if stock[m]["status"] == "Out of Stock")
+        lines.append(
+            f"- {group} group ({len(members)} items, {low} Low, {out} Out of Stock): "
+            + ", ".join(f"{m}={describe(m)}" for m in members)
+        )
+    return "\n".join(lines)
+
+
 # ---------- POLICY QUESTIONS ----------
 
-async def ask_policy_async(query: str) -> str:
+async def ask_policy_async(
+    query: str,
+    items: list[str] | None = None,
+    groups: dict[str, list[str]] | None = None,
+    session_id: str | None = None,
+    priority: int = PRIORITY_SERVICE_DESK,
+) -> str:
+    """
+    Ask the Pantry Coordinator a policy question in natural language, in
+    `session_id` (default: the current desk's session).
+
+    If `items` / `groups` (food group -> member items) are given, their
+    statuses are fetched in one batch read and appended after the question
+    as an INVENTORY SNAPSHOT, so the adjudicator can decide without
+    check_inventory calls.
+    """
+    items = items or []
+    groups = groups or {}
+    session_id = session_id or current_session()
+
+    async def _ask() -> str:
+        full_query = query
+        if items or groups:
+            stock = await read_stock_async(_snapshot_names(items, groups))
+            full_query = f"{query}\n\n{format_inventory_snapshot(stock, items, groups)}"
+        return await _run_once(full_query, session_id=session_id, priority=priority)
+
+    return await _single_flight("ask_policy", (query, items, groups), _ask, session_id)
+
+
+# ---------- SUBSTITUTION REQUESTS (structured Policy-Guide form) ----------
+
+def build_substitution_request(
+    family_size: int, from_item: str, to_item: str, notes: str = ""
+) -> dict:
+    """
+    Turn the Policy-Guide form (or one batch row) into the coordinator query,
+    plus the items and food groups whose inventory should be prefetched.
+
+    Returns {"query", "items", "groups", "allowances", "trade"}; blank or
+    "Other" items are left out. The point allowances of the groups involved
+    are computed here and written into the query, so the adjudicator needs
+    no Point_Calculator round trip for them. "trade" (from/to item and
+    group) is what the ledger records.
+    """
+    def _item(name: str) -> str | None:
+        name = (name or "").strip()
+        if not name or name == OTHER_ITEM:
+            return None
+        return canonical_name(name)
+
+    from_name, to_name = _item(from_item), _item(to_item)
+    from_group = group_of(from_name) if from_name else None
+    to_group = group_of(to_name) if to_name else None
+
+    context_lines = [f"Family size: {int(family_size)}."]
+
+    if from_name:
+        if from_group:
+            context_lines.append(
+                f"The family is giving up '{from_name}', which is in the '{from_group}' food group."
+            )
+        else:
+            context_lines.append(f"The family is giving up '{from_name}'.")
+
+    if to_name:
+        if to_group:
+            context_lines.append(
+                f"They are asking for more of '{to_name}', which is in the '{to_group}' food group."
+            )
+        else:
+            context_lines.append(f"They are asking for more of '{to_name}'.")
+
+    allowances = point_allowances(family_size, dict.fromkeys(g for g in (from_group, to_group) if g))
+    if allowances:
+        context_lines.append(f"POINT ALLOWANCES (family of {int(family_size)}):")
+        for group, a in allowances.items():
+            context_lines.append(
+                f"- {group}: {a['per_person']} per person x {int(family_size)} = {a['base']} points "
+                f"(destination cap about {a['cap']})"
+            )
+
+    if notes and notes.strip():
+        context_lines.append(f"Notes: {notes.strip()}")
+
+    context_lines.append(
+        "Volunteer wants to know if this substitution is fair and allowed. "
+        "Give a clear yes/no recommendation and a brief allocation summary "
+        "based on their card, the inventory snapshot below, and your trade rules."
+    )
+
+    return {
+        "query": "\n".join(context_lines),
+        # Prefetch both items and their whole food groups in one read
+        "items": [i for i in (from_name, to_name) if i],
+        "groups": {
+            g: GROUP_TO_ITEMS[g] for g in dict.fromkeys((from_group, to_group)) if g
+        },
+        "allowances": allowances,
+        "trade": {"from_item": from_name, "from_group": from_group,
+                  "to_item": to_name, "to_group": to_group},
+    }
+
+
+async def _trades_granted_async(household_id: str, visit_date: str) -> int:
+    """
+    Trades already granted on this visit, through the read cache.
+
+    A cached count can only be stale for PANTRY_CACHE_POLL_S, and the write
+    that grants a trade re-checks the limit, so staleness never grants two.
+    """
+    engine = await _ledger_engine()
+
+    async def read():
+        async with engine.connect() as conn:
+            return await trades_granted(conn, current_site(), household_id, visit_date)
+
+    return await _cached_read(LEDGER_SCOPE, ("granted", household_id, visit_date), read)
+
+
+# ---------- SPECULATIVE PREFETCH (Policy-Guide form) ----------
+
+# (site, form state) -> prefetch result, valid while neither the site's
+# inventory nor its ledger has changed
+PREFETCH_CACHE = GenerationCache(max_entries=64)
+
+
+async def prefetch_substitution_async(
+    family_size: int,
+    from_item: str,
+    to_item: str,
+    household_id: str | None = None,
+    visit_date: str | None = None,
+) -> dict:
+    """
+    Everything a substitution decision needs except the model, fetched as
+    soon as the form's fields are known (before "Balance the basket").
+
+    Reads the stock of both items and their groups and the household's trades
+    left through the read cache, so the decision that follows finds them
+    there and only has to run the model. Memoized per form state.
+
+    Returns {"items": {item: {"status", "quantity"}}, "groups": {group: {"low", "out"}},
+    "allowances": {...}, "trades_left": int or None}.
+    """
+    household_id = normalize_household_id(household_id) if household_id else None
+    visit_date = visit_date or today()
+    site = current_site()
+    await _inventory_engine()
+    generation = (
+        await cache_watcher.generation(INVENTORY_SCOPE, site),
+        await cache_watcher.generation(LEDGER_SCOPE, site),
+    )
+    key = (site, int(family_size), _normalize_arg(from_item), _normalize_arg(to_item),
+           household_id, visit_date)
+    cached = PREFETCH_CACHE.get(key, generation)
+    if cached is not None:
+        return cached
+
+    request = build_substitution_request(family_size, from_item, to_item)
+    stock = await read_stock_async(_snapshot_names(request["items"], request["groups"]))
+    trades_left = None
+    if household_id:
+        trades_left = max(0, TRADES_PER_VISIT - await _trades_granted_async(household_id, visit_date))
+    result = {
+        "items": {item: stock[item] for item in request["items"]},
+        "groups": {
+            group: {
+                "low": sum(1 for m in members if stock[m]["status"] == "Low"),
+                "out": sum(1 for m in members if stock[m]["status"] == "Out of Stock"),
+            }
+            for group, members in request["groups"].items()
+        },
+        "allowances": request["allowances"],
+        "trades_left": trades_left,
+    }
+    PREFETCH_CACHE.put(key, generation, result)
+    return result
+
+
+def _trade_limit_reply(household_id: str) -> str:
+    return (
+        f"DECLINED – household {household_id} has already used its category trade "
+        f"for this visit (limit: {TRADES_PER_VISIT} per family). "
+        "They can still take their regular allocation."
+    )
+
+
+async def ask_substitution_async(
+    family_size: int,
+    from_item: str,
+    to_item: str,
+    notes: str = "",
+    household_id: str | None = None,
+    session_id: str | None = None,
+    priority: int = PRIORITY_SERVICE_DESK,
+    visit_date: str | None = None,
+    record: bool = True,
+) -> str:
+    """
+    Policy decision for one structured substitution request.
+
+    With a `household_id`, the visit ledger is checked first: a family that
+    already used its trade on this visit (default: today) is declined without
+    a model call. The adjudicated trade is then recorded; if another desk
+    granted this family's trade in the meantime, the answer becomes a decline.
+    Only a reply that opens with APPROVED uses up the allowance. A visit
+    still in the future (a pre-registered batch request) is checked but not
+    recorded, since the family has not been served yet; so is any request
+    made with record=False.
     """
-    Ask the Pantry Coordinator a policy question in natural language.
-    Uses the same main session so it can see inventory updates.
+    request = build_substitution_request(family_size, from_item, to_item, notes)
+    if household_id:
+        household_id = normalize_household_id(household_id)
+        visit_date = visit_date or today()
+        if await _trades_granted_async(household_id, visit_date) >= TRADES_PER_VISIT:
+            return _trade_limit_reply(household_id)
+
+    answer = await ask_policy_async(
+        request["query"],
+        items=request["items"],
+        groups=request["groups"],
+        session_id=session_id,
+        priority=priority,
+    )
+
+    if household_id and record and visit_date <= today():
+        decision = classify_decision(answer)
+        site = current_site()
+        try:
+            await _submit_write(
+                lambda conn: record_trade(
+                    conn, site, household_id, visit_date, request["trade"], decision,
+                    int(family_size),
+                )
+            )
+        except TradeLimitError:
+            return _trade_limit_reply(household_id)
+    return answer
+
+
+async def discard_session_async(session_id: str) -> None:
+    """Delete a throwaway session (e.g. one batch request) and its events."""
+    await session_service.delete_session(
+        app_name=runner.app_name, user_id=_site_user_id(current_site()), session_id=session_id
+    )
+
+
+# ---------- MODEL HEALTH (degraded mode) ----------
+
+def model_status() -> dict:
     """
-    return await _run_once(query, session_id=SESSION_ID_MAIN)
+    Circuit-breaker view for the UI: state ("closed" / "open" / "half_open"),
+    `degraded` flag, seconds until the next retry, and a volunteer-facing message.
+    """
+    return breaker_status()
+
+
+# ---------- MODEL QUOTA METRICS ----------
+
+def model_quota_metrics() -> dict:
+    """Queue depth and wait times per priority class of the shared model limiter."""
+    return limiter_metrics()
+
+
+def read_cache_metrics() -> dict:
+    """Hit rate of the in-process read cache and how often it polled for outside writes."""
+    return {**READ_CACHE.metrics(), **cache_watcher.stats}
+
+
+def model_cache_metrics() -> dict:
+    """Hits, misses and size of the disk-backed model response cache ({"enabled": False} when off)."""
+    return response_cache_metrics()
 
 
 # ---------- PUBLIC SYNC WRAPPERS (for Streamlit) ----------
 
-def update_item_status(item_name: str, status: str) -> str:
-    return run_sync(update_item_status_async(item_name, status))
+def update_item_status(
+    item_name: str, status: str, idempotency_key: str | None = None
+) -> str:
+    return run_sync(update_item_status_async(item_name, status, idempotency_key))
 
 
 def check_item_status(item_name: str) -> str:
@@ -574,11 +1596,82 @@ def start_donation(item_type: str) -> tuple[str, bool, str | None]:
     return run_sync(start_donation_async(item_type))
 
 
+def prefetch_substitution(
+    family_size: int,
+    from_item: str,
+    to_item: str,
+    household_id: str | None = None,
+) -> dict:
+    return run_sync(prefetch_substitution_async(family_size, from_item, to_item, household_id))
+
+
 def confirm_donation(token: str, approve: bool) -> str:
     return run_sync(confirm_donation_async(token, approve))
 
 
-def ask_policy(query: str) -> str:
+def read_inventory(item_names: list[str]) -> dict[str, str]:
+    return run_sync(read_inventory_async(item_names))
+
+
+def read_stock(item_names: list[str]) -> dict[str, dict]:
+    return run_sync(read_stock_async(item_names))
+
+
+def allocate_items(counts: dict[str, int], household_id: str | None = None) -> list[dict]:
+    return run_sync(allocate_items_async(counts, household_id))
+
+
+def household_visit(household_id: str, visit_date: str | None = None) -> dict:
+    return run_sync(household_visit_async(household_id, visit_date))
+
+
+def restock_item(item_name: str, count: int) -> dict:
+    return run_sync(restock_item_async(item_name, count))
+
+
+def set_item_count(item_name: str, quantity: int, low_at: int | None = None) -> dict:
+    return run_sync(set_item_count_async(item_name, quantity, low_at))
+
+
+def inventory_snapshot() -> dict:
+    return run_sync(inventory_snapshot_async())
+
+
+def inventory_changes_since(version: int) -> dict:
+    return run_sync(inventory_changes_since_async(version))
+
+
+def import_manifest(stream, fmt: str, chunk_size: int = MANIFEST_CHUNK_SIZE) -> dict:
+    return run_sync(import_manifest_async(stream, fmt, chunk_size))
+
+
+def export_inventory(out, fmt: str) -> int:
+    return run_sync(export_inventory_async(out, fmt))
+
+
+def inventory_analytics(top: int = 10) -> dict:
+    return run_sync(inventory_analytics_async(top))
+
+
+def item_history(item_name: str, limit: int = 50) -> list[dict]:
+    return run_sync(item_history_async(item_name, limit))
+
+
+def ask_policy(
+    query: str,
+    items: list[str] | None = None,
+    groups: dict[str, list[str]] | None = None,
+) -> str:
     """Sync wrapper for Streamlit."""
-    return run_sync(ask_policy_async(query))
+    return run_sync(ask_policy_async(query, items=items, groups=groups))
+
+
+def ask_substitution(
+    family_size: int,
+    from_item: str,
+    to_item: str,
+    notes: str = "",
+    household_id: str | None = None,
+) -> str:
+    return run_sync(ask_substitution_async(family_size, from_item, to_item, notes, household_id))
 # ----------------- END FILE -----------------
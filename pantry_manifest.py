@@ -0,0 +1,271 @@
+# pantry_manifest.py
+# ---------------- BEGIN FILE -----------------
+"""
+Streaming import / export of delivery manifests (CSV or JSONL).
+
+Rows are read one at a time, mapped to catalog items and validated here;
+pantry_logic.import_manifest_async checks the whole file first and, only if
+every row is valid, applies it in fixed-size chunks, so a manifest of any
+length is processed in constant memory and a bad file changes nothing.
+
+Manifest columns (CSV header or JSON keys):
+    item       catalog item name (resolved by pantry_catalog; small typos in
+               one-word names ok if only one item could be meant, anything
+               else is rejected with suggestions), required
+    status     In Stock / Low / Out of Stock (optional if quantity is given)
+    quantity   whole units on hand (optional); when present the status is
+               derived from it and the item's Low threshold
+
+CLI:
+    python pantry_manifest.py import truck.csv
+    python pantry_manifest.py export inventory.jsonl
+"""
+import io
+import re
+import csv
+import sys
+import json
+import argparse
+
+from pantry_catalog import ITEM_TO_GROUP, resolve_item, suggest_items
+
+VALID_STATUSES = ("In Stock", "Low", "Out of Stock")
+
+_STATUS_ALIASES = {
+    "in stock": "In Stock",
+    "instock": "In Stock",
+    "in": "In Stock",
+    "available": "In Stock",
+    "ok": "In Stock",
+    "low": "Low",
+    "out of stock": "Out of Stock",
+    "out": "Out of Stock",
+    "oos": "Out of Stock",
+    "none": "Out of Stock",
+}
+
+# Keep only the first few problems so a bad 10k-line file stays cheap to report
+MAX_REPORTED_ERRORS = 50
+
+
+class ManifestRowError(ValueError):
+    """A manifest row that cannot be applied; carries its line number."""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def detect_format(filename: str) -> str:
+    """'csv' or 'jsonl' from a file name."""
+    lower = filename.lower()
+    if lower.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+
+def as_text_stream(stream) -> io.TextIOBase:
+    """Wrap binary uploads (e.g. Streamlit's UploadedFile) as text, lazily."""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def iter_manifest_rows(stream, fmt: str):
+    """
+    Yield (line_number, raw_row_dict) without reading the whole file.
+
+    Text that is not UTF-8 ends the file with one ManifestRowError, since the
+    rows after it cannot be trusted. A binary `stream` is left open, so the
+    caller can read it again.
+    """
+    text_stream = as_text_stream(stream)
+    line_no = 0
+    try:
+        if fmt == "jsonl":
+            for line_no, line in enumerate(text_stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, ManifestRowError(line_no, f"invalid JSON ({e.msg})")
+                    continue
+                if not isinstance(row, dict):
+                    yield line_no, ManifestRowError(line_no, "expected a JSON object")
+                    continue
+                yield line_no, row
+        else:
+            reader = csv.DictReader(text_stream)
+            for row in reader:
+                # header is line 1
+                line_no = reader.line_num
+                yield line_no, {
+                    (k or "").strip().lower(): v for k, v in row.items()
+                }
+    except UnicodeDecodeError:
+        yield line_no + 1, ManifestRowError(line_no + 1, "file is not UTF-8 text")
+    finally:
+        if text_stream is not stream:
+            # closing the wrapper would close the caller's file
+            text_stream.detach()
+
+
+def parse_quantity(value) -> int:
+    """A count of whole units: 3, "3" or 3.0, never "2.5" or true."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and re.fullmatch(r"\s*[+-]?\d+\s*", value):
+        return int(value)
+    raise ValueError(value)
+
+
+def normalize_status(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    return _STATUS_ALIASES.get(value.lower())
+
+
+def validate_row(line: int, row: dict) -> dict:
+    """
+    Map a raw row to {"item", "food_group", "status", "quantity"}.
+
+    Raises ManifestRowError for unknown items, bad statuses or quantities.
+    """
+    raw_item = str(row.get("item") or "").strip()
+    if not raw_item:
+        raise ManifestRowError(line, "missing item name")
+    item = resolve_item(raw_item)
+    if item is None:
+        suggestions = ", ".join(suggest_items(raw_item))
+        hint = f" (did you mean: {suggestions}?)" if suggestions else ""
+        raise ManifestRowError(line, f"'{raw_item}' is not a catalog item{hint}")
+
+    quantity = row.get("quantity")
+    if quantity in (None, ""):
+        quantity = None
+    else:
+        try:
+            quantity = parse_quantity(quantity)
+        except ValueError:
+            raise ManifestRowError(line, f"quantity '{quantity}' is not a whole number")
+        if quantity < 0:
+            raise ManifestRowError(line, "quantity cannot be negative")
+
+    raw_status = row.get("status")
+    status = normalize_status(raw_status)
+    if status is None:
+        if raw_status not in (None, "") and str(raw_status).strip():
+            raise ManifestRowError(line, f"unknown status '{raw_status}'")
+        if quantity is None:
+            raise ManifestRowError(line, "needs a status or a quantity")
+    if quantity is not None:
+        # derived at apply time from the count and the item's threshold
+        status = None
+
+    return {
+        "item": item,
+        "food_group": ITEM_TO_GROUP.get(item),
+        "status": status,
+        "quantity": quantity,
+    }
+
+
+def iter_valid_rows(stream, fmt: str):
+    """Yield validated rows or ManifestRowError instances, in file order."""
+    for line, row in iter_manifest_rows(stream, fmt):
+        if isinstance(row, ManifestRowError):
+            yield row
+            continue
+        try:
+            yield validate_row(line, row)
+        except ManifestRowError as e:
+            yield e
+
+
+# ---------- EXPORT ----------
+
+EXPORT_FIELDS = ["item", "food_group", "status", "quantity", "version"]
+
+
+def _line_formatter(fmt: str):
+    """Return (header, format_row) for one export format; JSONL has no header."""
+    if fmt == "jsonl":
+        return "", lambda row: json.dumps(row) + "\n"
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+
+    def format_row(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    return ",".join(EXPORT_FIELDS) + "\r\n", format_row
+
+
+def iter_export_lines(rows, fmt: str):
+    """Yield the export file line by line from an iterable of row dicts."""
+    header, format_row = _line_formatter(fmt)
+    if header:
+        yield header
+    for row in rows:
+        yield format_row(row)
+
+
+async def aiter_export_lines(rows, fmt: str):
+    """iter_export_lines for an async iterable of row dicts."""
+    header, format_row = _line_formatter(fmt)
+    if header:
+        yield header
+    async for row in rows:
+        yield format_row(row)
+
+
+# ---------- CLI ----------
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Import or export pantry inventory manifests.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="apply a CSV/JSONL delivery manifest")
+    imp.add_argument("path")
+    imp.add_argument("--chunk-size", type=int, default=200)
+    exp = sub.add_parser("export", help="write current inventory as CSV/JSONL ('-' for stdout)")
+    exp.add_argument("path")
+    exp.add_argument("--format", choices=["csv", "jsonl"])
+    for p in (imp, exp):
+        p.add_argument("--site", help="pantry site id (default: the default site)")
+    args = parser.parse_args(argv)
+
+    # imported here so `--help` works without model credentials
+    import pantry_logic
+    from pantry_sites import set_site
+
+    set_site(args.site)
+    if args.command == "import":
+        with open(args.path, "rb") as f:
+            report = pantry_logic.import_manifest(
+                f, detect_format(args.path), chunk_size=args.chunk_size
+            )
+        print(json.dumps(report, indent=2))
+        return 0 if report["error_count"] == 0 else 1
+
+    fmt = args.format or detect_format(args.path)
+    if args.path == "-":
+        pantry_logic.export_inventory(sys.stdout, fmt)
+    else:
+        with open(args.path, "w", newline="", encoding="utf-8") as f:
+            pantry_logic.export_inventory(f, fmt)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# ----------------- END FILE -----------------
@@ -0,0 +1,726 @@
+# pantry_model.py
+# ---------------- BEGIN FILE -----------------
+"""
+The Gemini client shared by every agent, plus the process-wide controls
+that sit in front of it.
+
+- A priority token bucket: all flows share one API key, so latency-critical
+  service-desk decisions get quota before donation routing, and donation
+  routing before background inventory flips. Retries of failed calls wait
+  for their own token too (PantryGemini retries, not the SDK).
+- A circuit breaker: after repeated failures it fails fast for a cool-down
+  period instead of letting every click sit through the retry schedule.
+- An optional local stub backend (PANTRY_MODEL_STUB_LATENCY_MS) for load
+  tests: everything above still runs, only the network call is replaced.
+- A replay backend: inside replay_responses(script) every model call is
+  answered with the next recorded response (see pantry_replay).
+- An opt-in, disk-backed response cache (PANTRY_MODEL_CACHE_PATH): an
+  identical request is answered from disk without using quota.
+"""
+import os
+import re
+import json
+import time
+import heapq
+import random
+import asyncio
+import hashlib
+import sqlite3
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_response import LlmResponse
+from google.genai import errors as genai_errors
+from google.genai import types
+
+# ---------- PRIORITY CLASSES ----------
+
+PRIORITY_SERVICE_DESK = 0
+PRIORITY_DONATION = 1
+PRIORITY_INVENTORY = 2
+PRIORITY_BATCH = 3  # overnight precomputation; yields to every live desk
+
+PRIORITY_NAMES = {
+    PRIORITY_SERVICE_DESK: "service_desk",
+    PRIORITY_DONATION: "donation",
+    PRIORITY_INVENTORY: "inventory",
+    PRIORITY_BATCH: "batch",
+}
+
+# Priority of the flow currently running; set by pantry_logic around each run
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "model_priority", default=PRIORITY_INVENTORY
+)
+
+
+@contextmanager
+def model_priority(priority: int):
+    """Tag every model call made inside this block with `priority`."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+# ---------- TOKEN BUCKET ----------
+
+MODEL_REQUESTS_PER_MINUTE = float(os.getenv("PANTRY_MODEL_RPM", "60"))
+MODEL_BURST = int(os.getenv("PANTRY_MODEL_BURST", "10"))
+
+
+class PriorityTokenBucket:
+    """
+    Token bucket whose waiters are served strictly by priority (lower first),
+    FIFO within a class. Tracks queue depth and wait time per class.
+    """
+
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate = rate_per_s
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        self._metrics = {
+            p: {"granted": 0, "queued": 0, "max_depth": 0, "total_wait_s": 0.0, "max_wait_s": 0.0}
+            for p in PRIORITY_NAMES
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, priority: int) -> float:
+        """Wait for a token; returns the seconds spent waiting."""
+        start = time.monotonic()
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            self._record(priority, 0.0)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        m = self._metrics[priority]
+        m["queued"] += 1
+        m["max_depth"] = max(m["max_depth"], self._depth(priority))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        await future
+
+        waited = time.monotonic() - start
+        self._record(priority, waited)
+        return waited
+
+    async def _dispatch(self):
+        while self._waiters:
+            self._refill()
+            while self._waiters and self._tokens >= 1:
+                _, _, future = heapq.heappop(self._waiters)
+                if future.cancelled():
+                    continue
+                self._tokens -= 1
+                future.set_result(None)
+            if self._waiters:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def _depth(self, priority: int) -> int:
+        return sum(1 for p, _, f in self._waiters if p == priority and not f.done())
+
+    def _record(self, priority: int, waited: float):
+        m = self._metrics[priority]
+        m["granted"] += 1
+        m["total_wait_s"] += waited
+        m["max_wait_s"] = max(m["max_wait_s"], waited)
+
+    def metrics(self) -> dict:
+        """Per-class counters plus the current queue depth."""
+        out = {}
+        for p, name in PRIORITY_NAMES.items():
+            m = self._metrics[p]
+            out[name] = {
+                **m,
+                "depth": self._depth(p),
+                "avg_wait_s": m["total_wait_s"] / m["granted"] if m["granted"] else 0.0,
+            }
+        out["tokens_available"] = round(self._tokens, 2)
+        return out
+
+
+model_limiter = PriorityTokenBucket(MODEL_REQUESTS_PER_MINUTE / 60.0, MODEL_BURST)
+
+
+# ---------- CIRCUIT BREAKER ----------
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("PANTRY_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_S = float(os.getenv("PANTRY_BREAKER_COOLDOWN_S", "30"))
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised instead of calling Gemini while the circuit breaker is open."""
+
+
+# Network-level failures on the way to Gemini (no HTTP status to go by)
+_TRANSPORT_ERRORS = (httpx.TransportError, ConnectionError, TimeoutError)
+
+
+def _is_outage(exc: BaseException) -> bool:
+    """
+    Failures that say Gemini is unhealthy: 5xx and 429 answers, transport
+    errors and upstream timeouts. Anything else (a 4xx, or a bug in our own
+    code such as a TypeError) leaves the breaker alone.
+    """
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code == 429 or (isinstance(exc.code, int) and exc.code >= 500)
+    return isinstance(exc, _TRANSPORT_ERRORS)
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls flow; `failure_threshold` failures in a row trip it
+    open      -> calls fail fast with ModelUnavailableError for `cooldown_s`
+    half_open -> one trial call goes through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_s: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.last_error = ""
+        self._trial_in_flight = False
+
+    def check(self):
+        """Fail fast while open, without claiming the half-open trial call."""
+        if self.state == "open" and time.monotonic() - self.opened_at < self.cooldown_s:
+            raise ModelUnavailableError(self.message())
+
+    def before_call(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown_s:
+                raise ModelUnavailableError(self.message())
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                raise ModelUnavailableError(self.message())
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another caller make the half-open trial call."""
+        self._trial_in_flight = False
+
+    def record_failure(self, exc: BaseException):
+        if not _is_outage(exc):
+            self._trial_in_flight = False
+            return
+        self.failures += 1
+        self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        self._trial_in_flight = False
+
+    def retry_in(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.cooldown_s - (time.monotonic() - self.opened_at))
+
+    def message(self) -> str:
+        if self.state == "closed":
+            return "The AI assistant is available."
+        if self.state == "half_open":
+            return "The AI assistant is recovering from an outage; trying it again now."
+        return (
+            "The AI assistant is temporarily unavailable (Gemini is failing). "
+            f"Please try again in about {int(self.retry_in()) + 1} seconds."
+        )
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "degraded": self.state != "closed",
+            "retry_in_s": round(self.retry_in(), 1),
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "last_error": self.last_error,
+            "message": self.message(),
+        }
+
+
+model_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN_S)
+
+
+# ---------- REQUEST DEADLINE ----------
+
+class UpstreamTimeoutError(TimeoutError):
+    """A run's deadline expired while Gemini was still answering."""
+
+
+class _RunClock:
+    """
+    Time one run spent waiting for quota tokens, which the deadline skips.
+    Calls of one run may wait side by side; overlapping waits count once.
+    """
+
+    def __init__(self):
+        self.waiting = 0
+        self.upstream = 0  # model calls currently out at Gemini
+        self._queued_s = 0.0
+        self._since = 0.0
+
+    def queue_enter(self):
+        if self.waiting == 0:
+            self._since = time.monotonic()
+        self.waiting += 1
+
+    def queue_exit(self):
+        self.waiting -= 1
+        if self.waiting == 0:
+            self._queued_s += time.monotonic() - self._since
+
+    def queued_s(self) -> float:
+        return self._queued_s + (time.monotonic() - self._since if self.waiting else 0.0)
+
+
+_run_clock: contextvars.ContextVar[_RunClock | None] = contextvars.ContextVar(
+    "model_run_clock", default=None
+)
+
+
+async def run_with_deadline(coro, deadline_s: float):
+    """
+    Await `coro`, giving up once it has run `deadline_s` seconds NOT counting
+    time its model calls spent queued in model_limiter.
+
+    On expiry the run is cancelled and asyncio.TimeoutError raised; the
+    breaker counts it only if a model call was out at Gemini at that moment
+    (a backlog in our own queue says nothing about Gemini's health).
+    """
+    clock = _RunClock()
+    token = _run_clock.set(clock)
+    try:
+        task = asyncio.ensure_future(coro)  # the task inherits the clock
+    finally:
+        _run_clock.reset(token)
+    start = time.monotonic()
+    try:
+        while True:
+            remaining = deadline_s - (time.monotonic() - start - clock.queued_s())
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait({task}, timeout=remaining)
+            if done:
+                return task.result()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    upstream = clock.upstream > 0
+    task.cancel()
+    await asyncio.wait({task})
+    if upstream:
+        model_breaker.record_failure(UpstreamTimeoutError(f"no answer within {deadline_s:g}s"))
+    raise asyncio.TimeoutError()
+
+
+# ---------- STUB BACKEND (load tests) ----------
+
+# When set, PantryGemini answers locally after this many ms instead of
+# calling Gemini. Replies follow the agents' tool protocol well enough that
+# tools run and session events are written exactly as in production.
+STUB_LATENCY_MS = os.getenv("PANTRY_MODEL_STUB_LATENCY_MS")
+STUB_JITTER = float(os.getenv("PANTRY_MODEL_STUB_JITTER", "0.25"))
+
+_STUB_UPDATE = re.compile(r"Update status: (.+) is (In Stock|Low|Out of Stock)\.")
+_STUB_CHECK = re.compile(r"Can I give (.+)\?")
+
+
+def _stub_reply(llm_request) -> types.Content:
+    """One model turn: a tool call for a fresh request, text after a tool result."""
+    last = llm_request.contents[-1] if llm_request.contents else None
+    parts = (last.parts or []) if last else []
+    results = [p.function_response for p in parts if p.function_response]
+    if results:
+        text = "; ".join(str((r.response or {}).get("result", r.response)) for r in results)
+        return types.Content(role="model", parts=[types.Part(text=text)])
+
+    message = " ".join(p.text for p in parts if p.text)
+    tools = llm_request.tools_dict
+    call = None
+    if (m := _STUB_UPDATE.search(message)) and "update_inventory" in tools:
+        call = ("update_inventory", {"item_name": m.group(1), "status": m.group(2)})
+    elif (m := _STUB_CHECK.search(message)) and "check_inventory" in tools:
+        call = ("check_inventory", {"item_name": m.group(1)})
+    elif "Family size" in message and "Policy_Adjudicator" in tools:
+        call = ("Policy_Adjudicator", {"request": message})
+    if call:
+        part = types.Part(function_call=types.FunctionCall(name=call[0], args=call[1]))
+        return types.Content(role="model", parts=[part])
+    return types.Content(
+        role="model", parts=[types.Part(text="APPROVED – stub decision within the fairness rules.")]
+    )
+
+
+async def _stub_generate(llm_request):
+    delay = float(STUB_LATENCY_MS) / 1000
+    await asyncio.sleep(max(0.0, random.uniform(delay * (1 - STUB_JITTER), delay * (1 + STUB_JITTER))))
+    content = _stub_reply(llm_request)
+    # rough 4-chars-per-token estimate so usage accounting has numbers to sum
+    prompt_chars = sum(len(p.text or "") for c in llm_request.contents for p in (c.parts or []))
+    reply_chars = sum(len(p.text or "") + 40 * bool(p.function_call) for p in content.parts)
+    usage = types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=prompt_chars // 4 + 1,
+        candidates_token_count=reply_chars // 4 + 1,
+        total_token_count=prompt_chars // 4 + reply_chars // 4 + 2,
+    )
+    yield LlmResponse(content=content, usage_metadata=usage)
+
+
+# ---------- REPLAY BACKEND (record-and-replay) ----------
+
+REPLAY_MISSING_TEXT = "REPLAY: no recorded model response left for this call."
+
+
+class ReplayScript:
+    """
+    Recorded model turns for one invocation, served in order.
+
+    `latency_s` is slept before each answer; a negative value replays each
+    turn's recorded delay instead. Calls beyond the recording get a fixed
+    placeholder reply and are counted in `missing`.
+    """
+
+    def __init__(self, responses: list[dict], latency_s: float = 0.0):
+        # each response: {"content": Content dict, "usage": usage dict or None, "delay_s": float}
+        self._pending = deque(responses)
+        self.latency_s = latency_s
+        self.served = 0
+        self.missing = 0
+
+    @property
+    def unused(self) -> int:
+        return len(self._pending)
+
+    def next(self) -> dict | None:
+        if not self._pending:
+            self.missing += 1
+            return None
+        self.served += 1
+        return self._pending.popleft()
+
+
+_replay_script: contextvars.ContextVar[ReplayScript | None] = contextvars.ContextVar(
+    "model_replay_script", default=None
+)
+
+
+@contextmanager
+def replay_responses(script: ReplayScript):
+    """Answer every model call made inside this block from `script`."""
+    token = _replay_script.set(script)
+    try:
+        yield script
+    finally:
+        _replay_script.reset(token)
+
+
+async def _replay_generate(script: ReplayScript):
+    recorded = script.next()
+    if recorded is None:
+        content = types.Content(role="model", parts=[types.Part(text=REPLAY_MISSING_TEXT)])
+        yield LlmResponse(content=content)
+        return
+    delay = recorded.get("delay_s", 0.0) if script.latency_s < 0 else script.latency_s
+    if delay:
+        await asyncio.sleep(delay)
+    usage = recorded.get("usage")
+    yield LlmResponse(
+        content=types.Content.model_validate(recorded["content"]),
+        usage_metadata=types.GenerateContentResponseUsageMetadata.model_validate(usage) if usage else None,
+    )
+
+
+# ---------- RESPONSE CACHE (opt-in, disk-backed) ----------
+
+# Off unless a path is given. Entries live in their own SQLite file so the
+# cache can be shared across dev/test runs and deleted at any time.
+MODEL_CACHE_PATH = os.getenv("PANTRY_MODEL_CACHE_PATH")
+MODEL_CACHE_TTL_S = float(os.getenv("PANTRY_MODEL_CACHE_TTL_S", "86400"))
+MODEL_CACHE_MAX_MB = float(os.getenv("PANTRY_MODEL_CACHE_MAX_MB", "64"))
+
+
+def _strip_call_ids(contents: list[dict]) -> list[dict]:
+    """ADK gives every tool call a random id; it must not make equal requests differ."""
+    stripped = []
+    for content in contents:
+        parts = []
+        for part in content.get("parts") or []:
+            for field in ("function_call", "function_response"):
+                if field in part:
+                    part = {**part, field: {k: v for k, v in part[field].items() if k != "id"}}
+            parts.append(part)
+        stripped.append({**content, "parts": parts})
+    return stripped
+
+
+def request_cache_key(llm_request) -> str | None:
+    """sha256 of everything the model sees (model, instruction, tools, history); None if unhashable."""
+    try:
+        payload = llm_request.model_dump(
+            mode="json", exclude_none=True, include={"model", "contents", "config"}
+        )
+    except Exception:
+        return None
+    payload["contents"] = _strip_call_ids(payload.get("contents") or [])
+    (payload.get("config") or {}).pop("http_options", None)
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Model responses by request hash, in one SQLite file.
+
+    Entries expire after `ttl_s`; when the file's payload exceeds `max_bytes`
+    the least recently used entries are dropped. SQLite calls run in a worker
+    thread so the event loop never waits on the disk.
+    """
+
+    def __init__(self, path: str, ttl_s: float = MODEL_CACHE_TTL_S, max_mb: float = MODEL_CACHE_MAX_MB):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS model_responses ("
+            " key TEXT PRIMARY KEY, responses TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_model_responses_used ON model_responses (last_used)"
+        )
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM model_responses").fetchone()[0]
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+
+    def _get(self, key: str) -> list[dict] | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT responses, size, created_at FROM model_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if now - row[2] > self.ttl_s:
+                self._conn.execute("DELETE FROM model_responses WHERE key = ?", (key,))
+                self._bytes -= row[1]
+                self.stats["expired"] += 1
+                return None
+            self._conn.execute("UPDATE model_responses SET last_used = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def _put(self, key: str, responses: list[dict]):
+        blob = json.dumps(responses)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM model_responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO model_responses (key, responses, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._bytes += len(blob) - (old[0] if old else 0)
+            self.stats["stores"] += 1
+            while self._bytes > self.max_bytes:
+                victims = self._conn.execute(
+                    "SELECT key, size FROM model_responses ORDER BY last_used LIMIT 32"
+                ).fetchall()
+                if not victims:
+                    break
+                for victim, size in victims:
+                    self._conn.execute("DELETE FROM model_responses WHERE key = ?", (victim,))
+                    self._bytes -= size
+                    self.stats["evictions"] += 1
+                    if self._bytes <= self.max_bytes:
+                        break
+
+    async def get(self, key: str) -> list[dict] | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key: str, responses: list[dict]):
+        await asyncio.to_thread(self._put, key, responses)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM model_responses").fetchone()[0]
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["expired"]
+        return {
+            "enabled": True,
+            **self.stats,
+            "entries": entries,
+            "size_kb": round(self._bytes / 1024, 1),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(MODEL_CACHE_PATH) if MODEL_CACHE_PATH else None
+
+
+def _cache_hit_response(data: dict) -> LlmResponse:
+    """
+    A stored response, served again. It carries no usage_metadata (nothing
+    was billed, so pantry_usage must not count it) and is flagged
+    custom_metadata["model_cache"] = "hit" in the session events.
+    """
+    data = {k: v for k, v in data.items() if k != "usage_metadata"}
+    data["custom_metadata"] = {**(data.get("custom_metadata") or {}), "model_cache": "hit"}
+    return LlmResponse.model_validate(data)
+
+
+def _cacheable(responses: list[dict]) -> bool:
+    """Only complete, successful answers are worth serving again."""
+    return bool(responses) and all(
+        r.get("content") and not r.get("partial") and not r.get("error_code") for r in responses
+    )
+
+
+# ---------- MODEL CLIENT ----------
+
+# Status codes worth another attempt (the SDK's own defaults)
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+def _retryable(exc: BaseException, options: types.HttpRetryOptions) -> bool:
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code in (options.http_status_codes or RETRY_STATUS_CODES)
+    return isinstance(exc, _TRANSPORT_ERRORS)
+
+
+def _retry_delay(options: types.HttpRetryOptions, retry: int) -> float:
+    """Exponential backoff with jitter, as the SDK would wait."""
+    delay = (options.initial_delay or 1.0) * (options.exp_base or 2) ** retry
+    return min(delay, options.max_delay or 60.0) + random.uniform(0, options.jitter or 1.0)
+
+
+class PantryGemini(Gemini):
+    """
+    Gemini behind the shared controls: the response cache (if enabled) is
+    asked first, then an open circuit breaker fails fast (so an outage never
+    consumes quota), then a token is taken from model_limiter. Only once the
+    token is granted does the call count for the breaker and the run's
+    deadline (see run_with_deadline).
+
+    Retries happen here, not in the SDK (leave `retry_options` unset and
+    use `upstream_retry`): every attempt goes back through the breaker and
+    waits for its own token, so retries cannot bypass the limiter. The
+    breaker records one verdict per call, after the last attempt.
+    """
+
+    # retry policy for failed calls; attempts counts the first call
+    upstream_retry: types.HttpRetryOptions | None = None
+    # rate-limit class of this agent's calls; None follows the run's model_priority
+    priority: int | None = None
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        key = None
+        # stub and replay answers are not Gemini's: never serve or store them
+        if response_cache is not None and _replay_script.get() is None and not STUB_LATENCY_MS:
+            key = None if stream else request_cache_key(llm_request)
+            if key is None:
+                response_cache.stats["bypassed"] += 1
+            else:
+                cached = await response_cache.get(key)
+                if cached is not None:
+                    for data in cached:
+                        yield _cache_hit_response(data)
+                    return
+
+        priority = self.priority if self.priority is not None else _current_priority.get()
+        attempts = max(1, (self.upstream_retry.attempts or 1) if self.upstream_retry else 1)
+        clock = _run_clock.get()
+        for attempt in range(attempts):
+            model_breaker.check()
+            if clock is not None:
+                clock.queue_enter()
+            try:
+                await model_limiter.acquire(priority)
+            finally:
+                if clock is not None:
+                    clock.queue_exit()
+
+            model_breaker.before_call()
+            if clock is not None:
+                clock.upstream += 1
+            ok = False
+            yielded = False
+            collected = []
+            try:
+                script = _replay_script.get()
+                if script is not None:
+                    responses = _replay_generate(script)
+                elif STUB_LATENCY_MS:
+                    responses = _stub_generate(llm_request)
+                else:
+                    responses = super().generate_content_async(llm_request, stream=stream)
+                async for response in responses:
+                    if key is not None:
+                        # serialized before yielding: ADK edits the event in place afterwards
+                        data = response.model_dump(mode="json", exclude_none=True, exclude={"usage_metadata"})
+                        if data.get("content"):
+                            # ADK gives each call a fresh id when served again
+                            data["content"] = _strip_call_ids([data["content"]])[0]
+                        collected.append(data)
+                    yielded = True
+                    yield response
+                ok = True
+                if key is not None and _cacheable(collected):
+                    await response_cache.put(key, collected)
+                return
+            except Exception as e:
+                # a half-delivered stream cannot be taken back: only retry clean failures
+                if yielded or attempt + 1 == attempts or not _retryable(e, self.upstream_retry):
+                    model_breaker.record_failure(e)
+                    raise
+                # still waiting on Gemini: a deadline hit during the backoff counts as upstream
+                await asyncio.sleep(_retry_delay(self.upstream_retry, attempt))
+            finally:
+                if clock is not None:
+                    clock.upstream -= 1
+                if ok:
+                    model_breaker.record_success()
+                else:
+                    # retrying, cancelled (deadline) or abandoned mid-stream: not a verdict
+                    model_breaker.release_trial()
+
+
+def response_cache_metrics() -> dict:
+    if response_cache is None:
+        return {"enabled": False}
+    return response_cache.metrics()
+
+
+def limiter_metrics() -> dict:
+    return model_limiter.metrics()
+
+
+def breaker_status() -> dict:
+    return model_breaker.status()
+# ----------------- END FILE -----------------
@@ -0,0 +1,296 @@
+# pantry_replay.py
+# ---------------- BEGIN FILE -----------------
+"""
+Record-and-replay harness over the sessions stored in a pantry.db.
+
+Every invocation in the source database's `events` table (one volunteer
+request: the user message, the model turns and tool results it produced) is
+replayed through pantry_logic against a scratch database. The model is
+replaced by pantry_model's replay backend, which answers each call with the
+recorded model turn, so tools, sessions, coalescing and the write queue all
+run for real while Gemini is never called.
+
+For each invocation the harness reports the recorded and replayed wall
+time, how many recorded model turns were used, and whether the final answer
+matches the recorded one. A change that adds, drops or reorders model calls,
+or changes what the desk gets back, shows up as a divergence; the exit code
+is non-zero if any invocation diverged, so this works as a regression test.
+
+Both events layouts are read (see pantry_usage), so databases written by
+older ADK versions replay too. An invocation whose last recorded model turn
+still calls a tool never answered and is counted as incomplete.
+
+Sub-agents called as tools run in their own in-memory session, so only
+their final answers are recorded (as the tool result); the replay serves
+that text as the sub-agent's single model turn.
+
+    python pantry_replay.py /path/to/pantry.db --limit 200
+    python pantry_replay.py pantry.db --recorded-latency --out replay.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+from collections import OrderedDict, defaultdict
+
+from pantry_usage import (
+    DEFAULT_CHUNK,
+    INVOCATION_IDLE_S,
+    classify_flow,
+    iter_event_chunks,
+    message_text,
+    parse_timestamp,
+    site_of,
+)
+
+_UPDATE = re.compile(r"^Update status: (?P<item>.+) is (?P<status>In Stock|Low|Out of Stock)\.$")
+_CHECK = re.compile(r"^Can I give (?P<item>.+)\?$")
+
+
+def _pct(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def _normalize_answer(text: str | None) -> str:
+    return " ".join((text or "").split())
+
+
+def _answer_text(content: dict) -> str | None:
+    """What pantry_logic hands back for a model turn: its first text part (None while it still calls tools)."""
+    parts = content.get("parts") or []
+    if any(part.get("function_call") for part in parts):
+        return None
+    return next((part["text"] for part in parts if part.get("text")), None)
+
+
+def _strip_call_ids(content: dict) -> dict:
+    """Recorded function-call ids belong to the old session; ADK assigns new ones."""
+    parts = []
+    for part in content.get("parts") or []:
+        call = part.get("function_call")
+        if call:
+            part = {**part, "function_call": {k: v for k, v in call.items() if k != "id"}}
+        parts.append(part)
+    return {**content, "parts": parts}
+
+
+# ---------- EXTRACTION ----------
+
+def _new_invocation(invocation_id: str, user_id: str, ts: float) -> dict:
+    return {"invocation_id": invocation_id, "user_id": user_id, "message": None,
+            "responses": [], "answer": None, "first": ts, "last": ts}
+
+
+def _add_event(inv: dict, ts: float, event: dict, agent_tools: set[str]):
+    content = event.get("content") or {}
+    if event.get("author") == "user":
+        if inv["message"] is None:
+            inv["message"] = message_text(event)
+    elif content.get("role") == "model":
+        inv["responses"].append({"content": _strip_call_ids(content),
+                                 "usage": event.get("usage_metadata"),
+                                 "delay_s": ts - inv["last"]})
+        # a turn that calls a tool is not the answer; the run ends on a turn that doesn't
+        inv["answer"] = _answer_text(content)
+    else:
+        # a sub-agent's answer only survives as its tool result
+        for part in content.get("parts") or []:
+            response = part.get("function_response")
+            if response and response.get("name") in agent_tools:
+                result = (response.get("response") or {}).get("result", "")
+                inv["responses"].append({"content": {"role": "model", "parts": [{"text": str(result)}]},
+                                         "usage": None, "delay_s": ts - inv["last"]})
+    inv["last"] = max(inv["last"], ts)
+
+
+def iter_invocations(conn: sqlite3.Connection, agent_tools: set[str], after_rowid: int = 0,
+                     chunk_size: int = DEFAULT_CHUNK):
+    """
+    Yield recorded invocations in the order they started.
+
+    Events are streamed in chunks; an invocation is handed out once no event
+    has touched it for INVOCATION_IDLE_S (or the table ends), so memory only
+    holds the invocations that overlap in time.
+    """
+    pending: "OrderedDict[str, dict]" = OrderedDict()
+    for rows in iter_event_chunks(conn, after_rowid, chunk_size):
+        for _rowid, user_id, invocation_id, timestamp, event_data in rows:
+            ts = parse_timestamp(timestamp)
+            try:
+                event = json.loads(event_data or "{}")
+            except ValueError:
+                continue
+            if event.get("partial"):
+                continue
+            inv = pending.get(invocation_id)
+            if inv is None:
+                inv = pending[invocation_id] = _new_invocation(invocation_id, user_id, ts)
+            _add_event(inv, ts, event, agent_tools)
+            while pending and ts - next(iter(pending.values()))["last"] > INVOCATION_IDLE_S:
+                yield pending.popitem(last=False)[1]
+    while pending:
+        yield pending.popitem(last=False)[1]
+
+
+# ---------- REPLAY ----------
+
+async def _dispatch(logic, flow: str, message: str) -> str:
+    """Send the message through the same pantry_logic entry point the desk used."""
+    if flow == "inventory_update" and (m := _UPDATE.match(message)):
+        return await logic.update_item_status_async(m["item"], m["status"])
+    if flow == "inventory_check" and (m := _CHECK.match(message)):
+        return await logic.check_item_status_async(m["item"])
+    return await logic.ask_policy_async(message)
+
+
+async def replay_invocation(logic, inv: dict, latency_s: float = 0.0) -> dict:
+    from pantry_model import ReplayScript, replay_responses
+    from pantry_sites import site_scope
+
+    flow = classify_flow(inv["message"])
+    site = site_of(inv["user_id"])
+    script = ReplayScript(inv["responses"], latency_s)
+    result = {
+        "invocation_id": inv["invocation_id"],
+        "flow": flow,
+        "site": site,
+        "recorded_s": round(inv["last"] - inv["first"], 3),
+        "model_turns": len(inv["responses"]),
+    }
+    start = time.perf_counter()
+    answer, error = None, None
+    try:
+        with site_scope(site), replay_responses(script):
+            answer = await _dispatch(logic, flow, inv["message"])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:300]
+    result["replay_s"] = round(time.perf_counter() - start, 3)
+    result.update(served=script.served, unused=script.unused, missing=script.missing, error=error)
+    result["match"] = error is None and _normalize_answer(answer) == _normalize_answer(inv["answer"])
+    if not result["match"]:
+        result["recorded_answer"] = (inv["answer"] or "")[:500]
+        result["replay_answer"] = (answer or "")[:500]
+    return result
+
+
+async def replay_async(source_db: str, out=None, limit: int | None = None, flows: set[str] | None = None,
+                       after_rowid: int = 0, latency_s: float = 0.0) -> dict:
+    """Replay invocations from `source_db` one after another; returns summary statistics."""
+    import pantry_logic
+    from google.adk.tools import AgentTool
+
+    root = pantry_logic.pantry_app.root_agent
+    agent_tools = {t.name for t in root.tools if isinstance(t, AgentTool)}
+
+    recorded: dict[str, list[float]] = defaultdict(list)
+    replayed: dict[str, list[float]] = defaultdict(list)
+    stats = {"replayed": 0, "matched": 0, "diverged": 0, "errors": 0, "skipped": 0,
+             "incomplete": 0, "turns_missing": 0, "turns_unused": 0}
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(source_db)}?mode=ro", uri=True)
+    start = time.perf_counter()
+    try:
+        for inv in iter_invocations(conn, agent_tools, after_rowid):
+            if not inv["message"] or (flows and classify_flow(inv["message"]) not in flows):
+                stats["skipped"] += 1
+                continue
+            if inv["answer"] is None:
+                # the original run failed before answering: nothing to compare against
+                stats["incomplete"] += 1
+                continue
+            if limit is not None and stats["replayed"] >= limit:
+                break
+            result = await replay_invocation(pantry_logic, inv, latency_s)
+            stats["replayed"] += 1
+            stats["errors"] += result["error"] is not None
+            stats["matched" if result["match"] else "diverged"] += 1
+            stats["turns_missing"] += result["missing"]
+            stats["turns_unused"] += result["unused"]
+            recorded[result["flow"]].append(result["recorded_s"])
+            replayed[result["flow"]].append(result["replay_s"])
+            if out is not None:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        conn.close()
+
+    stats["elapsed_s"] = round(time.perf_counter() - start, 2)
+    stats["by_flow"] = {
+        flow: {
+            "count": len(recorded[flow]),
+            "recorded_p50_s": round(_pct(recorded[flow], 0.5), 3),
+            "recorded_p95_s": round(_pct(recorded[flow], 0.95), 3),
+            "replay_p50_s": round(_pct(replayed[flow], 0.5), 3),
+            "replay_p95_s": round(_pct(replayed[flow], 0.95), 3),
+        }
+        for flow in sorted(recorded)
+    }
+    return stats
+
+
+# ---------- CLI ----------
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded pantry sessions against their recorded model turns.")
+    parser.add_argument("source", help="pantry.db to read recorded events from (opened read-only)")
+    parser.add_argument("--limit", type=int, help="replay at most this many invocations")
+    parser.add_argument("--flow", action="append",
+                        choices=["inventory_update", "inventory_check", "substitution", "policy"],
+                        help="only replay these flows (repeatable)")
+    parser.add_argument("--after-rowid", type=int, default=0, help="skip events up to this rowid")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0,
+                        help="fixed delay per replayed model turn")
+    parser.add_argument("--recorded-latency", action="store_true",
+                        help="sleep each model turn's recorded delay instead")
+    parser.add_argument("--scratch-db", help="SQLite file the replay writes to (default: a fresh temp file)")
+    parser.add_argument("--out", help="JSONL file for per-invocation results ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        print(f"no database at {args.source}", file=sys.stderr)
+        return 1
+    tmp = None
+    scratch = args.scratch_db
+    if not scratch:
+        tmp = tempfile.TemporaryDirectory()
+        scratch = os.path.join(tmp.name, "replay.db")
+    if os.path.abspath(scratch) == os.path.abspath(args.source):
+        parser.error("--scratch-db must not be the source database")
+
+    # must be set before pantry_logic builds the quota and session service
+    os.environ["PANTRY_DB_URL"] = f"sqlite+aiosqlite:///{os.path.abspath(scratch)}"
+    os.environ.setdefault("PANTRY_MODEL_RPM", "100000")
+    os.environ.setdefault("PANTRY_MODEL_BURST", "1000")
+    import pantry_logic
+
+    latency_s = -1.0 if args.recorded_latency else args.model_latency_ms / 1000
+    out = None
+    if args.out == "-":
+        out = sys.stdout
+    elif args.out:
+        out = open(args.out, "w", encoding="utf-8")
+    try:
+        stats = pantry_logic.run_sync(replay_async(
+            args.source, out, args.limit, set(args.flow or []), args.after_rowid, latency_s
+        ))
+    finally:
+        if out not in (None, sys.stdout):
+            out.close()
+        pantry_logic.run_sync(pantry_logic.session_service.close())
+        if tmp:
+            tmp.cleanup()
+
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+    return 0 if stats["diverged"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# ----------------- END FILE -----------------
@@ -0,0 +1,92 @@
+# pantry_sites.py
+# ---------------- BEGIN FILE -----------------
+"""
+Pantry sites: one process, one runner and one database serving many pantries.
+
+The site a request belongs to travels in a context variable (like the model
+priority in pantry_model). Front ends set it: the HTTP API from the
+X-Pantry-Site header, Streamlit from the ?site= query parameter, the CLIs
+from --site. Storage functions never read it themselves: pantry_logic
+resolves current_site() when a call starts and passes site_id down, because
+write-queue jobs run in the queue worker's context, not the caller's.
+
+Per-site settings (display name, partner shelters) are read from the JSON
+file named by PANTRY_SITES_FILE:
+
+    {"bronx": {"name": "Bronx Community Pantry", "partners": [...]}}
+
+Without that file any well-formed site id is accepted and every site uses
+the built-in partner list.
+"""
+import os
+import re
+import json
+import contextvars
+from contextlib import contextmanager
+
+# Site of all data written before multi-site support (and of single-site installs)
+DEFAULT_SITE = os.getenv("PANTRY_DEFAULT_SITE", "main")
+
+_SITE_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class UnknownSiteError(ValueError):
+    """A site id that is malformed or not in the sites file."""
+
+
+def load_sites(path: str | None) -> dict[str, dict]:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {str(k).strip().lower(): v for k, v in json.load(f).items()}
+
+
+SITES = load_sites(os.getenv("PANTRY_SITES_FILE"))
+
+
+def normalize_site_id(site_id: str | None) -> str:
+    if site_id is None or not str(site_id).strip():
+        return DEFAULT_SITE
+    site = str(site_id).strip().lower()
+    if not _SITE_ID_RE.match(site):
+        raise UnknownSiteError(f"'{site_id}' is not a valid site id")
+    if SITES and site != DEFAULT_SITE and site not in SITES:
+        raise UnknownSiteError(f"unknown site '{site_id}'")
+    return site
+
+
+def site_settings(site_id: str) -> dict:
+    return SITES.get(site_id, {})
+
+
+def site_name(site_id: str) -> str:
+    return site_settings(site_id).get("name", site_id)
+
+
+# ---------- CURRENT SITE ----------
+
+_current_site: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "pantry_site", default=DEFAULT_SITE
+)
+
+
+def current_site() -> str:
+    return _current_site.get()
+
+
+@contextmanager
+def site_scope(site_id: str | None):
+    """Run everything inside this block against `site_id`."""
+    token = _current_site.set(normalize_site_id(site_id))
+    try:
+        yield
+    finally:
+        _current_site.reset(token)
+
+
+def set_site(site_id: str | None) -> str:
+    """Select the site for the rest of the current context (e.g. one Streamlit run)."""
+    site = normalize_site_id(site_id)
+    _current_site.set(site)
+    return site
+# ----------------- END FILE -----------------
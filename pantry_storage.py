@@ -0,0 +1,260 @@
+# pantry_storage.py
+# ---------------- BEGIN FILE -----------------
+"""
+Storage engine configuration for the pantry's SQLite database.
+
+- Tuned connections: WAL journal, busy timeout, synchronous / cache pragmas.
+- A bounded connection pool shared by the ADK session service and our own tables.
+- A single async writer queue that batches small writes into one commit,
+  so concurrent desks never fight over SQLite's one write lock.
+"""
+import os
+import asyncio
+from collections import deque
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from google.adk.sessions import DatabaseSessionService
+
+# ---------- TUNING KNOBS (env-overridable) ----------
+
+BUSY_TIMEOUT_MS = int(os.getenv("PANTRY_DB_BUSY_TIMEOUT_MS", "5000"))
+# NORMAL is durable under WAL except for power loss on the last commit
+SYNCHRONOUS = os.getenv("PANTRY_DB_SYNCHRONOUS", "NORMAL")
+CACHE_SIZE_KB = int(os.getenv("PANTRY_DB_CACHE_KB", "16384"))
+POOL_SIZE = int(os.getenv("PANTRY_DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("PANTRY_DB_POOL_OVERFLOW", "5"))
+POOL_TIMEOUT_S = float(os.getenv("PANTRY_DB_POOL_TIMEOUT_S", "30"))
+WRITE_BATCH_SIZE = int(os.getenv("PANTRY_DB_WRITE_BATCH", "64"))
+
+
+def is_sqlite(db_url: str) -> bool:
+    return make_url(db_url).get_backend_name() == "sqlite"
+
+
+def ensure_sqlite_file(db_url: str) -> None:
+    """Create the SQLite file & parent dir if missing (best-effort)."""
+    if not is_sqlite(db_url):
+        return
+    try:
+        path = make_url(db_url).database
+        if not path or path == ":memory:":
+            return
+        path = os.path.abspath(path)
+        parent = os.path.dirname(path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent, exist_ok=True)
+        # Create file if missing
+        if not os.path.exists(path):
+            open(path, "a").close()
+            try:
+                os.chmod(path, 0o666)  # readable/writable by all users (best-effort)
+            except Exception:
+                # some hosts don't allow chmod; ignore
+                pass
+    except Exception:
+        # fall back silently; host may restrict filesystem ops
+        pass
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection pragmas; runs once when the pool opens a connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    # negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def engine_kwargs(db_url: str) -> dict:
+    """create_async_engine() kwargs for a bounded pool."""
+    if not is_sqlite(db_url):
+        return {"pool_size": POOL_SIZE, "max_overflow": POOL_MAX_OVERFLOW}
+    if make_url(db_url).database in (None, "", ":memory:"):
+        # in-memory databases live on one static connection
+        return {}
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT_S,
+        # sqlite3's own lock wait, in seconds, on top of busy_timeout
+        "connect_args": {"timeout": BUSY_TIMEOUT_MS / 1000},
+    }
+
+
+# ---------- SCHEMA HELPERS ----------
+
+async def add_missing_columns(conn, table: str, columns: dict[str, str]) -> None:
+    """Additive migration: ADD COLUMN for each {name: type} the table lacks."""
+    existing = await conn.run_sync(
+        lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(table)}
+    )
+    for name, ddl in columns.items():
+        if name not in existing:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+# ---------- SINGLE WRITER QUEUE ----------
+
+class WriteQueue:
+    """
+    Funnels writes through ONE async worker.
+
+    - submit(fn): fn(conn) runs inside a shared transaction; everything queued
+      while the worker is busy is committed together (up to max_batch jobs).
+      If a batch fails, its jobs are retried one by one so a single bad write
+      only fails its own caller.
+    - run_exclusive(factory): for writers that manage their own transaction
+      (the ADK session service); runs alone, in queue order. factory must
+      not submit to the same queue, or it will wait on itself.
+    """
+
+    def __init__(self, engine, max_batch: int = WRITE_BATCH_SIZE):
+        self.engine = engine
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._held: deque = deque()
+        self.stats = {"jobs": 0, "batches": 0, "exclusive": 0, "max_batch_seen": 0}
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._held.clear()
+            self._worker = loop.create_task(self._run())
+        return self._queue
+
+    async def submit(self, fn):
+        """Queue fn(conn) for the next batched commit and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._ensure_worker().put_nowait(("batch", fn, future))
+        return await future
+
+    async def run_exclusive(self, factory):
+        """Run factory() with the write lock held, in queue order."""
+        future = asyncio.get_running_loop().create_future()
+        self._ensure_worker().put_nowait(("exclusive", factory, future))
+        return await future
+
+    async def close(self):
+        """Stop the worker (pending jobs are abandoned); a later submit restarts it."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    async def _next(self):
+        if self._held:
+            return self._held.popleft()
+        return await self._queue.get()
+
+    async def _run(self):
+        while True:
+            kind, fn, future = await self._next()
+            if kind == "exclusive":
+                await self._run_exclusive_job(fn, future)
+                continue
+
+            batch = [(fn, future)]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._held.popleft() if self._held else self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item[0] == "exclusive":
+                    # keep ordering: run it right after this batch
+                    self._held.appendleft(item)
+                    break
+                batch.append(item[1:])
+            await self._commit(batch)
+
+    async def _run_exclusive_job(self, factory, future):
+        if future.cancelled():
+            return
+        self.stats["exclusive"] += 1
+        try:
+            result = await factory()
+        except Exception as e:
+            _settle(future, error=e)
+        else:
+            _settle(future, result=result)
+
+    async def _commit(self, batch):
+        live = [(fn, fut) for fn, fut in batch if not fut.cancelled()]
+        if not live:
+            return
+        self.stats["batches"] += 1
+        self.stats["jobs"] += len(live)
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(live))
+        try:
+            async with self.engine.begin() as conn:
+                results = [await fn(conn) for fn, _ in live]
+        except Exception as e:
+            if len(live) == 1:
+                _settle(live[0][1], error=e)
+            else:
+                # isolate the failing job(s): retry each in its own transaction
+                for job in live:
+                    await self._commit([job])
+            return
+        for (_, fut), result in zip(live, results):
+            _settle(fut, result=result)
+
+
+def _settle(future: asyncio.Future, result=None, error: Exception | None = None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+# ---------- SESSION SERVICE ----------
+
+class PantrySessionService(DatabaseSessionService):
+    """
+    DatabaseSessionService on a tuned engine whose writes go through a WriteQueue.
+
+    ADK commits each event itself, so its writes run as exclusive jobs: they are
+    serialized with our own batched writes instead of contending for the lock.
+    They cannot be batched, so an append waits for every append queued ahead
+    of it: with N desks writing at once the median append takes about N
+    commits (bench_storage, 16 desks: ~80 ms vs ~23 ms when desks race for
+    the lock), but the slowest ones no longer wait out busy-timeout retries
+    (p95 ~90 ms vs ~340 ms). A batch window would not help, and would only
+    delay a lone desk.
+    """
+
+    def __init__(self, db_url: str):
+        super().__init__(db_url=db_url, **engine_kwargs(db_url))
+        if is_sqlite(db_url):
+            event.listen(self.db_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        self.write_queue = WriteQueue(self.db_engine)
+
+    async def create_session(self, **kwargs):
+        return await self.write_queue.run_exclusive(
+            lambda: super(PantrySessionService, self).create_session(**kwargs)
+        )
+
+    async def append_event(self, session, event):
+        return await self.write_queue.run_exclusive(
+            lambda: super(PantrySessionService, self).append_event(session, event)
+        )
+
+    async def delete_session(self, **kwargs):
+        return await self.write_queue.run_exclusive(
+            lambda: super(PantrySessionService, self).delete_session(**kwargs)
+        )
+
+    async def close(self):
+        await self.write_queue.close()
+        await super().close()
+# ----------------- END FILE -----------------
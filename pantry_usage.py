@@ -0,0 +1,329 @@
+# pantry_usage.py
+# ---------------- BEGIN FILE -----------------
+"""
+Token, cost and latency report over the ADK `events` table in pantry.db.
+
+Every model event stores its usage_metadata; this tool adds them up per
+agent, per flow (inventory update / check, substitution, policy question),
+per site and per day, so we can see which paths burn the Gemini quota.
+
+- Streams the table in rowid order, `--chunk-size` rows per query, so memory
+  stays flat however large the database is.
+- With `--checkpoint` the totals and position are saved after every chunk;
+  the next run picks up where the last one stopped and only reads new events.
+- Flow latency is first-to-last event of an invocation. Agent latency runs
+  from a model event to the next event of the same invocation: ADK stamps
+  the model event when the call starts, and the next event (the tool result,
+  or the closing event after a final answer) follows the reply. A call that
+  asked for a tool therefore includes that tool's run time.
+
+Only events stored in pantry.db are counted: sub-agents called as tools
+(e.g. the Policy Adjudicator) run in their own in-memory session.
+
+Both events layouts are read: the current one (one `event_data` JSON column)
+and the older one with separate `author` / `content` / `usage_metadata`
+columns, which databases created by earlier ADK versions still use.
+
+    python pantry_usage.py --db /tmp/pantry.db
+    python pantry_usage.py --checkpoint usage.json --json
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+
+from sqlalchemy.engine import make_url
+
+from pantry_sites import DEFAULT_SITE
+
+DEFAULT_CHUNK = 2000
+# older ADK events tables: one column per event field instead of event_data
+LEGACY_EVENT_COLUMNS = ("author", "content", "usage_metadata", "partial", "error_code")
+_JSON_COLUMNS = {"content", "usage_metadata"}
+# Gemini 2.5 Flash-Lite list prices, USD per 1M tokens (thinking counts as output)
+PRICE_INPUT_PER_M = float(os.getenv("PANTRY_PRICE_INPUT_PER_M", "0.10"))
+PRICE_OUTPUT_PER_M = float(os.getenv("PANTRY_PRICE_OUTPUT_PER_M", "0.40"))
+# an invocation with no new event for this long is finished
+INVOCATION_IDLE_S = 600
+
+# first user message of an invocation -> flow (see pantry_logic)
+FLOW_PATTERNS = [
+    (re.compile(r"^Update status: "), "inventory_update"),
+    (re.compile(r"^Can I give "), "inventory_check"),
+    (re.compile(r"^Family size: "), "substitution"),
+]
+
+
+def default_db_path() -> str:
+    url = os.getenv("PANTRY_DB_URL")
+    return make_url(url).database if url else "/tmp/pantry.db"
+
+
+def classify_flow(text: str) -> str:
+    for pattern, flow in FLOW_PATTERNS:
+        if pattern.match(text):
+            return flow
+    return "policy"
+
+
+def site_of(user_id: str) -> str:
+    # pantry_logic uses "site:<id>" for every site but the default one
+    return user_id.split(":", 1)[1] if user_id.startswith("site:") else DEFAULT_SITE
+
+
+def parse_timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def message_text(event: dict) -> str:
+    parts = (event.get("content") or {}).get("parts") or []
+    return "".join(p.get("text") or "" for p in parts).strip()
+
+
+def _new_bucket() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0,
+            "latency_s": 0.0, "max_latency_s": 0.0, "timed": 0}
+
+
+def _add_latency(bucket: dict, seconds: float):
+    bucket["latency_s"] += seconds
+    bucket["max_latency_s"] = max(bucket["max_latency_s"], seconds)
+    bucket["timed"] += 1
+
+
+class UsageTotals:
+    """Running totals; everything in here is JSON-serialisable for checkpoints."""
+
+    def __init__(self, state: dict | None = None):
+        state = state or {}
+        self.after_rowid = state.get("after_rowid", 0)
+        self.events = state.get("events", 0)
+        self.by = state.get("by", {"agent": {}, "flow": {}, "site": {}, "day": {}})
+        self.flow_runs = state.get("flow_runs", {})
+        # invocation_id -> {"flow", "site", "day", "first", "last", "pending"}
+        # where "pending" is [agent, started] of a model call not yet timed
+        self.open = state.get("open", {})
+
+    def to_dict(self) -> dict:
+        return {"after_rowid": self.after_rowid, "events": self.events, "by": self.by,
+                "flow_runs": self.flow_runs, "open": self.open}
+
+    def _bucket(self, dim: str, key: str) -> dict:
+        return self.by[dim].setdefault(key, _new_bucket())
+
+    def add(self, rowid: int, user_id: str, invocation_id: str, timestamp, event_data: str):
+        self.after_rowid = rowid
+        self.events += 1
+        ts = parse_timestamp(timestamp)
+        try:
+            event = json.loads(event_data or "{}")
+        except ValueError:
+            return
+
+        run = self.open.get(invocation_id)
+        if run is None:
+            self._close_idle(ts)
+            run = self.open[invocation_id] = {
+                "flow": classify_flow(message_text(event)) if event.get("author") == "user" else "unknown",
+                "site": site_of(user_id),
+                "day": datetime.fromtimestamp(ts).date().isoformat(),
+                "first": ts,
+                "last": ts,
+            }
+        run["last"] = max(run["last"], ts)
+        pending = run.pop("pending", None)
+        if pending:
+            agent, started = pending
+            _add_latency(self._bucket("agent", agent), max(0.0, ts - started))
+
+        usage = event.get("usage_metadata")
+        if not usage:
+            return
+        prompt = usage.get("prompt_token_count") or 0
+        output = (usage.get("candidates_token_count") or 0) + (usage.get("thoughts_token_count") or 0)
+        total = usage.get("total_token_count") or prompt + output
+        agent = event.get("author") or "unknown"
+        for dim, key in (("agent", agent), ("flow", run["flow"]), ("site", run["site"]), ("day", run["day"])):
+            bucket = self._bucket(dim, key)
+            bucket["calls"] += 1
+            bucket["prompt_tokens"] += prompt
+            bucket["output_tokens"] += output
+            bucket["total_tokens"] += total
+        run["pending"] = [agent, ts]
+
+    def _finish(self, invocation_id: str):
+        run = self.open.pop(invocation_id)
+        stats = self.flow_runs.setdefault(run["flow"], {"runs": 0, "latency_s": 0.0, "max_latency_s": 0.0})
+        seconds = run["last"] - run["first"]
+        stats["runs"] += 1
+        stats["latency_s"] += seconds
+        stats["max_latency_s"] = max(stats["max_latency_s"], seconds)
+
+    def _close_idle(self, now: float):
+        for invocation_id in [i for i, r in self.open.items() if now - r["last"] > INVOCATION_IDLE_S]:
+            self._finish(invocation_id)
+
+    def report(self) -> dict:
+        """Totals with cost and averages; invocations still open count as finished."""
+        final = UsageTotals(json.loads(json.dumps(self.to_dict())))
+        for invocation_id in list(final.open):
+            final._finish(invocation_id)
+
+        def render(bucket: dict) -> dict:
+            out = {k: bucket[k] for k in ("calls", "prompt_tokens", "output_tokens", "total_tokens")}
+            out["cost_usd"] = round(
+                bucket["prompt_tokens"] / 1e6 * PRICE_INPUT_PER_M
+                + bucket["output_tokens"] / 1e6 * PRICE_OUTPUT_PER_M, 6
+            )
+            if bucket["timed"]:
+                out["avg_latency_s"] = round(bucket["latency_s"] / bucket["timed"], 3)
+                out["max_latency_s"] = round(bucket["max_latency_s"], 3)
+            return out
+
+        report = {"events": final.events, "through_rowid": final.after_rowid}
+        for dim, buckets in final.by.items():
+            report[f"by_{dim}"] = {
+                k: render(v) for k, v in sorted(buckets.items(), key=lambda kv: -kv[1]["total_tokens"])
+            }
+        for flow, stats in final.flow_runs.items():
+            entry = report["by_flow"].setdefault(flow, render(_new_bucket()))
+            entry["runs"] = stats["runs"]
+            entry["avg_latency_s"] = round(stats["latency_s"] / stats["runs"], 3)
+            entry["max_latency_s"] = round(stats["max_latency_s"], 3)
+        report["total"] = render(self._sum(final.by["agent"].values()))
+        return report
+
+    @staticmethod
+    def _sum(buckets) -> dict:
+        total = _new_bucket()
+        for b in buckets:
+            for k in ("calls", "prompt_tokens", "output_tokens", "total_tokens"):
+                total[k] += b[k]
+        return total
+
+
+# ---------- STREAMING ----------
+
+def _legacy_event_data(columns: list[str], values) -> str:
+    """Rebuild the event_data JSON from the older per-field columns."""
+    event = {}
+    for column, value in zip(columns, values):
+        if value is None:
+            continue
+        if column in _JSON_COLUMNS:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                continue
+        elif column == "partial":
+            value = bool(value)
+        event[column] = value
+    return json.dumps(event)
+
+
+def iter_event_chunks(conn: sqlite3.Connection, after_rowid: int, chunk_size: int = DEFAULT_CHUNK):
+    """
+    Yield lists of (rowid, user_id, invocation_id, timestamp, event_data), keyset-paged on rowid.
+
+    On the older events layout event_data is assembled from the per-field columns.
+    """
+    available = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+    if not available:
+        raise sqlite3.OperationalError("no events table")
+    legacy = [] if "event_data" in available else [c for c in LEGACY_EVENT_COLUMNS if c in available]
+    fields = ", ".join(legacy) if legacy else "event_data"
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, user_id, invocation_id, timestamp, {fields} FROM events "
+            "WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after_rowid, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+        if legacy:
+            rows = [(*row[:4], _legacy_event_data(legacy, row[4:])) for row in rows]
+        yield rows
+        after_rowid = rows[-1][0]
+
+
+def load_checkpoint(path: str | None, db_path: str) -> UsageTotals:
+    if not path or not os.path.exists(path):
+        return UsageTotals()
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("db") != os.path.abspath(db_path):
+        raise SystemExit(f"checkpoint {path} belongs to {state.get('db')}, not {db_path}")
+    return UsageTotals(state)
+
+
+def save_checkpoint(path: str, db_path: str, totals: UsageTotals):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"db": os.path.abspath(db_path), **totals.to_dict()}, f)
+    os.replace(tmp, path)  # never leave a half-written checkpoint
+
+
+def build_report(db_path: str, checkpoint: str | None = None, chunk_size: int = DEFAULT_CHUNK) -> dict:
+    """Read events after the checkpoint (or all of them) and return the report."""
+    totals = load_checkpoint(checkpoint, db_path)
+    # read-only: safe to run next to the live app (WAL readers never block writers)
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        for rows in iter_event_chunks(conn, totals.after_rowid, chunk_size):
+            for row in rows:
+                totals.add(*row)
+            if checkpoint:
+                save_checkpoint(checkpoint, db_path, totals)
+    finally:
+        conn.close()
+    return totals.report()
+
+
+# ---------- CLI ----------
+
+def _print_table(title: str, rows: dict):
+    print(f"\n{title}")
+    print(f"{'':<22}{'calls':>7}{'prompt':>10}{'output':>9}{'cost $':>10}{'avg s':>8}{'max s':>8}")
+    for key, r in rows.items():
+        timing = (f"{r['avg_latency_s']:>8.2f}{r['max_latency_s']:>8.2f}"
+                  if "avg_latency_s" in r else f"{'-':>8}{'-':>8}")
+        print(
+            f"{key[:21]:<22}{r['calls']:>7}{r['prompt_tokens']:>10}{r['output_tokens']:>9}"
+            f"{r['cost_usd']:>10.4f}{timing}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Token, cost and latency totals from pantry.db events.")
+    parser.add_argument("--db", default=default_db_path(), help="SQLite file (default: from PANTRY_DB_URL)")
+    parser.add_argument("--checkpoint", help="JSON file to resume from and save progress to")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK)
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"no database at {args.db}", file=sys.stderr)
+        return 1
+    report = build_report(args.db, args.checkpoint, args.chunk_size)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    total = report["total"]
+    print(f"{report['events']} events, {total['calls']} model calls, "
+          f"{total['total_tokens']} tokens, ${total['cost_usd']:.4f}")
+    _print_table("by flow (latency = whole invocation)", report["by_flow"])
+    _print_table("by agent (latency = model call to next event)", report["by_agent"])
+    _print_table("by site", report["by_site"])
+    _print_table("by day", report["by_day"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# ----------------- END FILE -----------------
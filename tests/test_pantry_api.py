@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import pantry_model
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # must be set before pantry_logic builds its session service
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("PANTRY_DB_URL", f"sqlite+aiosqlite:///{tmp_path_factory.getbasetemp() / 'pantry.db'}")
+        mp.setenv("GOOGLE_API_KEY", "test-key")
+        mp.setattr(pantry_model, "STUB_LATENCY_MS", "1")
+        import pantry_api
+
+        with TestClient(pantry_api.app) as c:
+            yield c
+
+
+def _count(client, item: str) -> int:
+    return client.get("/inventory", params={"item": item}).json()["stock"][item]["quantity"]
+
+
+def test_allocation_takes_the_basket(client):
+    client.put("/inventory/Rice/count", json={"quantity": 5})
+
+    r = client.post("/inventory/allocate", json={"items": {"Rice": 2}, "household_id": "API-1"})
+
+    assert r.status_code == 200
+    assert _count(client, "Rice") == 3
+    assert client.get("/households/API-1").json()["allocations"]
+
+
+@pytest.mark.parametrize("count", [0, -2, 1.5])
+def test_allocation_rejects_counts_below_one(client, count):
+    client.put("/inventory/Pasta/count", json={"quantity": 4})
+
+    r = client.post("/inventory/allocate", json={"items": {"Pasta": count}})
+
+    assert r.status_code == 422
+    assert _count(client, "Pasta") == 4
+
+
+def test_short_allocation_is_a_conflict_and_takes_nothing(client):
+    client.put("/inventory/Oats/count", json={"quantity": 1})
+    client.put("/inventory/Beans/count", json={"quantity": 6})
+
+    r = client.post("/inventory/allocate", json={"items": {"Beans": 2, "Oats": 3}})
+
+    assert r.status_code == 409
+    assert r.json()["item"] == "Oats"
+    assert (_count(client, "Beans"), _count(client, "Oats")) == (6, 1)
+
+
+def test_ledger_refuses_a_second_trade_on_one_visit(client):
+    body = {"family_size": 3, "from_item": "Rice", "to_item": "Pasta", "household_id": "API-2"}
+
+    first = client.post("/policy/substitution", json=body)
+    second = client.post("/policy/substitution", json={**body, "to_item": "Oats"})
+
+    assert first.json()["reply"].startswith("APPROVED")
+    assert second.status_code == 200
+    assert second.json()["reply"].startswith("DECLINED")
+    assert "already used its category trade" in second.json()["reply"]
+    assert client.get("/households/API-2").json()["trades_granted"] == 1
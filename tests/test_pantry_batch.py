@@ -0,0 +1,48 @@
+import asyncio
+import io
+import json
+import sys
+import types
+
+import pytest
+
+from pantry_batch import BatchRowError, evaluate_requests_async, validate_request
+
+
+@pytest.mark.parametrize("size, expected", [(3, 3), ("3", 3), (" 4 ", 4), (2.0, 2)])
+def test_whole_family_sizes_are_accepted(size, expected):
+    assert validate_request(2, {"family_size": size, "notes": "halal"})["family_size"] == expected
+
+
+@pytest.mark.parametrize("size", [2.5, "2.5", "three", None, True])
+def test_fractional_or_missing_family_sizes_are_rejected(size):
+    with pytest.raises(BatchRowError, match="line 2: family_size .* is not a whole number"):
+        validate_request(2, {"family_size": size, "notes": "halal"})
+
+
+def test_trades_are_recorded_only_with_an_explicit_visit_date(monkeypatch):
+    calls = {}
+
+    async def ask_substitution_async(family_size, from_item, to_item, notes, **kwargs):
+        calls[kwargs["session_id"].rsplit("-", 1)[-1]] = kwargs
+        return "APPROVED – fine"
+
+    async def discard_session_async(session_id):
+        pass
+
+    fake = types.SimpleNamespace(
+        ask_substitution_async=ask_substitution_async, discard_session_async=discard_session_async
+    )
+    monkeypatch.setitem(sys.modules, "pantry_logic", fake)
+    rows = [
+        {"family_size": 3, "from_item": "Rice", "to_item": "Pasta", "household_id": "A1"},
+        {"family_size": 3, "from_item": "Rice", "to_item": "Pasta", "household_id": "A1",
+         "visit_date": "2024-05-01"},
+    ]
+    stream = io.BytesIO("".join(json.dumps(r) + "\n" for r in rows).encode())
+
+    stats = asyncio.run(evaluate_requests_async(stream, io.StringIO(), "jsonl", concurrency=2))
+
+    assert stats["ok"] == 2
+    assert calls["1"]["visit_date"] is None and calls["1"]["record"] is False
+    assert calls["2"]["visit_date"] == "2024-05-01" and calls["2"]["record"] is True
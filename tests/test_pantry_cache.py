@@ -0,0 +1,109 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from pantry_cache import GenerationCache, GenerationWatcher
+from pantry_inventory import CACHE_SCOPE as INVENTORY_SCOPE
+from pantry_inventory import apply_changes, ensure_inventory_tables, read_stock_levels
+from pantry_ledger import CACHE_SCOPE as LEDGER_SCOPE
+from pantry_ledger import APPROVED, ensure_ledger_tables, record_trade, trades_granted
+
+SITE = "main"
+POLL_S = 0.05
+RICE = {"item_key": "rice", "item": "Rice", "food_group": "Grains", "status": None}
+TRADE = {"from_item": "Rice", "from_group": "Grains", "to_item": "Pasta", "to_group": "Grains"}
+
+
+def _rice_stock(conn):
+    return read_stock_levels(conn, SITE, ["rice"])
+
+
+def _set_rice(quantity: int):
+    return lambda conn: apply_changes(conn, SITE, [{**RICE, "quantity": quantity}])
+
+
+def _trades(conn):
+    return trades_granted(conn, SITE, "H-1", "2024-05-01")
+
+
+class Worker:
+    """One API / Streamlit process: its own engine, watcher and read cache on the shared file."""
+
+    def __init__(self, path):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.watcher = GenerationWatcher(self.engine, poll_s=POLL_S)
+        self.cache = GenerationCache()
+
+    async def cached(self, scope: str, key: tuple, read):
+        # generation first, then the data (see pantry_cache)
+        generation = await self.watcher.generation(scope, SITE)
+        value = self.cache.get(key, generation)
+        if value is None:
+            async with self.engine.connect() as conn:
+                value = await read(conn)
+            self.cache.put(key, generation, value)
+        return value
+
+    async def write(self, job):
+        async with self.engine.begin() as conn:
+            result = await job(conn)
+        self.watcher.note_write()
+        return result
+
+
+def _two_workers(tmp_path, scenario):
+    async def run():
+        a, b = Worker(tmp_path / "pantry.db"), Worker(tmp_path / "pantry.db")
+        await ensure_inventory_tables(a.engine)
+        await ensure_ledger_tables(a.engine)
+        try:
+            return await scenario(a, b)
+        finally:
+            await a.engine.dispose()
+            await b.engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_inventory_write_in_one_worker_invalidates_the_others_read(tmp_path):
+    async def scenario(a, b):
+        await b.write(_set_rice(20))
+        before = await a.cached(INVENTORY_SCOPE, ("stock", "rice"), _rice_stock)
+        again = await a.cached(INVENTORY_SCOPE, ("stock", "rice"), _rice_stock)
+
+        await b.write(_set_rice(0))
+        await asyncio.sleep(POLL_S * 2)
+        after = await a.cached(INVENTORY_SCOPE, ("stock", "rice"), _rice_stock)
+        return before, again, after, a.cache.stats
+
+    before, again, after, stats = _two_workers(tmp_path, scenario)
+    assert before == again == {"rice": {"status": "In Stock", "quantity": 20}}
+    assert after == {"rice": {"status": "Out of Stock", "quantity": 0}}
+    assert stats == {"hits": 1, "misses": 1, "stale": 1}
+
+
+def test_ledger_write_in_one_worker_invalidates_the_others_read(tmp_path):
+    async def scenario(a, b):
+        before = await a.cached(LEDGER_SCOPE, ("trades", "H-1"), _trades)
+
+        await b.write(lambda conn: record_trade(conn, SITE, "H-1", "2024-05-01", TRADE, APPROVED, 3))
+        await asyncio.sleep(POLL_S * 2)
+        after = await a.cached(LEDGER_SCOPE, ("trades", "H-1"), _trades)
+        return before, after, a.cache.stats
+
+    before, after, stats = _two_workers(tmp_path, scenario)
+    assert (before, after) == (0, 1)
+    assert stats["stale"] == 1
+
+
+def test_a_workers_own_write_is_seen_without_waiting_for_a_poll(tmp_path):
+    async def scenario(a, b):
+        a.watcher.poll_s = 3600
+        await a.write(_set_rice(5))
+        before = await a.cached(INVENTORY_SCOPE, ("stock", "rice"), _rice_stock)
+        await a.write(_set_rice(1))
+        return before, await a.cached(INVENTORY_SCOPE, ("stock", "rice"), _rice_stock)
+
+    before, after = _two_workers(tmp_path, scenario)
+    assert before["rice"]["quantity"] == 5
+    assert after["rice"]["quantity"] == 1
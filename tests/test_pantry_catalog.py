@@ -0,0 +1,60 @@
+import pytest
+
+from pantry_catalog import (
+    AmbiguousItemError,
+    check_unambiguous,
+    group_of,
+    item_key,
+    resolve_item,
+    suggest_items,
+)
+from pantry_manifest import ManifestRowError, validate_row
+
+
+@pytest.mark.parametrize("typed, item", [
+    ("canned chicken ", "Canned Chicken"),
+    ("Chicken (canned)", "Canned Chicken"),
+    ("Brocoli", "Broccoli"),
+    ("Banannas", "Bananas"),
+    ("Yoghurt", "Yogurt"),
+    ("Tomatoes", "Tomatoes"),
+])
+def test_exact_names_and_small_typos_resolve(typed, item):
+    assert resolve_item(typed) == item
+
+
+@pytest.mark.parametrize("typed", [
+    "soy milk", "rice milk", "peanut butter", "pasta sauce",
+    "sweet potatoes", "lentil soup", "black beans", "silk", "Chiken",
+])
+def test_other_foods_are_only_suggested(typed):
+    assert resolve_item(typed) is None
+    assert group_of(typed) is None
+    assert item_key(typed) not in {item.lower() for item in suggest_items(typed)}
+
+
+def test_manifest_rejects_a_near_miss_instead_of_overwriting():
+    with pytest.raises(ManifestRowError, match="did you mean: Milk"):
+        validate_row(2, {"item": "soy milk", "status": "", "quantity": "3"})
+
+
+@pytest.mark.parametrize("typed, meant", [
+    ("peas", {"Green Peas", "Pears"}),
+    ("pear", {"Green Peas", "Pears"}),
+    ("tomato", {"Tomatoes", "Canned Tomatoes"}),
+    ("Tomatos", {"Tomatoes", "Canned Tomatoes"}),
+    ("bean", {"Beans", "Green Beans"}),
+])
+def test_typo_of_several_items_is_not_written(typed, meant):
+    assert resolve_item(typed) is None
+    assert group_of(typed) is None
+    assert meant <= set(suggest_items(typed))
+    with pytest.raises(AmbiguousItemError) as err:
+        check_unambiguous(typed)
+    assert meant <= set(err.value.candidates)
+
+
+@pytest.mark.parametrize("typed", ["better", "batter"])
+def test_changed_letter_is_not_a_typo(typed):
+    assert resolve_item(typed) is None
+    assert item_key(typed) != "butter"
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from pantry_inventory import (
+    InsufficientStockError,
+    adjust_quantities,
+    apply_changes,
+    ensure_inventory_tables,
+    read_items,
+    read_page,
+    read_stock_levels,
+)
+
+SITE = "main"
+
+
+def _change(item: str, **extra) -> dict:
+    return {"item_key": item.lower(), "item": item, "food_group": None, "status": None, **extra}
+
+
+async def _engine(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    await ensure_inventory_tables(engine)
+    return engine
+
+
+async def _stock(engine, *items):
+    async with engine.connect() as conn:
+        return await read_stock_levels(conn, SITE, [i.lower() for i in items])
+
+
+async def _log_rows(engine) -> int:
+    async with engine.connect() as conn:
+        return (await conn.execute(text("SELECT COUNT(*) FROM inventory_log"))).scalar()
+
+
+def test_manual_status_clears_the_count(tmp_path):
+    async def run():
+        engine = await _engine(tmp_path / "p.db")
+        async with engine.begin() as conn:
+            await apply_changes(conn, SITE, [_change("Rice", quantity=20)])
+        async with engine.begin() as conn:
+            await apply_changes(conn, SITE, [_change("Rice", status="Out of Stock")])
+        stock = await _stock(engine, "Rice")
+        await engine.dispose()
+        return stock
+
+    assert asyncio.run(run())["rice"] == {"status": "Out of Stock", "quantity": None}
+
+
+def test_guarded_decrement_never_goes_below_zero(tmp_path):
+    async def allocate(engine, n):
+        async with engine.begin() as conn:
+            return await adjust_quantities(conn, SITE, [_change("Rice", delta=-n)])
+
+    async def run():
+        engine = await _engine(tmp_path / "p.db")
+        async with engine.begin() as conn:
+            await apply_changes(conn, SITE, [_change("Rice", quantity=5)])
+        # two desks race for 3 of the 5 units: exactly one gets them
+        results = await asyncio.gather(
+            allocate(engine, 3), allocate(engine, 3), return_exceptions=True
+        )
+        with pytest.raises(InsufficientStockError) as short:
+            await allocate(engine, 3)
+        stock = await _stock(engine, "Rice")
+        await engine.dispose()
+        return results, short.value, stock
+
+    results, short, stock = asyncio.run(run())
+    assert sorted(type(r).__name__ for r in results) == ["InsufficientStockError", "list"]
+    assert (short.available, short.requested) == (2, 3)
+    assert stock["rice"] == {"status": "Low", "quantity": 2}
+
+
+def test_one_short_item_rolls_back_the_whole_allocation(tmp_path):
+    async def run():
+        engine = await _engine(tmp_path / "p.db")
+        async with engine.begin() as conn:
+            await apply_changes(conn, SITE, [_change("Rice", quantity=10), _change("Beans", quantity=1)])
+        logged = await _log_rows(engine)
+        with pytest.raises(InsufficientStockError):
+            async with engine.begin() as conn:
+                await adjust_quantities(
+                    conn, SITE, [_change("Rice", delta=-4), _change("Beans", delta=-3)]
+                )
+        stock = await _stock(engine, "Rice", "Beans")
+        after = await _log_rows(engine)
+        await engine.dispose()
+        return stock, logged, after
+
+    stock, logged, after = asyncio.run(run())
+    assert stock["rice"]["quantity"] == 10
+    assert stock["beans"]["quantity"] == 1
+    assert after == logged
+
+
+def test_pages_cover_every_row_once_in_key_order(tmp_path):
+    async def run():
+        engine = await _engine(tmp_path / "p.db")
+        names = ["Kale Chips", "Alpha Crackers", "Mango Juice", "Zucchini Bread", "Oat Bars"]
+        async with engine.begin() as conn:
+            await apply_changes(conn, SITE, [_change(n, status="In Stock") for n in names])
+            await apply_changes(conn, "other", [_change("Beets", status="Low Stock")])
+        pages, after = [], ""
+        async with engine.connect() as conn:
+            while page := await read_page(conn, SITE, after, limit=2):
+                pages.append([r["item"] for r in page])
+                after = page[-1]["item_key"]
+            picked = await read_items(conn, SITE, ["oat bars", "beets", "never written"])
+        await engine.dispose()
+        return pages, picked
+
+    pages, picked = asyncio.run(run())
+
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert sum(pages, []) == sorted(["Kale Chips", "Alpha Crackers", "Mango Juice", "Zucchini Bread", "Oat Bars"])
+    assert list(picked) == ["oat bars"]
+    assert picked["oat bars"]["status"] == "In Stock"
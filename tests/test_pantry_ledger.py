@@ -0,0 +1,17 @@
+import pytest
+
+from pantry_ledger import APPROVED, DECLINED, UNKNOWN, classify_decision
+
+
+@pytest.mark.parametrize("answer, decision", [
+    ("APPROVED – you cannot exceed one trade per visit.", APPROVED),
+    ("**DECLINED** – Milk is out of stock.", DECLINED),
+    ("✅ Approved: Dairy to Protein at 2:1.", APPROVED),
+    ("Decision: DECLINED - destination over the cap.", DECLINED),
+    ("Yes, but we must deny extra protein today.", UNKNOWN),
+    ("I'd avoid that today because we're Out of Stock of Green Beans.", UNKNOWN),
+    ("NOT APPROVED", UNKNOWN),
+    ("", UNKNOWN),
+])
+def test_decision_comes_from_the_leading_word(answer, decision):
+    assert classify_decision(answer) == decision
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import pantry_model
+
+
+@pytest.fixture(scope="module")
+def logic(tmp_path_factory):
+    # must be set before pantry_logic builds its session service
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("PANTRY_DB_URL", f"sqlite+aiosqlite:///{tmp_path_factory.getbasetemp() / 'pantry.db'}")
+        mp.setenv("GOOGLE_API_KEY", "test-key")
+        mp.setattr(pantry_model, "STUB_LATENCY_MS", "5")
+        # its own quota, so these runs neither wait for tokens nor drain them for later tests
+        mp.setattr(pantry_model, "model_limiter", pantry_model.PriorityTokenBucket(1000, 1000))
+        import pantry_logic
+
+        yield pantry_logic
+
+
+@pytest.fixture
+def runs(logic, monkeypatch) -> list[tuple[str, str]]:
+    """(session, message) of every model run started."""
+    started = []
+    run_once = logic._run_once
+
+    async def spy(message, session_id=None, priority=pantry_model.PRIORITY_INVENTORY):
+        started.append((session_id or logic.current_session(), message))
+        return await run_once(message, session_id=session_id, priority=priority)
+
+    monkeypatch.setattr(logic, "_run_once", spy)
+    return started
+
+
+def _ask_concurrently(logic, calls: list[tuple[str | None, str]]) -> list[str]:
+    async def ask(desk, item):
+        with logic.desk_scope(desk):
+            return await logic.check_item_status_async(item)
+
+    async def run():
+        return await asyncio.gather(*[ask(desk, item) for desk, item in calls])
+
+    return logic.run_sync(run())
+
+
+def test_concurrent_identical_calls_share_one_model_run(logic, runs):
+    replies = _ask_concurrently(logic, [("d1", "Milk"), ("d1", " milk "), ("d1", "MILK")])
+
+    assert len(runs) == 1
+    assert len(set(replies)) == 1
+
+
+def test_different_args_do_not_merge(logic, runs):
+    _ask_concurrently(logic, [("d1", "Milk"), ("d1", "Rice")])
+
+    assert sorted(message for _, message in runs) == ["Can I give Milk?", "Can I give Rice?"]
+
+
+def test_different_desks_do_not_merge(logic, runs):
+    _ask_concurrently(logic, [("d1", "Milk"), ("d2", "Milk"), (None, "Milk")])
+
+    sessions = {session for session, _ in runs}
+    assert sessions == {
+        logic.desk_session_id("d1"), logic.desk_session_id("d2"), logic.desk_session_id(None)
+    }
@@ -0,0 +1,52 @@
+import asyncio
+import io
+
+import pytest
+
+from pantry_manifest import (
+    ManifestRowError,
+    aiter_export_lines,
+    iter_export_lines,
+    iter_valid_rows,
+    validate_row,
+)
+
+
+@pytest.mark.parametrize("quantity, expected", [("3", 3), (" 12 ", 12), (4, 4), (5.0, 5), ("0", 0)])
+def test_whole_quantities_are_accepted(quantity, expected):
+    assert validate_row(2, {"item": "Rice", "quantity": quantity})["quantity"] == expected
+
+
+@pytest.mark.parametrize("quantity", ["2.5", 2.5, "3.0", "1e3", "three", True])
+def test_fractional_or_odd_quantities_are_rejected(quantity):
+    with pytest.raises(ManifestRowError, match="not a whole number"):
+        validate_row(2, {"item": "Rice", "quantity": quantity})
+
+
+def test_decode_error_is_reported_and_stream_stays_open():
+    data = io.BytesIO(b"item,quantity\nRice,3\nMilk,\xff\xfe4\n")
+
+    rows = list(iter_valid_rows(data, "csv"))
+
+    assert isinstance(rows[-1], ManifestRowError)
+    assert "not UTF-8" in str(rows[-1])
+    assert not data.closed
+    data.seek(0)
+    assert data.readline() == b"item,quantity\n"
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_async_export_matches_the_sync_one(fmt):
+    rows = [
+        {"item": "Rice", "food_group": "Grains", "status": "In Stock", "quantity": 3, "version": 2},
+        {"item": "Kale, chopped", "food_group": None, "status": "Low Stock", "quantity": None, "version": 1},
+    ]
+
+    async def agen():
+        for row in rows:
+            yield row
+
+    async def collect():
+        return [line async for line in aiter_export_lines(agen(), fmt)]
+
+    assert asyncio.run(collect()) == list(iter_export_lines(rows, fmt))
@@ -0,0 +1,69 @@
+import asyncio
+
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_response import LlmResponse
+from google.genai import errors, types
+
+import pantry_model
+from pantry_model import PRIORITY_DONATION, CircuitBreaker, PantryGemini
+
+FAST_RETRY = types.HttpRetryOptions(attempts=3, initial_delay=0.01, max_delay=0.01, jitter=0.01)
+
+
+def _flaky_upstream(monkeypatch, failures: int) -> list[int]:
+    calls = []
+
+    async def generate(self, llm_request, stream=False):
+        calls.append(1)
+        if len(calls) <= failures:
+            raise errors.APIError(503, {"error": {"message": "busy", "status": "UNAVAILABLE"}})
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text="ok")]))
+
+    monkeypatch.setattr(Gemini, "generate_content_async", generate)
+    return calls
+
+
+def _spy_limiter(monkeypatch) -> list[int]:
+    granted = []
+    acquire = pantry_model.model_limiter.acquire
+
+    async def spy(priority):
+        granted.append(priority)
+        return await acquire(priority)
+
+    monkeypatch.setattr(pantry_model.model_limiter, "acquire", spy)
+    return granted
+
+
+async def _collect(model):
+    return [r async for r in model.generate_content_async(None)]
+
+
+def test_retries_take_a_token_each_at_the_models_priority(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(pantry_model, "model_breaker", CircuitBreaker(3, 30))
+    calls = _flaky_upstream(monkeypatch, failures=2)
+    granted = _spy_limiter(monkeypatch)
+    model = PantryGemini(model="m", upstream_retry=FAST_RETRY, priority=PRIORITY_DONATION)
+
+    responses = asyncio.run(_collect(model))
+
+    assert responses[0].content.parts[0].text == "ok"
+    assert len(calls) == 3
+    assert granted == [PRIORITY_DONATION] * 3
+    assert pantry_model.model_breaker.failures == 0
+    assert model.api_client._api_client._http_options.retry_options is None
+
+
+def test_exhausted_retries_count_once_for_the_breaker(monkeypatch):
+    monkeypatch.setattr(pantry_model, "model_breaker", CircuitBreaker(3, 30))
+    _flaky_upstream(monkeypatch, failures=5)
+    model = PantryGemini(model="m", upstream_retry=FAST_RETRY)
+
+    try:
+        asyncio.run(_collect(model))
+    except errors.APIError as e:
+        assert e.code == 503
+    else:
+        raise AssertionError("the last failure should reach the caller")
+    assert pantry_model.model_breaker.failures == 1
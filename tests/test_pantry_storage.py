@@ -0,0 +1,82 @@
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from pantry_storage import WriteQueue
+
+
+async def _queue(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE t (n INTEGER PRIMARY KEY)"))
+    return engine, WriteQueue(engine)
+
+
+async def _rows(engine) -> list[int]:
+    async with engine.connect() as conn:
+        return [r.n for r in await conn.execute(text("SELECT n FROM t ORDER BY n"))]
+
+
+def _insert(n: int):
+    async def job(conn):
+        await conn.execute(text("INSERT INTO t (n) VALUES (:n)"), {"n": n})
+        return n
+
+    return job
+
+
+def test_a_failing_job_does_not_roll_back_its_batch(tmp_path):
+    async def run():
+        engine, queue = await _queue(tmp_path / "q.db")
+        gate = asyncio.Event()
+        # hold the worker so the next jobs queue up and commit as one batch
+        held = asyncio.ensure_future(queue.run_exclusive(gate.wait))
+        await asyncio.sleep(0)
+        jobs = [_insert(1), _insert(2), _insert(1), _insert(3)]  # the second 1 is a duplicate key
+        pending = asyncio.gather(*[queue.submit(j) for j in jobs], return_exceptions=True)
+        await asyncio.sleep(0)
+        gate.set()
+        await held
+        results = await pending
+        rows = await _rows(engine)
+        await queue.close()
+        await engine.dispose()
+        return results, rows, queue.stats
+
+    results, rows, stats = asyncio.run(run())
+    assert results[:2] == [1, 2] and results[3] == 3
+    assert "UNIQUE constraint failed" in str(results[2])
+    assert rows == [1, 2, 3]
+    assert stats["max_batch_seen"] == 4
+
+
+def test_exclusive_jobs_run_alone_in_queue_order(tmp_path):
+    async def run():
+        engine, queue = await _queue(tmp_path / "q.db")
+        timeline = []
+
+        def job(n):
+            async def fn(conn):
+                timeline.append(f"batch {n}")
+                await _insert(n)(conn)
+            return fn
+
+        async def exclusive():
+            timeline.append("exclusive start")
+            # a batch job sneaking in now would land between start and end
+            await asyncio.sleep(0.05)
+            timeline.append("exclusive end")
+
+        futures = [queue.submit(job(1)), queue.submit(job(2)), queue.run_exclusive(exclusive),
+                   queue.submit(job(3)), queue.submit(job(4))]
+        await asyncio.gather(*futures)
+        rows = await _rows(engine)
+        await queue.close()
+        await engine.dispose()
+        return timeline, rows, queue.stats
+
+    timeline, rows, stats = asyncio.run(run())
+    assert timeline == ["batch 1", "batch 2", "exclusive start", "exclusive end", "batch 3", "batch 4"]
+    assert rows == [1, 2, 3, 4]
+    assert (stats["batches"], stats["exclusive"], stats["max_batch_seen"]) == (2, 1, 2)
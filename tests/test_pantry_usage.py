@@ -0,0 +1,77 @@
+import json
+import sqlite3
+
+import pytest
+
+from pantry_usage import build_report, iter_event_chunks
+
+# the per-field layout of events tables created by older ADK versions
+LEGACY_EVENTS = """
+    CREATE TABLE events (
+        id VARCHAR(128) NOT NULL, app_name VARCHAR(128) NOT NULL,
+        user_id VARCHAR(128) NOT NULL, session_id VARCHAR(128) NOT NULL,
+        invocation_id VARCHAR(256) NOT NULL, author VARCHAR(256) NOT NULL,
+        actions BLOB NOT NULL, timestamp DATETIME NOT NULL, content TEXT,
+        usage_metadata TEXT, partial BOOLEAN, error_code VARCHAR(256),
+        PRIMARY KEY (id, app_name, user_id, session_id)
+    )
+    """
+
+
+def _content(role: str, text: str) -> str:
+    return json.dumps({"role": role, "parts": [{"text": text}]})
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_EVENTS)
+    rows = [
+        ("1", "debug_user_id", "e-1", "user", "2025-11-27 22:59:40.000000",
+         _content("user", "Can I give Rice?"), None),
+        ("2", "debug_user_id", "e-1", "Pantry_Coordinator", "2025-11-27 22:59:42.500000",
+         _content("model", "Yes, Rice is In Stock."),
+         json.dumps({"prompt_token_count": 400, "candidates_token_count": 20, "total_token_count": 420})),
+        # closing event: ADK stamps the model event at call start, so this ends the call
+        ("5", "debug_user_id", "e-1", "Pantry_Coordinator", "2025-11-27 22:59:44.000000", None, None),
+        ("3", "site:bronx", "e-2", "user", "2025-11-27 23:05:00.000000",
+         _content("user", "Update status: Milk is Low."), None),
+        ("4", "site:bronx", "e-2", "Pantry_Coordinator", "2025-11-27 23:05:01.000000",
+         _content("model", "Milk is now Low."),
+         json.dumps({"prompt_token_count": 300, "candidates_token_count": 10, "total_token_count": 310})),
+    ]
+    conn.executemany(
+        "INSERT INTO events (id, app_name, user_id, session_id, invocation_id, author, actions, "
+        "timestamp, content, usage_metadata) VALUES (?, 'equitable', ?, 's', ?, ?, x'', ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def test_legacy_layout_rebuilds_event_data(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    rows = [row for chunk in iter_event_chunks(conn, 0, chunk_size=3) for row in chunk]
+    conn.close()
+
+    assert [row[0] for row in rows] == [1, 2, 3, 4, 5]
+    event = json.loads(rows[1][4])
+    assert event["author"] == "Pantry_Coordinator"
+    assert event["content"]["parts"][0]["text"] == "Yes, Rice is In Stock."
+    assert event["usage_metadata"]["total_token_count"] == 420
+
+
+def test_report_over_legacy_layout(legacy_db):
+    report = build_report(legacy_db)
+
+    assert report["events"] == 5
+    assert report["total"]["calls"] == 2
+    assert report["total"]["total_tokens"] == 730
+    assert report["by_flow"]["inventory_check"]["prompt_tokens"] == 400
+    assert report["by_flow"]["inventory_update"]["avg_latency_s"] == 1.0
+    # timed from each model event to the next event of its invocation; the
+    # last call of e-2 has no next event and is left untimed
+    assert report["by_agent"]["Pantry_Coordinator"]["avg_latency_s"] == 1.5
+    assert set(report["by_site"]) == {"main", "bronx"}